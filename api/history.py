@@ -1,6 +1,11 @@
 import api.result as result
+import api.tracing as tracing
+from contextlib import contextmanager
 import time
 import datetime
+import random
+import threading
+import Queue
 
 
 class Walker:
@@ -30,32 +35,327 @@ class Walker:
         intermediary results somewhere.
         :return: The results for all versions.
         """
-        all_results = result.Project(self.config.project.name)
+        results = self.iter_walk(versions, testrunner, parser, benchmarks, forward, callback, **kwargs)
+        return result.Project(self.config.project.name, list(results))
+
+    def iter_walk(self, versions, testrunner, parser, benchmarks = None, forward = True, callback = None, **kwargs):
+        """ This walks through the project history like walk, but yields the result of each version as soon as it
+         is available (and after the callback was invoked with it), instead of collecting all of them. Nothing is
+         kept after a result is handed off, so memory stays flat on long walks.
+
+         Versions without results are not yielded (but still reported to the callback).
+
+        :return: A generator of result.Version objects, in version order.
+        """
+        kwargs = self.run_args(kwargs)
         if not forward:
             versions.reverse()
         i = 0
+        eta = EwmaEta()
         for version in versions:
+            if callback:
+                callback.version_started(self.config.project.name, version)
             start = time.time()
-            res = testrunner.run(version, parser, benchmarks, **kwargs)
+            with tracing.phase(tracing.VERSION, version=str(version)):
+                res = testrunner.run(version, parser, benchmarks, **kwargs)
             end = time.time()
-            diff = end - start
-            m_diff = int(diff / 60)
             i += 1
-            remaining_versions = (len(versions) - i)
-            m_projected = m_diff * remaining_versions
-            h_projected = int(m_projected/ 60)
-            m_projected_rem = int(m_projected % 60)
-            now = datetime.datetime.now()
-            projected_end = now + datetime.timedelta(minutes = m_projected)
-            print "### Execution for version %s took %s minutes. ###" % (version, m_diff)
-            if remaining_versions > 0:
-               print "### Still have %s versions to go, that will be %s hours and %s minutes. Projected end is %s. ###"\
-                     % (remaining_versions, h_projected, m_projected_rem, projected_end)
+            eta.update(end - start)
+            _print_progress(version, end - start, len(versions) - i, eta.per_version)
+            for v_res in self._deliver(callback, version, res):
+                yield v_res
+
+    def walk_parallel(self, versions, testrunners, parser, benchmarks = None, forward = True, callback = None, **kwargs):
+        """ This walks through the project history like walk, but executes multiple versions at the same time.
+         Every given test runner is driven by its own worker thread, which takes the next version from a shared
+         queue as soon as it is done with the previous one. The test runners must therefore not share any state
+         on disk (e.g., each of them works in its own worktree and Maven repository), and they must not depend
+         on the current working directory of the process.
+
+         Results are handed to the callback (and returned) in version order, regardless of the order in which
+         the workers finish.
+
+        :param versions: A list of versions to iterate. Might be dates or mvn versions, depending on backend.
+        :param testrunners: A list of test runners, one per worker.
+        :param parser: The parser used to extract results. Must be usable from multiple threads.
+        :param benchmarks: A list of benchmark names as strings to execute. Optional, if no argument is given, all
+        benchmarks are executed.
+        :param forward: Run through the version list from first to last, or the other way 'round.
+        :param callback: A callback implementation that should be invoked after each version.
+        :return: The results for all versions.
+        """
+        results = self.iter_walk_parallel(versions, testrunners, parser, benchmarks, forward, callback, **kwargs)
+        return result.Project(self.config.project.name, list(results))
+
+    def iter_walk_parallel(self, versions, testrunners, parser, benchmarks = None, forward = True, callback = None,
+                           **kwargs):
+        """ This walks through the project history like walk_parallel, but yields the results in version order as
+         they become available, like iter_walk.
+
+        :return: A generator of result.Version objects, in version order.
+        """
+        kwargs = self.run_args(kwargs)
+        if not forward:
+            versions.reverse()
+        todo = Queue.Queue()
+        for i, version in enumerate(versions):
+            todo.put((i, version))
+        done = Queue.Queue()
+
+        def work(testrunner):
+            while True:
+                try:
+                    i, version = todo.get_nowait()
+                except Queue.Empty:
+                    return
+                if callback:
+                    callback.version_started(self.config.project.name, version)
+                start = time.time()
+                try:
+                    with tracing.phase(tracing.VERSION, version=str(version)):
+                        res = testrunner.run(version, parser, benchmarks, **kwargs)
+                except Exception as e:
+                    print "### Worker failed on version %s: %s ###" % (version, e)
+                    res = None
+                done.put((i, version, res, time.time() - start))
+
+        for testrunner in testrunners:
+            worker = threading.Thread(target=work, args=(testrunner,))
+            worker.daemon = True
+            worker.start()
+
+        finished = {}
+        next_i = 0
+        completed = 0
+        eta = EwmaEta()
+        while next_i < len(versions):
+            # a blocking get without timeout cannot be interrupted with Ctrl-C in Python 2
+            i, version, res, diff = done.get(True, _FOREVER)
+            finished[i] = (version, res)
+            completed += 1
+            eta.update(diff)
+            # the workers share the remaining versions, so the walk advances by one version per worker at a time
+            _print_progress(version, diff, len(versions) - completed, eta.per_version / len(testrunners))
+            # deliver all results that are next in line
+            while next_i in finished:
+                version, res = finished.pop(next_i)
+                next_i += 1
+                for v_res in self._deliver(callback, version, res):
+                    yield v_res
+
+    def iter_walk_interleaved(self, versions, testrunner, parser, benchmarks = None, forward = True, callback = None,
+                              rounds = 3, seed = None, **kwargs):
+        """ This walks through the project history like iter_walk, but measures the versions in multiple interleaved
+         rounds instead of one block per version, so that drifting machine state (e.g., thermal throttling, background
+         load, noisy neighbours on cloud instances) affects all versions alike instead of looking like a performance
+         change between versions. Every version is built only once (see runner.Test.prepare), then every round
+         measures every built version once (see runner.Test.measure), in a shuffled order.
+
+         The values of all rounds are aggregated per version and handed to the callback (and yielded) in version order
+         after the last round, so nothing is delivered while the rounds are running.
+
+        :param rounds: The number of rounds.
+        :param seed: The seed of the shuffled orders, to repeat the orders of an earlier walk. Optional.
+        :return: A generator of result.Version objects, in version order.
+        """
+        kwargs = self.run_args(kwargs)
+        if not forward:
+            versions.reverse()
+        prepared = [None] * len(versions)
+        try:
+            eta = EwmaEta()
+            for i, version in enumerate(versions):
+                if callback:
+                    callback.version_started(self.config.project.name, version)
+                start = time.time()
+                try:
+                    with tracing.phase(tracing.VERSION, version=str(version)):
+                        prepared[i] = testrunner.prepare(version, parser, benchmarks, **kwargs)
+                except Exception as e:
+                    print "### Failed to prepare version %s: %s ###" % (version, e)
+                eta.update(time.time() - start)
+                _print_progress(version, time.time() - start, len(versions) - i - 1, eta.per_version)
+            measured, stopped = self._measure_rounds(versions, prepared, testrunner, parser, benchmarks, rounds, seed,
+                                                     kwargs)
+        finally:
+            for p in prepared:
+                if _built(p):
+                    p.release()
+        for i, version in enumerate(versions):
+            res = None
+            if i in measured:
+                res = result.Version(version, prepared[i].sha, measured[i])
+            elif prepared[i] and not _built(prepared[i]):
+                # the version was not built, its result has the status why
+                res = prepared[i]
+            elif i in stopped:
+                res = stopped[i]
+            for v_res in self._deliver(callback, version, res):
+                yield v_res
+
+    def _measure_rounds(self, versions, prepared, testrunner, parser, benchmarks, rounds, seed, kwargs):
+        """ _measure_rounds measures the prepared versions in rounds, see iter_walk_interleaved.
+        :return a tuple of two dictionaries, index of version -> list of results, aggregated over all rounds, and
+        index of version -> the result of its last measurement that was stopped (see result.Version.status):
+        """
+        rng = random.Random(seed)
+        # index of version -> list of results, and (benchmark, parameter) -> result
+        measured = {}
+        keyed = {}
+        stopped = {}
+        order = [i for i in range(0, len(versions)) if _built(prepared[i])]
+        remaining = rounds * len(order)
+        eta = EwmaEta()
+        for r in range(1, rounds + 1):
+            rng.shuffle(order)
+            print "### Round %s of %s: %s ###" % (r, rounds, ', '.join([str(versions[i]) for i in order]))
+            for i in order:
+                start = time.time()
+                try:
+                    with tracing.phase(tracing.VERSION, version=str(versions[i]), round=r):
+                        res = testrunner.measure(prepared[i], parser, benchmarks, **kwargs)
+                except Exception as e:
+                    print "### Failed to measure version %s: %s ###" % (versions[i], e)
+                    res = None
+                if res and res.status:
+                    stopped[i] = res
+                for b in (res.benchmarks if res else []):
+                    key = (b.benchmark, b.parameter)
+                    if key in keyed.setdefault(i, {}):
+                        keyed[i][key].merge(b)
+                    else:
+                        keyed[i][key] = b
+                        measured.setdefault(i, []).append(b)
+                remaining -= 1
+                eta.update(time.time() - start)
+                _print_progress(versions[i], time.time() - start, remaining, eta.per_version)
+        return measured, stopped
+
+    def iter_walk_pipelined(self, versions, builders, measurer, parser, benchmarks = None, forward = True,
+                            callback = None, ahead = 1, guard = None, **kwargs):
+        """ This walks through the project history like iter_walk, but checks out and builds the next versions while
+         the current version is measured. Every given builder is driven by its own thread, and prepares the versions
+         in order (see runner.Test.prepare), in a working copy of its own (e.g., a worktree, see Workspace). The
+         measurer measures the prepared versions in order (see runner.Test.measure) as soon as they are ready, from
+         the kept artifacts, so that builds can not change what is measured.
+
+        :param builders: A list of test runners that prepare the versions, each with its own working copy.
+        :param measurer: The test runner that measures the prepared versions.
+        :param ahead: The number of versions that are built (or kept ready) beyond the version that is measured.
+        :param guard: A BuildGuard that throttles or pauses the builds while a version is measured. Optional, builds run
+        at full speed otherwise.
+        :return: A generator of result.Version objects, in version order.
+        """
+        kwargs = self.run_args(kwargs)
+        if not forward:
+            versions.reverse()
+        if guard:
+            kwargs = dict(kwargs)
+            kwargs['build-guard'] = guard
+        todo = Queue.Queue()
+        for i, version in enumerate(versions):
+            todo.put((i, version))
+        ready = Queue.Queue()
+        # a builder takes a slot before it prepares a version, the measurement of the version frees it again
+        slots = threading.Semaphore(ahead + 1)
+
+        def build(builder):
+            while True:
+                slots.acquire()
+                try:
+                    i, version = todo.get_nowait()
+                except Queue.Empty:
+                    slots.release()
+                    return
+                if callback:
+                    callback.version_started(self.config.project.name, version)
+                prepared = None
+                try:
+                    with tracing.phase(tracing.VERSION, version=str(version), stage='prepare'):
+                        prepared = builder.prepare(version, parser, benchmarks, **kwargs)
+                except Exception as e:
+                    print "### Builder failed on version %s: %s ###" % (version, e)
+                ready.put((i, prepared))
+
+        for builder in builders:
+            worker = threading.Thread(target=build, args=(builder,))
+            worker.daemon = True
+            worker.start()
+
+        finished = {}
+        eta = EwmaEta()
+        last = time.time()
+        try:
+            for next_i, version in enumerate(versions):
+                while next_i not in finished:
+                    # a blocking get without timeout cannot be interrupted with Ctrl-C in Python 2
+                    i, prepared = ready.get(True, _FOREVER)
+                    finished[i] = prepared
+                prepared = finished.pop(next_i)
+                res = None
+                if prepared and not _built(prepared):
+                    # the version was not built, its result has the status why
+                    res = prepared
+                elif prepared:
+                    try:
+                        with _measuring(guard), tracing.phase(tracing.VERSION, version=str(version), stage='measure'):
+                            res = measurer.measure(prepared, parser, benchmarks, **kwargs)
+                    except Exception as e:
+                        print "### Failed to measure version %s: %s ###" % (version, e)
+                    finally:
+                        prepared.release()
+                slots.release()
+                # the walk advances by one version per measurement, the builds of the next versions overlap with it
+                diff = time.time() - last
+                last = time.time()
+                eta.update(diff)
+                _print_progress(version, diff, len(versions) - next_i - 1, eta.per_version)
+                for v_res in self._deliver(callback, version, res):
+                    yield v_res
+        finally:
+            for prepared in finished.values():
+                if _built(prepared):
+                    prepared.release()
+
+    def _deliver(self, callback, version, res):
+        """ _deliver hands the result of an executed version to the callback.
+        :return the results of all versions covered by the executed version:
+        """
+        delivered = []
+        for v in self.expand(version):
             if res:
-                all_results.versions.append(res)
+                # versions that share the executed version get a copy with their own version name
+                if v != version:
+                    v_res = result.Version(v, res.sha, res.benchmarks)
+                    v_res.status = res.status
+                else:
+                    v_res = res
+                delivered.append(v_res)
                 if callback:
-                    callback.results_received(self.config.project.name, version, res.sha, res)
-        return all_results
+                    with tracing.phase(tracing.DUMP, version=str(v)):
+                        callback.results_received(self.config.project.name, v, res.sha, v_res)
+            elif callback:
+                callback.version_failed(self.config.project.name, v)
+        return delivered
+
+    def expand(self, version):
+        """ Some backends execute only one version out of multiple versions that are known to be identical
+        (e.g., multiple dates resolving to the same commit). expand returns all versions that share the results of
+        the given executed version.
+
+        :param version: An executed version.
+        :return: A list of versions, including version itself.
+        """
+        return [version]
+
+    def run_args(self, kwargs):
+        """ Backends may pass additional information about the versions to the test runner (e.g., the commit each
+        date resolves to). run_args returns the keyword arguments to invoke the test runner with.
+
+        :param kwargs: The keyword arguments given to walk.
+        :return: The keyword arguments for the test runner.
+        """
+        return kwargs
 
     def generate_version_list(self, start = None, end = None, step = None, **kwargs):
         """ Generate a concrete list of versions to iterate over. This may be mvn versions,
@@ -78,6 +378,66 @@ class Walker:
         pass
 
 
+_FOREVER = 60 * 60 * 24 * 365
+
+
+def _built(prepared):
+    """ _built decides whether the return value of runner.Test.prepare is a built version, rather than None or the
+    result of a version that was not built.
+    """
+    return prepared is not None and not isinstance(prepared, result.Version)
+
+
+@contextmanager
+def _measuring(guard):
+    if not guard:
+        yield
+        return
+    with guard.measuring():
+        yield
+
+
+class EwmaEta:
+    """ EwmaEta estimates the execution time of the next version as the exponentially weighted moving average of
+    the execution times of the previous versions. Recent versions weigh more, so the estimate follows trends (e.g.
+    a project that grows over time), while single outliers (e.g. a failed build) only have a limited effect.
+    """
+
+    def __init__(self, alpha=0.3):
+        """
+        :param alpha: The weight of the latest version, between 0 and 1.
+        """
+        self.alpha = alpha
+        self.per_version = None
+
+    def update(self, duration):
+        if self.per_version is None:
+            self.per_version = float(duration)
+        else:
+            self.per_version = self.alpha * duration + (1 - self.alpha) * self.per_version
+
+
+def _print_progress(version, diff, remaining_versions, per_version = None):
+    """ Print how long the execution of a version took, and when the walk is projected to end.
+
+    :param diff: The execution time of the version in seconds.
+    :param remaining_versions: The number of versions that still have to be executed.
+    :param per_version: The expected time in seconds per remaining version. Defaults to diff.
+    """
+    m_diff = int(diff / 60)
+    if per_version is None:
+        per_version = diff
+    m_projected = int(per_version * remaining_versions / 60)
+    h_projected = int(m_projected/ 60)
+    m_projected_rem = int(m_projected % 60)
+    now = datetime.datetime.now()
+    projected_end = now + datetime.timedelta(minutes = m_projected)
+    print "### Execution for version %s took %s minutes. ###" % (version, m_diff)
+    if remaining_versions > 0:
+       print "### Still have %s versions to go, that will be %s hours and %s minutes. Projected end is %s. ###"\
+             % (remaining_versions, h_projected, m_projected_rem, projected_end)
+
+
 class WalkerCallback:
     """ This is an optional callback that is given to a HistoryWalker. The callback is invoked
     for each version result after each iteration.
@@ -94,3 +454,43 @@ class WalkerCallback:
         """
         pass
 
+    def version_started(self, project, version):
+        """ This callback method is to be invoked by the RevisionWalker before a version is executed. In parallel
+        walks, this is invoked from the worker threads, and versions may start out of order.
+
+        :param project: The identifier of the project
+        :param version: The version that is about to be executed
+        :return: None
+        """
+        pass
+
+    def version_failed(self, project, version):
+        """ This callback method is to be invoked by the RevisionWalker instead of results_received if the execution
+        of a version did not produce any results.
+
+        :param project: The identifier of the project
+        :param version: The version that failed
+        :return: None
+        """
+        pass
+
+
+class CompositeCallback(WalkerCallback):
+    """ A callback that forwards every invocation to a list of callbacks, in order.
+    """
+
+    def __init__(self, callbacks):
+        self.callbacks = callbacks
+
+    def results_received(self, project, version, sha, results):
+        for callback in self.callbacks:
+            callback.results_received(project, version, sha, results)
+
+    def version_started(self, project, version):
+        for callback in self.callbacks:
+            callback.version_started(project, version)
+
+    def version_failed(self, project, version):
+        for callback in self.callbacks:
+            callback.version_failed(project, version)
+
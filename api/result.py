@@ -1,3 +1,19 @@
+from array import array
+
+# benchmark and parameter names repeat for every version (and every repetition), so each distinct name is kept once
+_NAMES = {}
+
+
+def intern_name(name):
+    """ intern_name returns the canonical instance of the given benchmark or parameter name.
+    """
+    return _NAMES.setdefault(name, name)
+
+
+# the columns of the columnar form, see Project.to_columns
+COLUMNS = ('version', 'sha', 'benchmark', 'parameter', 'value')
+
+
 class Parser:
     """ This is the interface of a parser that extracts one or more benchmarking results
     from a file.
@@ -11,7 +27,9 @@ class Parser:
         pass
 
 
-class Project:
+class Project(object):
+    __slots__ = ('project', 'versions')
+
     def __init__(self, project, versions=None):
         self.project = project
         if versions:
@@ -19,6 +37,24 @@ class Project:
         else:
             self.versions = []
 
+    def to_columns(self):
+        """ to_columns converts all results of this project into columnar form: a dictionary with one entry per
+        column (see COLUMNS) and one row per individual result. The value column is an array('d'), which exposes
+        the buffer protocol (e.g., numpy.frombuffer(columns['value']) does not copy). The other columns are lists
+        of references to the shared version, sha and (interned) name objects.
+        """
+        columns = _empty_columns()
+        for version in self.versions:
+            version.append_columns(columns)
+        return columns
+
+    @staticmethod
+    def from_columns(project, columns):
+        """ from_columns is the inverse of to_columns. Consecutive rows of the same version and benchmark are
+        grouped into one Version and one Benchmark.
+        """
+        return Project(project, Version.from_columns(columns))
+
     def __str__(self):
         string = """###################
 Results for project %s:
@@ -29,7 +65,9 @@ Results for project %s:
         return string
 
 
-class Version:
+class Version(object):
+    __slots__ = ('version', 'sha', 'benchmarks', 'status')
+
     def __init__(self, version, sha, benchmarks=None):
         self.version = version
         self.sha = sha
@@ -37,24 +75,103 @@ class Version:
             self.benchmarks = benchmarks
         else:
             self.benchmarks = []
+        # why the version has no (or incomplete) results, if its execution was stopped (see Watchdog)
+        self.status = None
+
+    def to_columns(self):
+        """ to_columns converts the results of this version into columnar form, see Project.to_columns.
+        """
+        columns = _empty_columns()
+        self.append_columns(columns)
+        return columns
+
+    def append_columns(self, columns):
+        for b in self.benchmarks:
+            n = len(b.individual_results)
+            columns['version'].extend([self.version] * n)
+            columns['sha'].extend([self.sha] * n)
+            columns['benchmark'].extend([b.benchmark] * n)
+            columns['parameter'].extend([b.parameter] * n)
+            columns['value'].extend(b.individual_results)
+
+    @staticmethod
+    def from_columns(columns):
+        """ from_columns converts columnar form (see Project.to_columns) back into a list of versions.
+        """
+        versions = []
+        version = None
+        benchmark = None
+        for i in range(0, len(columns['value'])):
+            if version is None or version.version != columns['version'][i] or version.sha != columns['sha'][i]:
+                version = Version(columns['version'][i], columns['sha'][i])
+                versions.append(version)
+                benchmark = None
+            if benchmark is None or benchmark.benchmark != columns['benchmark'][i] \
+                    or benchmark.parameter != columns['parameter'][i]:
+                benchmark = Benchmark(columns['benchmark'][i], columns['parameter'][i])
+                version.benchmarks.append(benchmark)
+            benchmark.individual_results.append(columns['value'][i])
+        return versions
 
     def __str__(self):
         string = """-------------------
 Results for version %s (%s):
 """ % (self.version, self.sha)
+        if self.status:
+            string += "Stopped: %s\n" % self.status
         for benchmark in self.benchmarks:
             string += str(benchmark)
         return string
 
 
-class Benchmark:
+class Benchmark(object):
+    __slots__ = ('benchmark', 'parameter', '_values', 'forks', 'score', 'score_error', 'score_unit', 'percentiles',
+                 'failures', 'skipped', 'remeasured', 'stop_reason', 'placement')
+
     def __init__(self, benchmark, parameter, individual_results=None):
-        self.benchmark = benchmark
-        self.parameter = parameter
-        if individual_results:
-            self.individual_results = individual_results
+        self.benchmark = intern_name(benchmark)
+        self.parameter = intern_name(parameter)
+        self.individual_results = individual_results
+        # number of values per fork (in order) in individual_results, if known
+        self.forks = None
+        # summary statistics as reported by the benchmark harness, if any
+        self.score = None
+        self.score_error = None
+        self.score_unit = None
+        self.percentiles = None
+        # number of executions that failed or were skipped, and therefore did not produce a value
+        self.failures = 0
+        self.skipped = 0
+        # False if the benchmark was not executed again for this version, because no change could affect it
+        self.remeasured = True
+        # why the benchmark was not repeated any further, if the number of repetitions was decided by sampling
+        self.stop_reason = None
+        # the CPUs (and NUMA node) the benchmark was measured on, if it was pinned (see Affinity.Placement)
+        self.placement = None
+
+    @property
+    def individual_results(self):
+        """ The individual results as array('d'). New results can be added with add (or append/extend on the
+        array itself) without copying the existing ones.
+        """
+        return self._values
+
+    @individual_results.setter
+    def individual_results(self, values):
+        if isinstance(values, array):
+            self._values = values
         else:
-            self.individual_results = []
+            self._values = array('d', values or [])
+
+    def add(self, values):
+        self._values.extend(values)
+
+    def merge(self, other):
+        """ merge adds the values and failure/skip counts of another result of the same benchmark.
+        """
+        self._values.extend(other.individual_results)
+        self.failures += other.failures
+        self.skipped += other.skipped
 
     def __str__(self):
         string = """....................
@@ -64,3 +181,7 @@ Results for Benchmark %s and Parameter %s:
             string += str(result)
             string += "\n"
         return string
+
+
+def _empty_columns():
+    return {'version': [], 'sha': [], 'benchmark': [], 'parameter': [], 'value': array('d')}
@@ -1,3 +1,8 @@
+import os
+import shutil
+import tempfile
+
+
 class Test:
     """ This is the interface of a benchmark runner, i.e., the logic that knows how to
     actually execute e.g., JMH tests using Maven. In practice this will be sort of
@@ -14,3 +19,50 @@ class Test:
         :return:
         """
         pass
+
+    def prepare(self, version, parser, run=None, **kwargs):
+        """ Check out and build the specified version, and keep everything needed to execute its benchmark(s) (e.g.,
+        the benchmarks jar) apart from the working tree, so that the version can be measured repeatedly (see measure)
+        while other versions are checked out. Optional, only runners that support interleaved walks implement it.
+        :return: A Prepared, or, if the version was not built, its result.Version with the status why (see
+        result.Version.status), or None.
+        """
+        pass
+
+    def measure(self, prepared, parser, run=None, **kwargs):
+        """ Execute the benchmark(s) of a prepared version once, from its kept artifacts, and parse the results.
+        :param prepared: The return value of prepare.
+        :return: A result.Version, or None if the execution failed.
+        """
+        pass
+
+
+class Prepared:
+    """ The artifacts of a built version (see Test.prepare), kept in a directory of their own until release.
+    """
+
+    ARTIFACTS_DIR = '{0}/tmp/hopper-files/artifacts'.format(os.path.expanduser('~'))
+
+    def __init__(self, version, sha, artifacts_dir=None):
+        self.version = version
+        self.sha = sha
+        base_dir = artifacts_dir or Prepared.ARTIFACTS_DIR
+        if not os.path.isdir(base_dir):
+            os.makedirs(base_dir)
+        self.dir = tempfile.mkdtemp(prefix='%s-' % str(sha)[:12], dir=base_dir)
+
+    def keep(self, path, name=None, ignore=None):
+        """ keep copies a file or directory into the artifacts directory.
+        :param name: The name of the copy. Defaults to the name of path.
+        :param ignore: The entries of a directory not to copy, as for shutil.copytree (see shutil.ignore_patterns).
+        :return the path of the copy:
+        """
+        kept = os.path.join(self.dir, name or os.path.basename(path.rstrip(os.sep)))
+        if os.path.isdir(path):
+            shutil.copytree(path, kept, ignore=ignore)
+        else:
+            shutil.copy2(path, kept)
+        return kept
+
+    def release(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
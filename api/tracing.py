@@ -0,0 +1,113 @@
+""" This records how long the phases of a walk take (checking out, building, executing, parsing and dumping the results
+of every version). Walkers and test runners wrap their phases with phase(...); if a Tracer is started, every phase is
+written to a trace file, either as JSON lines or in the Chrome trace event format (which chrome://tracing and Perfetto
+display as a timeline, one row per worker thread). The total time per phase is always kept (see totals).
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+VERSION = 'version'
+CHECKOUT = 'checkout'
+BUILD = 'build'
+SELECT = 'select'
+RUN = 'run'
+PARSE = 'parse'
+DUMP = 'dump'
+
+JSON_LINES = 'jsonl'
+CHROME = 'chrome'
+
+
+class Tracer:
+    """ A Tracer writes the phases to a file, one event per phase. Events of all threads go to the same file.
+    """
+
+    def __init__(self, file, format=JSON_LINES):
+        """
+        :param file: The file to write the trace to. The caller is responsible for closing it (after stop).
+        :param format: JSON_LINES (one JSON object per line) or CHROME (a JSON array of complete events).
+        """
+        self.file = file
+        self.format = format
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.events = 0
+        if format == CHROME:
+            self.file.write('[')
+
+    def event(self, name, start, duration, args):
+        if self.format == CHROME:
+            line = json.dumps({'name': name, 'cat': 'hopper', 'ph': 'X', 'ts': int(start * 1e6),
+                               'dur': int(duration * 1e6), 'pid': self.pid, 'tid': threading.current_thread().name,
+                               'args': args})
+        else:
+            line = json.dumps({'phase': name, 'start': start, 'duration': duration,
+                               'thread': threading.current_thread().name, 'args': args})
+        with self.lock:
+            if self.format == CHROME:
+                self.file.write(',\n' if self.events else '\n')
+            self.file.write(line)
+            if self.format != CHROME:
+                self.file.write('\n')
+            self.file.flush()
+            self.events += 1
+
+    def close(self):
+        with self.lock:
+            if self.format == CHROME:
+                self.file.write('\n]\n')
+            self.file.flush()
+
+
+_tracer = None
+_local = threading.local()
+_lock = threading.Lock()
+# phase -> [count, seconds]
+_totals = {}
+
+
+def start(tracer):
+    """ start writes all phases from now on to the given tracer.
+    """
+    global _tracer
+    _tracer = tracer
+
+
+def stop():
+    global _tracer
+    if _tracer:
+        _tracer.close()
+    _tracer = None
+
+
+@contextmanager
+def phase(name, **args):
+    """ phase records how long the enclosed block takes. The arguments (e.g. version=...) describe the phase, and are
+    inherited by all phases nested in it on the same thread.
+    """
+    outer = getattr(_local, 'args', {})
+    args = dict(outer, **args)
+    _local.args = args
+    begin = time.time()
+    try:
+        yield
+    finally:
+        duration = time.time() - begin
+        _local.args = outer
+        with _lock:
+            total = _totals.setdefault(name, [0, 0.0])
+            total[0] += 1
+            total[1] += duration
+        if _tracer:
+            _tracer.event(name, begin, duration, args)
+
+
+def totals():
+    """ totals returns the number of times each phase was entered, and the total seconds spent in it.
+    :return a dictionary phase -> (count, seconds):
+    """
+    with _lock:
+        return dict([(name, tuple(total)) for name, total in _totals.iteritems()])
@@ -0,0 +1,140 @@
+""" Micro-benchmark of GitRepoHandler.find_commits_between on a synthetic repository.
+
+The repository is generated with git fast-import. It has a multi-module layout, and only every third commit
+changes production code; the other commits change documentation, tests, or only Javadoc.
+
+Usage (from the hopper directory):
+    python bench/find_commits_between.py [--commits 100000] [--range 500] [--repeat 3]
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import pygit2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from impl.CommitIndex import CommitIndex
+from impl.GitRepoHandler import GitRepoHandler
+
+MODULES = ['core', 'api', 'util', 'io']
+
+
+def generate_repo(path, commits):
+    """ generate_repo creates a repository with the given number of linear commits on master.
+    """
+    subprocess.check_call(['git', 'init', '-q', path])
+    p = subprocess.Popen(['git', 'fast-import', '--quiet'], cwd=path, stdin=subprocess.PIPE)
+    out = p.stdin
+    for i in range(0, commits):
+        module = MODULES[i % len(MODULES)]
+        kind = i % 3
+        if kind == 0:
+            # production code change
+            files = [('%s/src/main/java/org/example/%s/Class%s.java' % (module, module, i % 50),
+                      'package org.example;\nclass C { int f() { return %s; } }\n' % i)]
+        elif kind == 1:
+            # Javadoc-only or documentation change
+            if i % 2:
+                files = [('%s/src/main/java/org/example/%s/Class%s.java' % (module, module, i % 50),
+                          'package org.example;\n/**\n * revision %s\n */\nclass C { int f() { return 0; } }\n' % i)]
+            else:
+                files = [('docs/page%s.md' % (i % 200), 'revision %s\n' % i)]
+        else:
+            # test change
+            files = [('%s/src/test/java/org/example/%s/Test%s.java' % (module, module, i % 50),
+                      'class T { int t() { return %s; } }\n' % i)]
+        message = 'commit %s\n' % i
+        out.write('commit refs/heads/master\n')
+        out.write('committer Bench <bench@example.com> %s +0000\n' % (1400000000 + i * 60))
+        out.write('data %s\n%s' % (len(message), message))
+        for name, content in files:
+            out.write('M 100644 inline %s\ndata %s\n%s\n' % (name, len(content), content))
+        out.write('\n')
+    out.close()
+    p.wait()
+    subprocess.check_call(['git', 'checkout', '-q', 'master'], cwd=path)
+
+
+def reference_find_commits_between(repo, start, end, codeonly):
+    """ The previous implementation: materializes the whole history, then walks it a second time and computes the
+    full textual diff of every commit.
+    """
+    all_commits = [commit for commit in repo.walk(end, pygit2.GIT_SORT_TOPOLOGICAL)]
+    the_commits = []
+    i = 0
+    for commit in repo.walk(end, pygit2.GIT_SORT_TOPOLOGICAL):
+        use = True
+        if codeonly and i + 1 < len(all_commits):
+            diff = commit.tree.diff_to_tree(all_commits[i + 1].tree)
+            use = GitRepoHandler.is_code_change(diff)
+        if use:
+            the_commits.append(str(commit.id)[:7])
+        i += 1
+        if str(commit.id).startswith(start):
+            the_commits.reverse()
+            return the_commits
+
+
+def cold(path):
+    """ cold returns a handler for the repository at path without a persisted commit index.
+    """
+    handler = GitRepoHandler(path)
+    index_file = os.path.join(handler.common_dir(), CommitIndex.FILE)
+    if os.path.isfile(index_file):
+        os.remove(index_file)
+    return handler
+
+
+def measure(name, f, repeat):
+    timings = []
+    res = None
+    for _ in range(0, repeat):
+        start = time.time()
+        res = f()
+        timings.append(time.time() - start)
+    print "%-40s best %8.3fs  (%s commits selected)" % (name, min(timings), len(res))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmark of find_commits_between.')
+    parser.add_argument('--commits', dest='commits', type=int, default=100000)
+    parser.add_argument('--range', dest='range', type=int, default=500)
+    parser.add_argument('--repeat', dest='repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp(prefix='hopper-bench-')
+    try:
+        start = time.time()
+        generate_repo(path, args.commits)
+        print "generated %s commits in %.1fs" % (args.commits, time.time() - start)
+
+        handler = GitRepoHandler(path)
+        repo = handler.pygit_repo
+        commits = [str(c.id) for c in repo.walk(repo.head.target, pygit2.GIT_SORT_TOPOLOGICAL)]
+        end = commits[0]
+        range_start = commits[min(args.range, len(commits) - 1)][:7]
+        full_start = commits[-2][:7]
+
+        for codeonly in (False, True):
+            print "--- skip-noncode: %s ---" % codeonly
+            measure("reference, last %s commits" % args.range,
+                    lambda: reference_find_commits_between(repo, range_start, end, codeonly), args.repeat)
+            measure("commit index, last %s commits" % args.range,
+                    lambda: handler.find_commits_between(range_start, end, codeonly), args.repeat)
+            measure("reference, full history",
+                    lambda: reference_find_commits_between(repo, full_start, end, codeonly), args.repeat)
+            measure("commit index (cold), full history",
+                    lambda: cold(path).find_commits_between(full_start, end, codeonly), args.repeat)
+            measure("commit index (warm), full history",
+                    lambda: handler.find_commits_between(full_start, end, codeonly), args.repeat)
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,16 @@
 import fnmatch
 import os
+import threading
 import types
 
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
 
 def matching_files(root_path, file_patterns, test_file_path=None):
     """
@@ -26,3 +35,105 @@ def matching_files(root_path, file_patterns, test_file_path=None):
                     if fnmatch.fnmatch(f, p):
                         s.append(dirpath + '/' + f)
     return frozenset(s)
+
+
+def listed_files(dirs, file_patterns):
+    """
+    listed_files returns all files directly in the given directories (not in sub-directories) that match the
+    provided patterns. Unlike matching_files, this does not walk any directory trees, so it is cheap to call
+    repeatedly on a known set of directories. Directories that do not exist are ignored.
+    :param dirs: the iterable of directories to list
+    :param file_patterns: the iterable which contains the file name patterns
+    :return matching files in a set:
+    """
+    if isinstance(file_patterns, types.StringTypes):
+        file_patterns = [file_patterns]
+    s = []
+    for d in dirs:
+        for f in _list_dir(d):
+            for p in file_patterns:
+                if fnmatch.fnmatch(f, p):
+                    s.append(os.path.join(d, f))
+                    break
+    return frozenset(s)
+
+
+def _list_dir(d):
+    try:
+        if scandir:
+            return [e.name for e in scandir(d) if e.is_file()]
+        return [f for f in os.listdir(d) if os.path.isfile(os.path.join(d, f))]
+    except OSError:
+        return []
+
+
+class FileWatcher:
+    """
+    FileWatcher hands files to a callback as soon as they are written, while another process (e.g. Surefire) is
+    still producing them. It polls a known set of directories; a file is handed over once it is new or changed
+    since the watcher started and its size did not change between two polls. Files that are still being written
+    when the watcher is stopped are handed over by stop. A file the callback fails for is handed over again by the
+    next poll, until stop; what still fails then is reported, and left out.
+    """
+
+    def __init__(self, dirs, file_patterns, callback, interval=0.5):
+        """
+        :param dirs: the directories to watch (see listed_files)
+        :param file_patterns: the file name patterns to watch for
+        :param callback: invoked with the path of every finished file, from the watcher thread
+        :param interval: the polling interval in seconds
+        """
+        self.dirs = dirs
+        self.file_patterns = file_patterns
+        self.callback = callback
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = None
+        self.known = {}
+        self.pending = {}
+
+    def start(self):
+        # files that exist before the watcher starts (e.g. from a previous run) are only handed over if they change
+        self.known = self._stats()
+        self.thread = threading.Thread(target=self._watch)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self._poll(final=True)
+
+    def _watch(self):
+        while not self.stopped.wait(self.interval):
+            self._poll()
+
+    def _poll(self, final=False):
+        for f, stat in self._stats().iteritems():
+            if self.known.get(f) == stat:
+                continue
+            if final or self.pending.get(f) == stat:
+                try:
+                    self.callback(f)
+                except Exception as e:
+                    # e.g. a report that looked finished, but was not completely written yet: it stays pending, and
+                    # is handed over again by the next poll
+                    if final:
+                        print "### could not process %s: %s ###" % (f, e)
+                    self.pending[f] = stat
+                    continue
+                self.known[f] = stat
+                self.pending.pop(f, None)
+            else:
+                self.pending[f] = stat
+
+    def _stats(self):
+        stats = {}
+        for f in listed_files(self.dirs, self.file_patterns):
+            try:
+                st = os.stat(f)
+                stats[f] = (st.st_mtime, st.st_size)
+            except OSError:
+                pass
+        return stats
@@ -1,11 +1,30 @@
 import argparse
+import os
+import sys
+import time
+from contextlib import closing
 
+import api.tracing as tracing
+from api.history import CompositeCallback
+
+from impl import Affinity
+from impl import BadCommits
+from impl import Bisector
+from impl import BuildGuard
+from impl import Statistics as stats
 from impl import MvnGit
 from impl import ResultParser
-from impl.FileDumper import FileDumper, CloudDumper
+from impl import Watchdog
+from impl.BuildCache import BuildCache
+from impl import FileDumper as output
+from impl.FileDumper import FileDumper, CloudDumper, ArrowDumper
+from impl.BasicJMHRunner import BasicJMHRunner
 from impl.GradleCommitWalker import GradleJMHGitRunner
+from impl.Journal import Journal
 from impl.MvnCommitWalker import MvnCommitWalker
 from impl.MvnVersionWalker import MvnVersionWalker, JMHMvnRunner
+from impl.ResultStore import SQLiteStore, StoreQuery, diffs, to_ms
+from impl.Workspace import Workspace
 
 def parse_cmd_params():
     '''
@@ -14,10 +33,15 @@ def parse_cmd_params():
     parser = argparse.ArgumentParser(description='Historian of Performance.')
     parser.add_argument('-f', '--configfile', required=True, dest='config')
     parser.add_argument('-o', '--outfile', required=True, dest='outfile')
+    parser.add_argument('--output-format', choices=output.FORMATS, default=None, dest='output_format')
     parser.add_argument('-t', '--type', required=True, choices=('unit', 'benchmark'), dest="type")
     parser.add_argument('-b', '--backend', choices=('versions', 'commits'), default='commits', dest='backend')
     parser.add_argument('-r', '--runner', choices=('mvn', 'gradle'), default='mvn', dest='runner')
     parser.add_argument('--cloud', dest='cloud', default=None, nargs=2, action='append')
+    parser.add_argument('--cloud-spool', dest='cloud_spool', default=CloudDumper.SPOOL_DIR)
+    parser.add_argument('--cloud-batch-size', dest='cloud_batch_size', type=int, default=1024)
+    parser.add_argument('--cloud-batch-interval', dest='cloud_batch_interval', type=int, default=60)
+    parser.add_argument('--store', dest='store', default=None)
     parser.add_argument('--from', dest='start')
     parser.add_argument('--to', dest='to')
     parser.add_argument('--step', dest='step', type=int)
@@ -26,6 +50,36 @@ def parse_cmd_params():
     parser.add_argument('--mode', choices=('time-mode', 'commit-mode'), default='commit-mode', dest='mode')
     parser.add_argument('--skip-noncode', type=bool, dest='codeonly', default=False)
     parser.add_argument('--build-type', choices=('inc', 'clean'), default='clean', dest='build_type')
+    parser.add_argument('--workers', dest='workers', type=int, default=1)
+    parser.add_argument('--workdir', dest='workdir', default='~/tmp/hopper-files/workers')
+    parser.add_argument('--build-cache', dest='build_cache', default=None)
+    parser.add_argument('--build-cache-size', dest='build_cache_size', type=int, default=10240)
+    parser.add_argument('--bad-commits', dest='bad_commits', nargs='?', const=BadCommits.BadCommits.PATH, default=None)
+    parser.add_argument('--retry-bad-commits', dest='retry_bad_commits', action='store_true', default=False)
+    parser.add_argument('--journal', dest='journal', default=None)
+    parser.add_argument('--annotations', dest='annotations', default=None)
+    parser.add_argument('--resume', dest='resume', action='store_true', default=False)
+    parser.add_argument('--junit-mode', choices=('mvn', 'direct'), default='mvn', dest='junit_mode')
+    parser.add_argument('--affected-modules', action='store_true', dest='affected_modules')
+    parser.add_argument('--select-tests', choices=('bytecode', 'source'), default=None, dest='select_tests')
+    parser.add_argument('--trace', dest='trace', default=None)
+    parser.add_argument('--trace-format', choices=(tracing.JSON_LINES, tracing.CHROME), default=tracing.JSON_LINES,
+                        dest='trace_format')
+    parser.add_argument('--pin-cpus', dest='pin_cpus', default=None, action='append')
+    parser.add_argument('--pin-numa-node', dest='pin_numa_node', type=int, default=None)
+    parser.add_argument('--build-ahead', dest='build_ahead', type=int, default=0)
+    parser.add_argument('--build-guard', choices=BuildGuard.BuildGuard.MODES, default=BuildGuard.BuildGuard.RUN,
+                        dest='build_guard')
+    parser.add_argument('--build-timeout', dest='build_timeout', type=int, default=None)
+    parser.add_argument('--run-timeout', dest='run_timeout', type=int, default=None)
+    parser.add_argument('--timeout-factor', dest='timeout_factor', type=float, default=None)
+    parser.add_argument('--memory-limit', dest='memory_limit', type=int, default=None)
+    parser.add_argument('--output-limit', dest='output_limit', type=int, default=None)
+    parser.add_argument('--interleave', dest='interleave', type=int, default=None)
+    parser.add_argument('--interleave-seed', dest='interleave_seed', type=int, default=None)
+    parser.add_argument('--bisect', dest='bisect', default=None)
+    parser.add_argument('--bisect-rule', choices=('mwu', 'mean'), default='mwu', dest='bisect_rule')
+    parser.add_argument('--bisect-alpha', dest='bisect_alpha', type=float, default=0.01)
     return parser.parse_args()
 
 
@@ -41,13 +95,8 @@ def create_backend_runner(args):
     if args.type == 'benchmark':
         if args.backend == 'versions':
             backend = MvnVersionWalker(args.config)
-            runner = JMHMvnRunner(backend.config)
         elif args.backend == 'commits':
             backend = MvnCommitWalker(args.config)
-            if args.runner == 'mvn':
-                runner = MvnGit.JMHRunner(backend.config)
-            elif args.runner == 'gradle':
-                runner = GradleJMHGitRunner(backend.config)
         else:
             print_and_exit("unsupported backend (" + args.backend + ") for type (" + args.type + ")")
     elif args.type == 'unit':
@@ -55,7 +104,8 @@ def create_backend_runner(args):
             if args.runner == 'mvn':
                 backend = MvnCommitWalker(args.config)
                 print "### single test case executions: " + str(backend.config.project.junit['execs'])
-                runner = MvnGit.JUnitRunner(backend.config)
+                if args.junit_mode == 'direct' and 'launcher' not in backend.config.project.junit:
+                    print_and_exit("junit mode (direct) requires the JUnit launcher to be configured (junit/launcher)")
             else:
                 print_and_exit("unsupported runner (" + args.runner+ ") for backend (" + args.backend + ") and type (" + args.type + ")")
         elif args.backend == 'versions':
@@ -66,37 +116,328 @@ def create_backend_runner(args):
         print_and_exit('unsupported type: ' + args.type)
 
     ret['backend'] = backend
-    ret['runner'] = runner
-    ret['custom_args'] = {'mode': args.mode, 'skip-noncode': args.codeonly, 'build': args.build_type}
+    ret['runner'] = create_runner(args, backend.config)
+    ret['custom_args'] = {'mode': args.mode, 'skip-noncode': args.codeonly, 'build': args.build_type,
+                          'junit-mode': args.junit_mode, 'affected-modules': args.affected_modules,
+                          'select-tests': args.select_tests}
+    if args.build_cache:
+        ret['custom_args']['build-cache'] = BuildCache(args.build_cache, args.build_cache_size * 1024 * 1024)
+    if args.bad_commits:
+        ret['custom_args']['bad-commits'] = create_bad_commits(args, backend.config)
 
     return ret
 
+
+def create_runner(args, config):
+    if args.type == 'benchmark':
+        if args.backend == 'versions':
+            return JMHMvnRunner(config)
+        elif args.runner == 'mvn':
+            return MvnGit.JMHRunner(config)
+        elif args.runner == 'gradle':
+            return GradleJMHGitRunner(config)
+    elif args.type == 'unit':
+        return MvnGit.JUnitRunner(config)
+
+
+def create_bad_commits(args, config):
+    """
+    create_bad_commits opens the registry of commits that failed to build (see --bad-commits). The toolchain is
+    identified by the versions of Java and Maven, and the arguments that influence whether a version builds. The
+    benchmarks of a benchmark walk are built against every version as well, so their sources are part of it.
+    """
+    commands = [[BasicJMHRunner.JAVA_COMMAND[0], "-version"], [BasicJMHRunner.MVN_COMMAND, "-v"]]
+    extra = [args.type, args.runner, args.build_type]
+    if args.type == 'benchmark':
+        extra.append(BadCommits.sources_fingerprint(os.path.join(os.path.expanduser(config.project.jmh_root), 'src')))
+    toolchain = BadCommits.toolchain_fingerprint(commands, extra)
+    registry = BadCommits.BadCommits(args.bad_commits, toolchain, args.retry_bad_commits)
+    known = len([sha for sha in registry.commits if registry.known_bad(sha)])
+    print "### bad commits: %s of %s known to fail with toolchain %s (%s) ###" \
+          % (known, len(registry.commits), toolchain, registry.path)
+    return registry
+
+
+def create_placements(args):
+    """
+    create_placements creates the placements of the measurements (one per worker, see --pin-cpus), and moves hopper
+    itself to the remaining CPUs.
+    :return the list of placements, empty if the measurements are not pinned:
+    """
+    if not args.pin_cpus:
+        return []
+    if len(args.pin_cpus) != max(args.workers, 1):
+        print_and_exit("pinning (--pin-cpus) requires one CPU list per worker (--workers)")
+    try:
+        placements = [Affinity.Placement(cpus, args.pin_numa_node) for cpus in args.pin_cpus]
+        pinned = [cpu for placement in placements for cpu in placement.cpus]
+        if len(pinned) != len(set(pinned)):
+            print_and_exit("the CPU lists of the workers (--pin-cpus) overlap")
+        remaining = Affinity.isolate(placements)
+    except Exception as e:
+        print_and_exit("pinning (--pin-cpus) failed: %s" % e)
+    print "### measurements run on %s, hopper and builds on CPUs %s ###" \
+          % (', '.join([str(p) for p in placements]), Affinity.format_cpus(remaining))
+    return placements
+
+
+def create_limits(args):
+    """
+    create_limits creates the limits of the builds and measurements (see Watchdog) from the commandline params.
+    """
+    timeouts = {}
+    if args.build_timeout:
+        timeouts[tracing.BUILD] = args.build_timeout
+    if args.run_timeout:
+        timeouts[tracing.RUN] = args.run_timeout
+    if args.timeout_factor is not None and args.timeout_factor <= 1:
+        print_and_exit("the timeout factor (--timeout-factor) has to be greater than 1")
+    megabytes = lambda mb: mb * 1024 * 1024 if mb else None
+    limits = Watchdog.Limits(timeouts, args.timeout_factor, megabytes(args.memory_limit), megabytes(args.output_limit))
+    if limits:
+        print "### limits: timeouts %s, timeout factor %s, memory %s MB, output %s MB ###" \
+              % (timeouts or None, args.timeout_factor, args.memory_limit, args.output_limit)
+    return limits
+
+
+def create_workspaces(args, config, count=None, name="worker"):
+    if args.backend != 'commits':
+        print_and_exit("parallel walks (--workers) are only supported for backend (commits)")
+    workspaces = []
+    for n in range(0, count or args.workers):
+        workspace = Workspace(config, args.workdir, "%s-%s" % (name, n + 1))
+        print "### preparing workspace %s ###" % workspace.dir
+        workspaces.append(workspace.create())
+    return workspaces
+
+
+def bisect(args, backend, runner, parser, versions, callback, custom_args):
+    if args.bisect_rule == 'mwu':
+        rule = Bisector.MannWhitneyRule(args.bisect_alpha)
+    else:
+        rule = Bisector.RULES[args.bisect_rule]()
+    bisector = Bisector.Bisector(backend, runner, parser, rule, callback)
+    # the bisected benchmark has to be measured in every version, affected or not
+    custom_args = dict(custom_args)
+    custom_args.pop('select-tests', None)
+    return bisector.bisect(versions, args.bisect, **custom_args)
+
+
+def interleave(args, backend, runner, parser, versions, callback, custom_args):
+    if args.backend != 'commits':
+        print_and_exit("interleaved walks (--interleave) are only supported for backend (commits)")
+    if args.workers > 1 or args.bisect or args.select_tests:
+        print_and_exit("interleaved walks (--interleave) can not be combined with --workers, --bisect or "
+                       "--select-tests")
+    if args.type == 'unit' and args.junit_mode != 'direct':
+        print_and_exit("interleaved walks (--interleave) of unit tests require junit mode (direct)")
+    for _ in backend.iter_walk_interleaved(versions, runner, parser, args.tests, not args.invert, callback,
+                                           args.interleave, args.interleave_seed, **custom_args):
+        pass
+
+
+def pipeline(args, backend, runner, parser, versions, callback, custom_args):
+    if args.backend != 'commits':
+        print_and_exit("pipelined walks (--build-ahead) are only supported for backend (commits)")
+    if args.workers > 1 or args.bisect or args.select_tests or args.interleave:
+        print_and_exit("pipelined walks (--build-ahead) can not be combined with --workers, --bisect, --select-tests "
+                       "or --interleave")
+    if args.type == 'unit' and args.junit_mode != 'direct':
+        print_and_exit("pipelined walks (--build-ahead) of unit tests require junit mode (direct)")
+    custom_args = dict(custom_args)
+    if args.type == 'unit':
+        custom_args['executions'] = backend.config.project.junit['execs']
+    # the versions are built in a worktree, and measured from the kept artifacts (with the runner of the project)
+    workspaces = create_workspaces(args, backend.config, 1, "builder")
+    try:
+        builders = [create_runner(args, workspace.config) for workspace in workspaces]
+        guard = BuildGuard.BuildGuard(args.build_guard)
+        for _ in backend.iter_walk_pipelined(versions, builders, runner, parser, args.tests, not args.invert, callback,
+                                             args.build_ahead, guard, **custom_args):
+            pass
+    finally:
+        for workspace in workspaces:
+            workspace.remove()
+
+
+def print_phases():
+    totals = tracing.totals()
+    for name in sorted(totals, key=lambda n: -totals[n][1]):
+        count, seconds = totals[name]
+        print "### %s: %s times, %.1f minutes ###" % (name, count, seconds / 60)
+
+
+def walk(args, backend, runner, parser, versions, callback, custom_args):
+    """
+    walk executes the versions. The results are only handed to the callback, and not kept.
+    :return None:
+    """
+    if args.interleave:
+        interleave(args, backend, runner, parser, versions, callback, custom_args)
+        return
+    if args.build_ahead > 0:
+        pipeline(args, backend, runner, parser, versions, callback, custom_args)
+        return
+    if args.bisect:
+        bisect(args, backend, runner, parser, versions, callback, custom_args)
+        return
+    if args.workers <= 1:
+        for _ in backend.iter_walk(versions, runner, parser, args.tests, not args.invert, callback, **custom_args):
+            pass
+        return
+    workspaces = create_workspaces(args, backend.config)
+    try:
+        runners = [create_runner(args, workspace.config) for workspace in workspaces]
+        for runner, placement in zip(runners, args.placements):
+            runner.placement = placement
+        for _ in backend.iter_walk_parallel(versions, runners, parser, args.tests, not args.invert, callback,
+                                            **custom_args):
+            pass
+    finally:
+        for workspace in workspaces:
+            workspace.remove()
+
+def query(argv):
+    """
+    query prints the history of a benchmark from a store (see --store): "python hopper.py query <store> [benchmark]".
+    Times are converted to milliseconds.
+    """
+    parser = argparse.ArgumentParser(prog='hopper.py query', description='Query the results in a hopper store.')
+    parser.add_argument('store')
+    parser.add_argument('benchmark', nargs='?', default=None)
+    parser.add_argument('--parameter', dest='parameter', default=None)
+    parser.add_argument('--run', dest='run', type=int, default=None)
+    parser.add_argument('--view', choices=('series', 'diff', 'summary'), default='series', dest='view')
+    args = parser.parse_args(argv)
+    if not os.path.isfile(args.store):
+        print_and_exit("store (%s) does not exist" % args.store)
+    store = StoreQuery(args.store)
+    try:
+        if not args.benchmark:
+            print "Run;Started;Host;Versions"
+            for run, started, host, versions in store.runs():
+                print "%s;%s;%s;%s" % (run, time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(started)), host, versions)
+            return
+        benchmarks = [b for b in store.benchmarks(args.benchmark) if args.parameter in (None, b[2])]
+        if not benchmarks:
+            print_and_exit("no results for benchmark (%s) in the store" % args.benchmark)
+        for benchmark, name, parameter, unit in benchmarks:
+            run = args.run or store.latest_run(benchmark)
+            factor = to_ms(unit)
+            series = [(version, sha, [v * (factor or 1.0) for v in values])
+                      for version, sha, values in store.series(benchmark, run)]
+            print "### %s (%s) in run %s, values in %s ###" % (name, parameter, run, 'ms' if factor else unit or '?')
+            print_query(args.view, series)
+    finally:
+        store.close()
+
+
+def print_query(view, series):
+    if view == 'series':
+        print "Version;SHA;N;Median;Mean;Stdev;Min;Max"
+        for version, sha, values in series:
+            s = stats.summary(values)
+            print "%s;%s;%s;%.6g;%.6g;%.6g;%.6g;%.6g" \
+                  % (version, sha, s['n'], s['median'], s['mean'], s['stdev'], s['min'], s['max'])
+    elif view == 'diff':
+        print "Version;SHA;Median;Change;P"
+        for (version, sha, change, p), (_, _, values) in zip(diffs(series), series):
+            print "%s;%s;%.6g;%s;%s" % (version, sha, stats.median(values),
+                                        '' if change is None else '%+.2f%%' % change, '' if p is None else '%.4g' % p)
+    elif series:
+        s = stats.summary([v for _, _, values in series for v in values])
+        first = stats.median(series[0][2])
+        last = stats.median(series[-1][2])
+        change = '%+.2f%%' % ((last - first) / abs(first) * 100) if first else ''
+        print "Versions;N;Median;Mean;Stdev;Min;Max;First;Last;Change"
+        print "%s;%s;%.6g;%.6g;%.6g;%.6g;%.6g;%.6g;%.6g;%s" % (len(series), s['n'], s['median'], s['mean'], s['stdev'],
+                                                              s['min'], s['max'], first, last, change)
+
 '''
 Beginning of main Hopper script.
 '''
+if len(sys.argv) > 1 and sys.argv[1] == 'query':
+    query(sys.argv[2:])
+    exit(0)
 # parse commandline parameters
 args = parse_cmd_params()
-with open(args.outfile, "w") as file:
+if not args.journal:
+    args.journal = args.outfile + ".journal"
+if not args.annotations:
+    args.annotations = args.outfile + ".annotations"
+if not args.output_format:
+    args.output_format = output.output_format(args.outfile)
+if output.missing_dependency(args.output_format):
+    print_and_exit("output format (%s) requires the python package %s"
+                   % (args.output_format, output.missing_dependency(args.output_format)))
+if args.output_format == output.ARROW:
+    out = ArrowDumper(args.outfile, args, append=args.resume)
+else:
+    out = output.open_output(args.outfile, args.output_format, append=args.resume)
+with closing(out) as file:
 
     ret = create_backend_runner(args)
     backend = ret['backend']
     runner = ret['runner']
+    args.placements = create_placements(args)
+    if args.placements:
+        runner.placement = args.placements[0]
+    Watchdog.configure(create_limits(args))
     custom_args = ret['custom_args']
 
     config = backend.config
+    cloud = None
+    annotations = None
     if args.cloud:
-        callback = CloudDumper(args.cloud[0])
+        cloud = CloudDumper(args.cloud[0], args.cloud_spool, args.cloud_batch_size * 1024, args.cloud_batch_interval)
+        callback = cloud
+    elif args.output_format == output.ARROW:
+        callback = file
     else:
-        callback = FileDumper(file, args, config)
+        annotations = open(args.annotations, "a" if args.resume else "w")
+        callback = FileDumper(file, args, config, header=not args.resume, annotations=annotations)
+    if not args.resume and os.path.isfile(args.journal):
+        os.remove(args.journal)
+    journal = Journal(args.journal)
+    store = SQLiteStore(args.store, args) if args.store else None
+    bad_commits = custom_args.get('bad-commits')
+    callback = CompositeCallback([callback, journal] + [c for c in (store, bad_commits) if c])
     versions = backend.generate_version_list(start=args.start, end=args.to, step=args.step, **custom_args)
+    if args.resume:
+        versions = journal.pending(versions)
     print "### We will be looking at %s distinct commits. ###" % len(versions)
     print versions
 
-    if args.type == 'benchmark':
-        parser = ResultParser.JMHJSON()
-        results = backend.walk(versions, runner, parser, args.tests, not args.invert, callback, **custom_args)
-    elif args.type == 'unit':
-        parser = ResultParser.JUnitSurefire()
-        results = backend.walk(versions, runner, parser, args.tests, not args.invert, callback, **custom_args)
-    else:
-        print_and_exit('unsupported type: ' + args.type)
+    trace_file = None
+    if args.trace:
+        trace_file = open(args.trace, "w")
+        tracing.start(tracing.Tracer(trace_file, args.trace_format))
+    try:
+        if args.type == 'benchmark':
+            parser = ResultParser.JMHJSON()
+            walk(args, backend, runner, parser, versions, callback, custom_args)
+        elif args.type == 'unit':
+            parser = ResultParser.JUnitSurefire()
+            try:
+                walk(args, backend, runner, parser, versions, callback, custom_args)
+            finally:
+                parser.close()
+        else:
+            print_and_exit('unsupported type: ' + args.type)
+    finally:
+        if cloud:
+            # upload everything that is still spooled
+            cloud.close()
+        if annotations:
+            annotations.close()
+        if store:
+            store.close()
+        if trace_file:
+            tracing.stop()
+            trace_file.close()
+    print_phases()
+    if bad_commits:
+        bad_commits.report(versions)
+
+    if 'build-cache' in custom_args:
+        print "### build cache: %s ###" % custom_args['build-cache'].stats()
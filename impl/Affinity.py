@@ -0,0 +1,112 @@
+import os
+import subprocess
+from distutils.spawn import find_executable
+
+_ONLINE_CPUS = "/sys/devices/system/cpu/online"
+
+
+def parse_cpus(spec):
+    """ parse_cpus parses a CPU list as used by taskset and the kernel (e.g. "2-3,6").
+    :return the sorted list of CPU numbers:
+    """
+    cpus = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        cpus.update(range(int(first), int(last or first) + 1))
+    return sorted(cpus)
+
+
+def format_cpus(cpus):
+    """ format_cpus is the inverse of parse_cpus, with ranges for consecutive CPUs.
+    """
+    parts = []
+    for cpu in sorted(cpus):
+        if parts and parts[-1][1] == cpu - 1:
+            parts[-1][1] = cpu
+        else:
+            parts.append([cpu, cpu])
+    return ','.join([str(a) if a == b else '%s-%s' % (a, b) for a, b in parts])
+
+
+def online_cpus():
+    """ online_cpus returns the CPUs the kernel currently runs processes on.
+    """
+    if os.path.isfile(_ONLINE_CPUS):
+        with open(_ONLINE_CPUS) as f:
+            return parse_cpus(f.read())
+    import multiprocessing
+    return range(0, multiprocessing.cpu_count())
+
+
+class Placement:
+    """ A Placement pins the measured JVMs (benchmarks and tests, not builds) to a set of CPUs, and optionally their
+    threads and memory to a NUMA node. The commands are launched with taskset, or, for a NUMA node, with numactl.
+
+    Pinning only keeps the measured JVMs on their CPUs; to keep everything else off them, hopper moves itself (and with
+    it all builds it starts afterwards) to the remaining CPUs (see isolate). Other processes of the machine are only
+    kept away by the kernel (isolcpus, or a cgroup cpuset reserved for the measurements).
+    """
+
+    TASKSET = "taskset"
+    NUMACTL = "numactl"
+
+    def __init__(self, cpus, numa_node=None):
+        """
+        :param cpus: the CPUs to run the measured JVMs on, as list or CPU list string (see parse_cpus)
+        :param numa_node: the NUMA node to bind the memory of the measured JVMs to, optional
+        """
+        self.cpus = parse_cpus(cpus) if isinstance(cpus, basestring) else sorted(cpus)
+        self.numa_node = numa_node
+        tool = Placement.NUMACTL if numa_node is not None else Placement.TASKSET
+        if not find_executable(tool):
+            raise RuntimeError("%s is required to pin the measured JVMs, but not installed" % tool)
+
+    def command(self, cmd):
+        """ command returns the given command, prefixed to run with this placement.
+        """
+        if self.numa_node is not None:
+            return [Placement.NUMACTL, "--physcpubind=%s" % format_cpus(self.cpus),
+                    "--membind=%s" % self.numa_node] + list(cmd)
+        return [Placement.TASKSET, "-c", format_cpus(self.cpus)] + list(cmd)
+
+    def __str__(self):
+        """ The placement as recorded with the results, e.g. "cpus=2-3 numa=0".
+        """
+        ret = "cpus=%s" % format_cpus(self.cpus)
+        if self.numa_node is not None:
+            ret += " numa=%s" % self.numa_node
+        return ret
+
+
+def isolate(placements):
+    """ isolate moves hopper (all of its threads) to the online CPUs that are not used by any of the placements, so that
+    hopper and the processes it starts without placement (e.g. builds) do not disturb the measurements.
+    :return the CPUs hopper runs on:
+    """
+    reserved = set()
+    for placement in placements:
+        reserved.update(placement.cpus)
+    online = online_cpus()
+    offline = reserved - set(online)
+    if offline:
+        raise RuntimeError("CPUs %s are not online" % format_cpus(offline))
+    remaining = [cpu for cpu in online if cpu not in reserved]
+    if not remaining:
+        raise RuntimeError("no CPUs left for hopper and builds, all online CPUs are reserved for measurements")
+    with open(os.devnull, 'w') as devnull:
+        subprocess.check_call([Placement.TASKSET, "-a", "-p", "-c", format_cpus(remaining), str(os.getpid())],
+                              stdout=devnull)
+    return remaining
+
+
+def stamp(benchmarks, placement):
+    """ stamp records the placement (if any) the benchmarks were measured with.
+    :return benchmarks:
+    """
+    if placement and benchmarks:
+        for b in benchmarks:
+            b.placement = str(placement)
+    return benchmarks
@@ -0,0 +1,239 @@
+import hashlib
+import json
+import os
+import re
+import subprocess
+import tempfile
+import threading
+import time
+
+import api.history as history
+import api.result as result
+from impl import BuildGuard
+
+# the statuses of versions that were not executed because they do not build (see result.Version.status)
+UNBUILDABLE = 'unbuildable'
+KNOWN_BAD = 'known-bad'
+
+# the failure classes of builds, and the patterns of the build output (Maven and Gradle) that identify them, in the
+# order they are checked: a broken pom also fails the dependency resolution, which also fails the compilation. A
+# missing artifact is a property of the commit, but the same resolution errors also wrap network failures (e.g. a
+# repository that is down), which are checked for before them
+NETWORK = 'network'
+FAILURE_CLASSES = (
+    ('pom', re.compile(r'Non-resolvable parent POM|Non-parseable POM|Malformed POM|ProjectBuildingException|'
+                       r'problems were encountered while processing the POMs')),
+    ('dependency', re.compile(r'Could not find artifact|Failure to find|Could not find [\w.-]+:[\w.-]+:')),
+    (NETWORK, re.compile(r'Could not transfer artifact|Could not resolve all|Could not (GET|HEAD) |'
+                         r'Connection (refused|reset|timed out)|Read timed out|UnknownHostException|'
+                         r'No route to host|Remote host (closed|terminated)')),
+    ('dependency', re.compile(r'Could not resolve dependencies|Failed to collect dependencies|'
+                              r'PluginResolutionException')),
+    ('compile', re.compile(r'COMPILATION ERROR|Compilation failure|Compilation failed')),
+)
+OTHER = 'build'
+# the failure classes that do not depend on the commit, and are therefore not recorded
+TRANSIENT = (NETWORK,)
+
+# the part of the build output that is classified, the end of the output has the summary of the failure
+_TAIL_SIZE = 256 * 1024
+_ERROR_LINE = re.compile(r'\[(ERROR|FATAL)\]|^FAILURE:|^\S+\.java:\d+: error:')
+_DIGEST_LINES = 10
+_DIGEST_LINE_LENGTH = 200
+
+
+class BadCommits(history.WalkerCallback):
+    """ BadCommits is a persistent registry of the commits that failed to build, with the class of the failure (see
+    FAILURE_CLASSES) and a digest of the build output. Walks skip the commits that are known to fail with the current
+    toolchain (see toolchain_fingerprint), instead of building them again; a commit is built again once the toolchain
+    changed, and removed from the registry if it builds.
+
+    As callback, BadCommits follows which versions of a walk were not built, to report the ranges of consecutive
+    unbuildable versions at its end (see report). Timeouts and other limits (see Watchdog) and network failures (see
+    TRANSIENT) are not recorded, as they depend on the machine rather than the commit. A single registry may be shared
+    by the workers of a parallel walk.
+    """
+
+    PATH = '{0}/tmp/hopper-files/bad-commits.json'.format(os.path.expanduser('~'))
+
+    def __init__(self, path, toolchain, retry=False):
+        """
+        :param path: The file to keep the registry in. Created if it does not exist.
+        :param toolchain: The fingerprint of the current toolchain, see toolchain_fingerprint.
+        :param retry: If True, known bad commits are built again (and their failures recorded again).
+        """
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.toolchain = toolchain
+        self.retry = retry
+        self.lock = threading.Lock()
+        self.commits = {}
+        if os.path.isfile(self.path):
+            with open(self.path) as file:
+                self.commits = json.load(file)['commits']
+        # version -> status of the versions of this walk that were not built, or None for the executed ones
+        self.walked = {}
+
+    def known_bad(self, sha):
+        """ known_bad returns the entry of a commit that failed to build with the current toolchain, None otherwise.
+        """
+        with self.lock:
+            entry = self.commits.get(str(sha))
+        if self.retry or not entry or entry['toolchain'] != self.toolchain:
+            return None
+        return entry
+
+    def record(self, sha, output, project=None, version=None):
+        """ record registers a failed build of a commit.
+        :param output: the (end of the) output of the build
+        """
+        failure, digest = classify(output)
+        if failure in TRANSIENT:
+            print "### version %s failed to build (%s), not recorded, it may build next time ###" % (version or sha,
+                                                                                                 failure)
+            return
+        print "### version %s failed to build (%s) ###" % (version or sha, failure)
+        with self.lock:
+            self.commits[str(sha)] = {'project': project, 'version': str(version or sha), 'failure': failure,
+                                      'digest': digest, 'toolchain': self.toolchain, 'time': time.time()}
+            self._write()
+
+    def succeeded(self, sha):
+        """ succeeded removes a commit that built (with a changed toolchain) from the registry.
+        """
+        with self.lock:
+            if self.commits.pop(str(sha), None):
+                self._write()
+
+    def version_failed(self, project, version):
+        self.walked[version] = None
+
+    def results_received(self, project, version, sha, results):
+        self.walked[version] = results.status if results.status in (UNBUILDABLE, KNOWN_BAD) else None
+
+    def ranges(self, versions):
+        """ ranges finds the runs of consecutive versions (in the order of the given list) that did not build in this
+        walk. Versions that were not walked end a run.
+        :return a list of (first version, last version, number of versions, number of known bad versions):
+        """
+        ret = []
+        run = []
+        for version in list(versions) + [None]:
+            status = self.walked.get(version) if version is not None else None
+            if status:
+                run.append(status)
+                if len(run) == 1:
+                    first = version
+                last = version
+            elif run:
+                ret.append((first, last, len(run), run.count(KNOWN_BAD)))
+                run = []
+        return ret
+
+    def report(self, versions):
+        """ report prints the ranges of unbuildable versions of this walk, see ranges.
+        """
+        ranges = self.ranges(versions)
+        for first, last, count, known in ranges:
+            print "### unbuildable: %s .. %s (%s versions, %s known before) ###" % (first, last, count, known)
+        skipped = sum([known for _, _, _, known in ranges])
+        if ranges:
+            print "### %s unbuildable versions in %s ranges, %s skipped as known bad (see %s) ###" \
+                  % (sum([count for _, _, count, _ in ranges]), len(ranges), skipped, self.path)
+
+    def _write(self):
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as file:
+            json.dump({'commits': self.commits}, file, indent=1, sort_keys=True)
+            file.flush()
+            os.fsync(file.fileno())
+        os.rename(tmp, self.path)
+
+
+def toolchain_fingerprint(commands, extra=None):
+    """ toolchain_fingerprint identifies the toolchain by the output of the given version commands (e.g. "mvn -v"),
+    and any extra values that influence whether a commit builds (e.g. the build type).
+    :return the fingerprint as hex string:
+    """
+    h = hashlib.sha1()
+    for cmd in commands:
+        try:
+            output = subprocess.check_output(cmd, stderr=subprocess.STDOUT)
+        except (OSError, subprocess.CalledProcessError) as e:
+            output = "%s failed: %s" % (cmd[0], e)
+        h.update(json.dumps([cmd, output]))
+    h.update(json.dumps(extra))
+    return h.hexdigest()[:16]
+
+
+def sources_fingerprint(directory):
+    """ sources_fingerprint identifies the contents of the files below directory, e.g. the sources of the benchmarks
+    that are built against every commit (see toolchain_fingerprint).
+    :return the fingerprint as hex string:
+    """
+    h = hashlib.sha1()
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames.sort()
+        for f in sorted(filenames):
+            path = os.path.join(dirpath, f)
+            h.update(json.dumps(os.path.relpath(path, directory)))
+            with open(path, 'rb') as file:
+                h.update(hashlib.sha1(file.read()).hexdigest())
+    return h.hexdigest()[:16]
+
+
+def classify(output):
+    """ classify determines the failure class of a failed build from its output.
+    :return a tuple (failure class, digest), where the digest are the first error lines of the output (or its last
+    lines, if there are none):
+    """
+    for failure, pattern in FAILURE_CLASSES:
+        if pattern.search(output):
+            break
+    else:
+        failure = OTHER
+    # the output may mix encodings, e.g. compiler messages
+    lines = [l.strip() for l in output.decode('utf-8', 'replace').splitlines() if l.strip()]
+    errors = [l for l in lines if _ERROR_LINE.search(l)]
+    digest = errors[:_DIGEST_LINES] if errors else lines[-_DIGEST_LINES:]
+    return failure, [l[:_DIGEST_LINE_LENGTH] for l in digest]
+
+
+def build(cmd, cwd, sha, registry=None, guard=None, project=None):
+    """ build executes a build command of a commit (see BuildGuard.call), and records a failure in the registry, if any.
+    :return True if the build succeeded:
+    """
+    log = tempfile.TemporaryFile() if registry else None
+    try:
+        ret = BuildGuard.call(cmd, cwd, guard, log)
+        if registry and ret == 0:
+            registry.succeeded(sha)
+        elif registry:
+            log.seek(max(0, log.tell() - _TAIL_SIZE))
+            registry.record(sha, log.read(), project)
+        return ret == 0
+    finally:
+        if log:
+            log.close()
+
+
+def skip(version, sha, entry):
+    """ skip returns the result of a version that is not built, because it is known to fail.
+    """
+    print "### skipping version %s, known to fail to build (%s) since %s ###" \
+          % (version, entry['failure'], time.strftime('%Y-%m-%d', time.localtime(entry['time'])))
+    return _failed(version, sha, KNOWN_BAD)
+
+
+def unbuildable(version, sha):
+    """ unbuildable returns the result of a version that failed to build.
+    """
+    return _failed(version, sha, UNBUILDABLE)
+
+
+def _failed(version, sha, status):
+    version_result = result.Version(version, sha)
+    version_result.status = status
+    return version_result
@@ -1,51 +1,88 @@
 import os
-from subprocess import call
 import xml.etree.ElementTree as ET
 
 import api.result as result
+import api.tracing as tracing
+from impl import Affinity, BadCommits, Watchdog
+
+
+def mvn_repo_args(project):
+    """ mvn_repo_args returns the Maven arguments that point Maven to the local repository of the given project config.
+    Parallel walks give every worker its own local repository, as otherwise workers would overwrite each others
+    installed SNAPSHOT artifacts.
+    :return a (potentially empty) list of Maven arguments:
+    """
+    mvn_repo = getattr(project, 'mvn_repo', None)
+    if mvn_repo:
+        return ["-Dmaven.repo.local=%s" % mvn_repo]
+    return []
+
 
 class BasicJMHRunner:
     ''' This runner is for projects that use Git/JMH/Gradle, such as RxJava. It reuses almost everything from the
      Git/JMH/Gradle backend, just with a slightly different way of compiling and figuring out versions.
     '''
 
-    JAVA_COMMAND = [os.environ['JAVA_HOME']+"/bin/java", "-jar",  "target/benchmarks.jar"]
+    JAVA_COMMAND = [os.environ['JAVA_HOME']+"/bin/java", "-jar"]
+    BENCHMARKS_JAR = "target/benchmarks.jar"
     JMH_ARGS = "%s -rf json -rff %s"
+    JMH_EXCLUDE = "-e"
     TMP_FILE = "tmp.json"
 
     MVN_COMMAND = "mvn"
     MVN_ARGS = ["clean", "install", "-DskipTests"]
 
-    def __init__(self, config):
+    def __init__(self, config, placement=None):
+        """
+        :param placement: the Affinity.Placement to run the benchmarks with, optional
+        """
         self.config = config
+        self.placement = placement
 
-    def run_benchmark(self, version, sha, parser, benchmarks=None):
-        self.run_jmh_test(benchmarks)
-        res = parser.parse_result(BasicJMHRunner.TMP_FILE)
+    def run_benchmark(self, version, sha, parser, benchmarks=None, excludes=None, jar=None):
+        tmp_file = os.path.join(self.config.project.jmh_root, BasicJMHRunner.TMP_FILE)
+        with tracing.phase(tracing.RUN):
+            self.run_jmh_test(benchmarks, excludes, jar)
+        with tracing.phase(tracing.PARSE):
+            res = parser.parse_result(tmp_file)
         if res:
             version_result = result.Version(version, sha)
-            version_result.benchmarks = res
+            version_result.benchmarks = Affinity.stamp(res, self.placement)
         else:
             version_result = None
-        if os.path.isfile(BasicJMHRunner.TMP_FILE):
-            os.remove(BasicJMHRunner.TMP_FILE)
+        if os.path.isfile(tmp_file):
+            os.remove(tmp_file)
         return version_result
 
-    def run_jmh_test(self, benchmarks):
+    def run_jmh_test(self, benchmarks, excludes=None, jar=None):
+        """ run_jmh_test runs the benchmarks jar built in the JMH root, or, if given, another benchmarks jar (e.g. one
+        that was kept from an earlier build).
+        """
         jhm_arg = BasicJMHRunner.JMH_ARGS % (self.config.arguments, BasicJMHRunner.TMP_FILE)
-        cmd = BasicJMHRunner.JAVA_COMMAND + jhm_arg.split()
+        cmd = BasicJMHRunner.JAVA_COMMAND + [jar or BasicJMHRunner.BENCHMARKS_JAR] + jhm_arg.split()
+        if excludes:
+            cmd = cmd + [BasicJMHRunner.JMH_EXCLUDE, excludes]
         if benchmarks:
             cmd = cmd + [benchmarks]
-        call(cmd)
+        if self.placement:
+            cmd = self.placement.command(cmd)
+        # a kept jar has a different path for every version
+        Watchdog.call(cmd, self.config.project.jmh_root, tracing.RUN, label=('jmh', benchmarks, excludes))
 
-    def prepare_version(self, project, version):
-        os.chdir(project.jmh_root)
-        self.update_pom(version)
-        call([BasicJMHRunner.MVN_COMMAND] + BasicJMHRunner.MVN_ARGS)
+    def prepare_version(self, project, version, guard=None, sha=None, registry=None):
+        """ prepare_version builds the benchmarks against the given version of the project.
+        :param sha: the commit of the project the benchmarks are built against, optional
+        :param registry: the BadCommits registry to record a failed build of the commit in, optional
+        :return True if the build succeeded:
+        """
+        with tracing.phase(tracing.BUILD, project='jmh'):
+            self.update_pom(version, os.path.join(project.jmh_root, 'pom.xml'))
+            return BadCommits.build([BasicJMHRunner.MVN_COMMAND] + BasicJMHRunner.MVN_ARGS + mvn_repo_args(project),
+                                    project.jmh_root, sha, registry if sha else None, guard, project.name)
 
-    def update_pom(self, version):
+    def update_pom(self, version, pom='pom.xml'):
         ET.register_namespace('', "http://maven.apache.org/POM/4.0.0")
-        tree = ET.parse('pom.xml')
+        tree = ET.parse(pom)
         version_tag = tree.find(".//{http://maven.apache.org/POM/4.0.0}target.version")
         version_tag.text = version
-        tree.write('pom.xml')
+        tree.write(pom)
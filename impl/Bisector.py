@@ -0,0 +1,138 @@
+import impl.Statistics as stats
+
+
+class MeanRule:
+    """ Decision rule that considers a version slow if the mean of its samples is closer to the mean of the bad
+    endpoint than to the mean of the good endpoint.
+    """
+
+    def differs(self, good, bad):
+        return stats.mean(good) != stats.mean(bad)
+
+    def is_slow(self, good, bad, samples):
+        m = stats.mean(samples)
+        return abs(m - stats.mean(bad)) < abs(m - stats.mean(good))
+
+    def __str__(self):
+        return "nearest mean"
+
+
+class MannWhitneyRule:
+    """ Decision rule that considers a version slow if its samples differ significantly from the samples of the good
+    endpoint (two-sided Mann-Whitney U test), and the median moved in the same direction as the one of the bad
+    endpoint.
+    """
+
+    def __init__(self, alpha=0.01):
+        self.alpha = alpha
+
+    def differs(self, good, bad):
+        return stats.mann_whitney_u(good, bad) < self.alpha
+
+    def is_slow(self, good, bad, samples):
+        if stats.mann_whitney_u(good, samples) >= self.alpha:
+            return False
+        direction = stats.median(bad) - stats.median(good)
+        return (stats.median(samples) - stats.median(good)) * direction > 0
+
+    def __str__(self):
+        return "Mann-Whitney U (alpha=%s)" % self.alpha
+
+
+RULES = {'mean': MeanRule, 'mwu': MannWhitneyRule}
+
+
+class Bisector:
+    """ The Bisector locates the first version that introduced a performance regression of a single benchmark.
+    Given a version list whose first version is known to be fast (good) and whose last version is known to be
+    slow (bad), it binary-searches the list and only executes about log2(n) versions instead of all of them.
+    """
+
+    def __init__(self, walker, testrunner, parser, rule, callback=None):
+        """
+        :param walker: The backend, used for the project name.
+        :param testrunner: The implementation of how to execute the benchmark.
+        :param parser: The parser used to extract results.
+        :param rule: The decision rule that classifies a measured version as fast or slow (see RULES).
+        :param callback: An optional callback that receives the results of every executed version.
+        """
+        self.walker = walker
+        self.testrunner = testrunner
+        self.parser = parser
+        self.rule = rule
+        self.callback = callback
+        self.measured = {}
+
+    def bisect(self, versions, benchmark, **kwargs):
+        """ Search the first slow version in versions.
+
+        :param versions: The versions to search, from the good to the bad endpoint.
+        :param benchmark: The name of the benchmark to execute and compare.
+        :return: A tuple of (last fast version, first slow version), or None if the endpoints can not be
+        told apart by the decision rule or the benchmark failed.
+        """
+        versions = list(versions)
+        kwargs = self.walker.run_args(kwargs)
+        good = self._measure(versions[0], benchmark, **kwargs)
+        bad = self._measure(versions[-1], benchmark, **kwargs)
+        if good is None or bad is None:
+            print "### bisect: failed to measure the endpoints ###"
+            return None
+        if not self.rule.differs(good, bad):
+            print "### bisect: no difference between %s and %s according to %s ###" \
+                  % (versions[0], versions[-1], self.rule)
+            return None
+        lo = 0
+        hi = len(versions) - 1
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            print "### bisect: %s versions left to search, trying %s ###" % (hi - lo - 1, versions[mid])
+            samples = self._measure(versions[mid], benchmark, **kwargs)
+            if samples is None:
+                # we can not classify this version, so treat it like git bisect skip and look at its neighbour
+                print "### bisect: skipping %s ###" % versions[mid]
+                del versions[mid]
+                hi -= 1
+                continue
+            if self.rule.is_slow(good, bad, samples):
+                hi = mid
+            else:
+                lo = mid
+        self.report(versions[0], versions[-1], versions[lo], versions[hi])
+        return versions[lo], versions[hi]
+
+    def report(self, good, bad, last_fast, first_slow):
+        print "### bisect: first slow version is %s (last fast version is %s), decided by %s, %s versions measured ###" \
+              % (first_slow, last_fast, self.rule, len(self.measured))
+        for label, version in (('good', good), ('last fast', last_fast), ('first slow', first_slow), ('bad', bad)):
+            s = stats.summary(self.measured[version])
+            print "### %s %s: n=%s mean=%s median=%s stdev=%s min=%s max=%s ###" \
+                  % (label, version, s['n'], s['mean'], s['median'], s['stdev'], s['min'], s['max'])
+
+    def _measure(self, version, benchmark, **kwargs):
+        if version in self.measured:
+            return self.measured[version]
+        if self.callback:
+            self.callback.version_started(self.walker.config.project.name, version)
+        res = self.testrunner.run(version, self.parser, benchmark, **kwargs)
+        samples = _samples(res, benchmark)
+        if samples is None:
+            if self.callback:
+                self.callback.version_failed(self.walker.config.project.name, version)
+            return None
+        if self.callback:
+            self.callback.results_received(self.walker.config.project.name, version, res.sha, res)
+        self.measured[version] = samples
+        return samples
+
+
+def _samples(res, benchmark):
+    """ _samples returns the raw values of the given benchmark in the version result. If the benchmark has more than
+    one parameter combination, the first one is used.
+    """
+    if not res or not res.benchmarks:
+        return None
+    for b in res.benchmarks:
+        if (b.benchmark == benchmark or b.benchmark.endswith('.' + benchmark)) and b.individual_results:
+            return list(b.individual_results)
+    return None
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+from impl import MvnPom
+
+
+class BuildCache:
+    """ BuildCache is a content-addressed cache of Maven build outputs. An entry is keyed by the git tree ids of the
+    build-relevant paths of a version (see GitRepoHandler.build_tree_ids) and contains the target/ directories of all
+    reactor modules as well as the artifacts they installed into the Maven local repository. Versions that only differ
+    in e.g. documentation or tests share the same key, and restoring their outputs replaces the Maven build.
+
+    The cache is bounded in size. If it grows above its maximum size, the least recently used entries are evicted.
+    A single cache may be shared by the workers of a parallel walk.
+    """
+
+    INDEX_FILE = "index.json"
+    TARGET_DIR = "target"
+    REPO_DIR = "repo"
+
+    def __init__(self, cache_dir, max_size):
+        """
+        :param cache_dir: The directory to keep the cache in. Created if it does not exist.
+        :param max_size: The maximum size of the cache in bytes.
+        """
+        self.dir = os.path.abspath(os.path.expanduser(cache_dir))
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if not os.path.isdir(self.dir):
+            os.makedirs(self.dir)
+        self.index = self._load_index()
+
+    def key(self, repo, sha, build_cmd):
+        """ key computes the cache key of a version.
+
+        :param repo: The GitRepoHandler of the project.
+        :param sha: The version to compute the key for.
+        :param build_cmd: The build arguments that influence the outputs (e.g. ['install', '-DskipTests']).
+        :return: The key as hex string.
+        """
+        h = hashlib.sha1()
+        h.update(json.dumps([build_cmd, repo.build_tree_ids(sha)]))
+        return h.hexdigest()
+
+    def restore(self, key, project):
+        """ restore replaces the build outputs of the checked out project with the cached ones.
+        :return True if there was an entry for key, False otherwise:
+        """
+        with self.lock:
+            if key not in self.index:
+                self.misses += 1
+                return False
+            self.index[key]['used'] = time.time()
+            meta = dict(self.index[key])
+            self._save_index()
+        entry = os.path.join(self.dir, key)
+        mvn_repo = _mvn_repo(project)
+        try:
+            for module in meta['modules']:
+                dst = os.path.join(project.dir, module, BuildCache.TARGET_DIR)
+                shutil.rmtree(dst, ignore_errors=True)
+                shutil.copytree(os.path.join(entry, BuildCache.TARGET_DIR, module), dst)
+            for artifact in meta['artifacts']:
+                dst = os.path.join(mvn_repo, artifact)
+                shutil.rmtree(dst, ignore_errors=True)
+                shutil.copytree(os.path.join(entry, BuildCache.REPO_DIR, artifact), dst)
+        except (IOError, OSError) as e:
+            # e.g. the entry was evicted by another worker in the meantime
+            print "### build cache: failed to restore %s: %s ###" % (key, e)
+            with self.lock:
+                self.misses += 1
+            return False
+        with self.lock:
+            self.hits += 1
+        print "### build cache: restored build outputs of %s ###" % key
+        return True
+
+    def store(self, key, project):
+        """ store adds the build outputs of the checked out and successfully built project to the cache. Projects
+        whose artifact coordinates can not be determined from the poms are not cached.
+        """
+        poms = MvnPom.reactor(project.dir)
+        if not poms or not all([pom.is_resolved() for pom in poms]):
+            return
+        mvn_repo = _mvn_repo(project)
+        tmp = os.path.join(self.dir, key + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        modules = []
+        artifacts = []
+        for pom in poms:
+            module = os.path.relpath(pom.dir, os.path.abspath(project.dir))
+            target = os.path.join(pom.dir, BuildCache.TARGET_DIR)
+            if os.path.isdir(target):
+                shutil.copytree(target, os.path.join(tmp, BuildCache.TARGET_DIR, module))
+                modules.append(module)
+            installed = pom.repo_path(mvn_repo)
+            if os.path.isdir(installed):
+                artifact = os.path.relpath(installed, mvn_repo)
+                shutil.copytree(installed, os.path.join(tmp, BuildCache.REPO_DIR, artifact))
+                artifacts.append(artifact)
+        if not modules:
+            return
+        with self.lock:
+            entry = os.path.join(self.dir, key)
+            shutil.rmtree(entry, ignore_errors=True)
+            os.rename(tmp, entry)
+            self.index[key] = {'size': _size(entry), 'used': time.time(), 'modules': modules, 'artifacts': artifacts}
+            self._evict()
+            self._save_index()
+
+    def stats(self):
+        return "%s hits, %s misses, %s evictions, %s entries using %s MB" \
+               % (self.hits, self.misses, self.evictions, len(self.index), self._total_size() / (1024 * 1024))
+
+    def _evict(self):
+        by_use = sorted(self.index.keys(), key=lambda k: self.index[k]['used'])
+        while self._total_size() > self.max_size and by_use:
+            key = by_use.pop(0)
+            shutil.rmtree(os.path.join(self.dir, key), ignore_errors=True)
+            del self.index[key]
+            self.evictions += 1
+
+    def _total_size(self):
+        return sum([e['size'] for e in self.index.values()])
+
+    def _load_index(self):
+        path = os.path.join(self.dir, BuildCache.INDEX_FILE)
+        if not os.path.isfile(path):
+            return {}
+        with open(path) as file:
+            index = json.load(file)
+        # drop entries whose directories vanished
+        return dict([(k, v) for k, v in index.iteritems() if os.path.isdir(os.path.join(self.dir, k))])
+
+    def _save_index(self):
+        path = os.path.join(self.dir, BuildCache.INDEX_FILE)
+        with open(path + ".tmp", "w") as file:
+            json.dump(self.index, file)
+        os.rename(path + ".tmp", path)
+
+
+def _mvn_repo(project):
+    mvn_repo = getattr(project, 'mvn_repo', None)
+    if mvn_repo:
+        return mvn_repo
+    return MvnPom.default_repo()
+
+
+def _size(path):
+    size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for f in filenames:
+            size += os.path.getsize(os.path.join(dirpath, f))
+    return size
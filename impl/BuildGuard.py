@@ -0,0 +1,112 @@
+import os
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from distutils.spawn import find_executable
+
+import api.tracing as tracing
+from impl import Watchdog
+
+
+class BuildGuard:
+    """ A BuildGuard keeps the builds of a pipelined walk (see Walker.iter_walk_pipelined) from disturbing the
+    measurements that run at the same time. Builds execute their commands through call, the walk wraps every
+    measurement in measuring. Depending on the mode, builds
+
+    * RUN: run at full speed during measurements,
+    * NICE: run with the lowest CPU (and, where ionice is available, I/O) priority, all the time,
+    * PAUSE: are suspended (SIGSTOP) while a measurement runs, and resumed (SIGCONT) afterwards. Build commands are
+      not started during a measurement.
+    """
+
+    RUN = 'run'
+    NICE = 'nice'
+    PAUSE = 'pause'
+    MODES = (RUN, NICE, PAUSE)
+
+    NICE_COMMAND = ["nice", "-n", "19"]
+    IONICE_COMMAND = ["ionice", "-c", "3"]
+
+    def __init__(self, mode=RUN):
+        self.mode = mode
+        self.cond = threading.Condition()
+        self.measurements = 0
+        self.processes = set()
+
+    def command(self, cmd):
+        """ command returns the given build command, prefixed to run with low priority in mode NICE.
+        """
+        if self.mode != BuildGuard.NICE:
+            return cmd
+        if find_executable(BuildGuard.IONICE_COMMAND[0]):
+            return BuildGuard.IONICE_COMMAND + BuildGuard.NICE_COMMAND + list(cmd)
+        return BuildGuard.NICE_COMMAND + list(cmd)
+
+    def call(self, cmd, cwd=None, log=None):
+        """ call executes a build command (within the limits of the Watchdog), like subprocess.call.
+        :param log: a file the output of the command is copied to, optional
+        :return the exit code of the command:
+        """
+        if self.mode != BuildGuard.PAUSE:
+            return Watchdog.call(self.command(cmd), cwd, tracing.BUILD, log=log)
+        started = []
+        with self.cond:
+            while self.measurements:
+                self.cond.wait(1)
+        try:
+            # the Watchdog starts the command in its own process group, so that its child processes (e.g. forked
+            # compilers) are suspended with it
+            return Watchdog.call(cmd, cwd, tracing.BUILD, lambda p: self._started(p, started), log)
+        finally:
+            with self.cond:
+                for process in started:
+                    self.processes.discard(process)
+
+    def _started(self, process, started):
+        with self.cond:
+            started.append(process)
+            self.processes.add(process)
+            if self.measurements:
+                # a measurement started while the command was launched
+                self._signal(signal.SIGSTOP, [process])
+
+    @contextmanager
+    def measuring(self):
+        """ measuring suspends the running builds (in mode PAUSE) for the duration of the enclosed measurement.
+        """
+        with self.cond:
+            self.measurements += 1
+            if self.mode == BuildGuard.PAUSE and self.measurements == 1:
+                self._signal(signal.SIGSTOP)
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.measurements -= 1
+                if not self.measurements:
+                    if self.mode == BuildGuard.PAUSE:
+                        self._signal(signal.SIGCONT)
+                    self.cond.notify_all()
+
+    def _signal(self, sig, processes=None):
+        for process in processes or self.processes:
+            try:
+                os.killpg(process.pid, sig)
+            except OSError:
+                # the build just finished
+                continue
+            # the time a build is suspended does not count towards its timeout, see Watchdog
+            if sig == signal.SIGSTOP:
+                process.stopped_at = time.time()
+            elif getattr(process, 'stopped_at', None):
+                process.suspended = getattr(process, 'suspended', 0.0) + time.time() - process.stopped_at
+                process.stopped_at = None
+
+
+def call(cmd, cwd=None, guard=None, log=None):
+    """ call executes a build command through the guard, if any, and within the limits of the Watchdog.
+    """
+    if guard:
+        return guard.call(cmd, cwd, log)
+    return Watchdog.call(cmd, cwd, tracing.BUILD, log=log)
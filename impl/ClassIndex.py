@@ -0,0 +1,268 @@
+import hashlib
+import json
+import os
+import re
+import struct
+import tempfile
+
+
+class ClassIndex:
+    """ ClassIndex is a static dependency index of the classes of a project: for every (top-level) class, it stores the
+    project classes it references directly, and which classes are tests (or benchmarks). Nested and anonymous classes
+    are folded into their top-level class, as changes are tracked per source file.
+
+    The index is built either from compiled bytecode (the class references in the constant pool of every class file)
+    or, if the classes are not compiled, from the sources (imports and references to classes of the same package).
+    Both miss dependencies that are only established at runtime (reflection, service loaders) and, for bytecode,
+    compile-time constants that javac inlines.
+    """
+
+    # increased whenever the way the index is built changes, which invalidates all cached indexes
+    VERSION = 1
+
+    BYTECODE = 'bytecode'
+    SOURCE = 'source'
+
+    def __init__(self, dependencies, tests):
+        """
+        :param dependencies: a dictionary class -> set of referenced classes
+        :param tests: the set of test (or benchmark) classes
+        """
+        self.dependencies = dependencies
+        self.tests = tests
+
+    @staticmethod
+    def build(mode, production_dirs, test_dirs, is_test):
+        """ build indexes the classes (mode BYTECODE) or sources (mode SOURCE) in the given directories.
+        :param production_dirs: the class output (or source) directories of the production code
+        :param test_dirs: the class output (or source) directories of the tests (or benchmarks)
+        :param is_test: a function (class, referenced classes) -> bool, which decides for a class in test_dirs whether
+        it is a test
+        """
+        read = _read_class if mode == ClassIndex.BYTECODE else _SourceReader(production_dirs + test_dirs).read
+        extension = '.class' if mode == ClassIndex.BYTECODE else '.java'
+        references = {}
+        candidates = set()
+        for dirs, test in ((production_dirs, False), (test_dirs, True)):
+            for path in _files(dirs, extension):
+                name, refs = read(path)
+                if not name:
+                    continue
+                references.setdefault(name, set()).update(refs)
+                if test:
+                    candidates.add(name)
+        tests = set([c for c in candidates if is_test(c, references[c])])
+        # only dependencies on classes of the project are of interest
+        dependencies = dict([(c, set([r for r in refs if r in references and r != c]))
+                             for c, refs in references.iteritems()])
+        return ClassIndex(dependencies, tests)
+
+    def affected(self, changed):
+        """ affected returns the tests that (transitively) reference one of the changed classes, or are changed
+        themselves.
+        """
+        dependents = {}
+        for c, refs in self.dependencies.iteritems():
+            for r in refs:
+                dependents.setdefault(r, []).append(c)
+        reached = set()
+        todo = list(changed)
+        while todo:
+            c = todo.pop()
+            if c in reached:
+                continue
+            reached.add(c)
+            todo.extend(dependents.get(c, []))
+        return reached & self.tests
+
+    def to_json(self):
+        return {'dependencies': dict([(c, sorted(refs)) for c, refs in self.dependencies.iteritems()]),
+                'tests': sorted(self.tests)}
+
+    @staticmethod
+    def from_json(data):
+        return ClassIndex(dict([(c, set(refs)) for c, refs in data['dependencies'].iteritems()]), set(data['tests']))
+
+
+class IndexCache:
+    """ IndexCache keeps the class indexes of the most recently indexed versions in a directory, one JSON file per
+    key (see key). The directory may be shared by the workers of a parallel walk.
+    """
+
+    def __init__(self, cache_dir, max_entries=50):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+
+    @staticmethod
+    def key(mode, tree_ids, extra=None):
+        """ key derives the cache key of an index from the way it is built and the git object ids of the indexed
+        source trees (see GitRepoHandler.build_tree_ids), plus anything else (e.g. sources outside of the repository)
+        the index depends on.
+        """
+        h = hashlib.sha1()
+        h.update(json.dumps([ClassIndex.VERSION, mode, tree_ids, extra]))
+        return h.hexdigest()
+
+    def get(self, key, build):
+        """ get returns the cached index for key, or builds it with the function build and caches it.
+        """
+        path = os.path.join(self.cache_dir, key + '.json')
+        if os.path.isfile(path):
+            with open(path) as file:
+                return ClassIndex.from_json(json.load(file))
+        index = build()
+        try:
+            os.makedirs(self.cache_dir)
+        except OSError:
+            if not os.path.isdir(self.cache_dir):
+                raise
+        # another worker may write the same index at the same time
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=self.cache_dir)
+        with os.fdopen(fd, 'w') as file:
+            json.dump(index.to_json(), file)
+        os.rename(tmp, path)
+        self._evict()
+        return index
+
+    def _evict(self):
+        entries = []
+        for f in os.listdir(self.cache_dir):
+            try:
+                if f.endswith('.json'):
+                    entries.append((os.path.getmtime(os.path.join(self.cache_dir, f)), f))
+            except OSError:
+                # evicted by another worker
+                continue
+        entries.sort()
+        for _, f in entries[:max(0, len(entries) - self.max_entries)]:
+            try:
+                os.remove(os.path.join(self.cache_dir, f))
+            except OSError:
+                continue
+
+
+def class_name(path):
+    """ class_name returns the (top-level) class defined in a Java source file, given its path below a source root
+    (e.g. src/main/java/org/example/Foo.java -> org.example.Foo), or None if the path is not in a source root.
+    """
+    for root in _SOURCE_ROOTS:
+        i = path.find(root)
+        if (i == 0 or (i > 0 and path[i - 1] == '/')) and path.endswith('.java'):
+            return path[i + len(root):-len('.java')].replace('/', '.')
+    return None
+
+
+_SOURCE_ROOTS = ['src/main/java/', 'src/test/java/']
+
+
+def _files(dirs, extension):
+    for d in dirs:
+        for dirpath, _, filenames in os.walk(d):
+            for f in filenames:
+                if f.endswith(extension):
+                    yield os.path.join(dirpath, f)
+
+
+def _top_level(name):
+    return name.replace('/', '.').split('$')[0]
+
+
+# the number of bytes of the constant pool entries (after the tag), except for Utf8 (1), Long (5) and Double (6)
+_CP_SIZES = {3: 4, 4: 4, 7: 2, 8: 2, 9: 4, 10: 4, 11: 4, 12: 4, 15: 3, 16: 2, 17: 4, 18: 4, 19: 2, 20: 2}
+_CP_UTF8 = 1
+_CP_CLASS = 7
+_CP_LONG = 5
+_CP_DOUBLE = 6
+# class names in field and method descriptors and in generic signatures
+_DESCRIPTOR_CLASS = re.compile(r'L([\w/$]+)[;<]')
+
+
+def _read_class(path):
+    """ _read_class reads the name of the class in a class file, and all classes it references: the class entries of
+    its constant pool, and the classes in the descriptors and signatures (including annotations) in it.
+    :return a tuple (top-level class, set of referenced top-level classes), or (None, None) for an invalid file:
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:4] != '\xca\xfe\xba\xbe':
+        return None, None
+    count = struct.unpack_from('>H', data, 8)[0]
+    utf8 = {}
+    classes = {}
+    pos = 10
+    i = 1
+    while i < count:
+        tag = ord(data[pos])
+        if tag == _CP_UTF8:
+            length = struct.unpack_from('>H', data, pos + 1)[0]
+            utf8[i] = data[pos + 3:pos + 3 + length]
+            pos += 3 + length
+        elif tag == _CP_CLASS:
+            classes[i] = struct.unpack_from('>H', data, pos + 1)[0]
+            pos += 3
+        elif tag in (_CP_LONG, _CP_DOUBLE):
+            # 8 byte constants take two entries
+            pos += 9
+            i += 1
+        else:
+            pos += 1 + _CP_SIZES[tag]
+        i += 1
+    this_class = struct.unpack_from('>H', data, pos + 2)[0]
+    refs = set()
+    for name_index in classes.itervalues():
+        name = utf8[name_index]
+        if name.startswith('['):
+            refs.update(_DESCRIPTOR_CLASS.findall(name))
+        else:
+            refs.add(name)
+    for value in utf8.itervalues():
+        if 'L' in value and ';' in value:
+            refs.update(_DESCRIPTOR_CLASS.findall(value))
+    return _top_level(utf8[classes[this_class]]), set([_top_level(r) for r in refs])
+
+
+class _SourceReader:
+    """ _SourceReader reads the class defined in a Java source file and the classes it references: explicitly imported
+    classes, classes of wildcard-imported packages, and classes of its own package, if their simple name occurs in the
+    file. Wildcard imports of packages outside of the project (e.g. org.openjdk.jmh.annotations.*) resolve to every
+    capitalized name in the file.
+    """
+
+    PACKAGE = re.compile(r'^\s*package\s+([\w.]+)\s*;', re.MULTILINE)
+    IMPORT = re.compile(r'^\s*import\s+(static\s+)?([\w.]+?)(\.\*)?\s*;', re.MULTILINE)
+    NAME = re.compile(r'\b[A-Z]\w*')
+
+    def __init__(self, dirs):
+        # source file -> class, and package -> simple names of the classes of the package
+        self.names = {}
+        self.packages = {}
+        for path in _files(dirs, '.java'):
+            name = self._name(path)
+            self.names[path] = name
+            package, _, simple = name.rpartition('.')
+            self.packages.setdefault(package, set()).add(simple)
+
+    def read(self, path):
+        name = self.names.get(path) or self._name(path)
+        with open(path) as f:
+            text = f.read()
+        names = set(_SourceReader.NAME.findall(text))
+        package = name.rpartition('.')[0]
+        refs = set([package + '.' + n for n in names & self.packages.get(package, set())])
+        for static, imported, wildcard in _SourceReader.IMPORT.findall(text):
+            if static:
+                # import static org.example.Foo.bar; or import static org.example.Foo.*;
+                refs.add(imported if wildcard else imported.rpartition('.')[0])
+            elif not wildcard:
+                refs.add(imported)
+            elif imported in self.packages:
+                refs.update([imported + '.' + n for n in names & self.packages[imported]])
+            else:
+                refs.update([imported + '.' + n for n in names])
+        return name, set([_top_level(r) for r in refs])
+
+    def _name(self, path):
+        with open(path) as f:
+            match = _SourceReader.PACKAGE.search(f.read())
+        simple = os.path.basename(path)[:-len('.java')]
+        return match.group(1) + '.' + simple if match else simple
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+
+
+class CommitIndex:
+    """ CommitIndex is a persistent index of the commit graph of a repository. For every commit, it stores the parent
+    links, the commit time and (once computed) the verdict whether the commit changes production code. The index is
+    updated incrementally: only commits that are not indexed yet are read from the repository.
+
+    Walks over the history (e.g., all commits between two versions, or the last commit before a date) are answered
+    from the index instead of walking the repository again.
+    """
+
+    FILE = "hopper-commits.json"
+
+    PARENTS = 0
+    TIME = 1
+    CODE = 2
+
+    def __init__(self, path, repo_handler):
+        """ Load the index from path, or start an empty one.
+
+        :param path: The file to keep the index in.
+        :param repo_handler: The GitRepoHandler of the indexed repository.
+        """
+        self.path = path
+        self.repo_handler = repo_handler
+        self.rules = _rules_digest(repo_handler)
+        self.commits = {}
+        self.dirty = False
+        if os.path.isfile(path):
+            with open(path) as file:
+                data = json.load(file)
+            self.commits = data['commits']
+            if data.get('rules') != self.rules:
+                # the code change heuristics changed, so all verdicts have to be recomputed
+                for entry in self.commits.values():
+                    entry[CommitIndex.CODE] = None
+                self.dirty = True
+
+    def update(self, tip):
+        """ update adds all commits reachable from tip that are not indexed yet.
+        :param tip: The full hash of the newest commit.
+        """
+        repo = self.repo_handler.pygit_repo
+        todo = [tip]
+        while todo:
+            sha = todo.pop()
+            if sha in self.commits:
+                continue
+            commit = repo[sha]
+            parents = [str(p) for p in commit.parent_ids]
+            self.commits[sha] = [parents, commit.commit_time, None]
+            self.dirty = True
+            todo.extend(parents)
+
+    def is_code(self, sha):
+        """ is_code returns whether the commit changes production code, computing and storing the verdict on first use.
+        """
+        entry = self.commits[sha]
+        if entry[CommitIndex.CODE] is None:
+            entry[CommitIndex.CODE] = self.repo_handler.is_code_commit(self.repo_handler.pygit_repo[sha])
+            self.dirty = True
+        return entry[CommitIndex.CODE]
+
+    def topological(self, end, start):
+        """ topological lists the commits reachable from end in topological order (children before parents),
+        stopping after start.
+        :return a list of full commit hashes, or None if start is not reachable from end:
+        """
+        reachable = self.reachable(end)
+        children = dict([(sha, 0) for sha in reachable])
+        for sha in reachable:
+            for p in self.commits[sha][CommitIndex.PARENTS]:
+                children[p] += 1
+        ret = []
+        todo = [end]
+        while todo:
+            sha = todo.pop()
+            ret.append(sha)
+            if sha == start:
+                return ret
+            # visit parents in reverse order, so that the first parent is visited first
+            for p in reversed(self.commits[sha][CommitIndex.PARENTS]):
+                children[p] -= 1
+                if children[p] == 0:
+                    todo.append(p)
+        return None
+
+    def reachable(self, tip):
+        seen = set()
+        todo = [tip]
+        while todo:
+            sha = todo.pop()
+            if sha in seen:
+                continue
+            seen.add(sha)
+            todo.extend(self.commits[sha][CommitIndex.PARENTS])
+        return seen
+
+    def times(self, tip):
+        """ times lists (commit time, full hash) of all commits reachable from tip, sorted by time.
+        """
+        return sorted([(self.commits[sha][CommitIndex.TIME], sha) for sha in self.reachable(tip)])
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as file:
+            json.dump({'rules': self.rules, 'commits': self.commits}, file)
+        os.rename(tmp, self.path)
+        self.dirty = False
+
+
+def _rules_digest(repo_handler):
+    h = hashlib.sha1()
+    h.update(json.dumps([repo_handler.PRODUCTION_CODE_DIRS, repo_handler.JAVADOC]))
+    return h.hexdigest()
@@ -1,14 +1,77 @@
 import api.history as history
-from google.cloud import storage
+import gzip
+import random
 import socket
 import os
+import threading
 import time
 
+# optional, only needed for the output formats ZSTD and ARROW
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+# the RawVal of a test that was not executed again for a version (see ImpactSelector)
+NOT_REMEASURED = "not-remeasured"
+
+# the columns of the annotations of the CSV outputs, see annotations
+ANNOTATIONS_HEADER = ("Project", "Version", "SHA", "Configuration", "Test", "Annotation", "Value")
+
+# output formats, see open_output and ArrowDumper
+CSV = 'csv'
+GZIP = 'gzip'
+ZSTD = 'zstd'
+ARROW = 'arrow'
+FORMATS = (CSV, GZIP, ZSTD, ARROW)
+_SUFFIXES = {'.gz': GZIP, '.zst': ZSTD, '.arrow': ARROW}
+
+
+def output_format(path):
+    """ output_format derives the output format from the suffix of the output file (.gz, .zst or .arrow), CSV otherwise.
+    """
+    return _SUFFIXES.get(os.path.splitext(path)[1], CSV)
+
+
+def missing_dependency(format):
+    """ missing_dependency returns the name of the package the output format requires, if it is not installed.
+    """
+    if format == ZSTD and not zstandard:
+        return 'zstandard'
+    if format == ARROW and not pyarrow:
+        return 'pyarrow'
+    return None
+
+
+def open_output(path, format=CSV, append=False):
+    """ open_output opens the output file of a FileDumper, (de)compressing with gzip or zstd. A compressed file that is
+    appended to gets another gzip member or zstd frame, which all decompressors read as one continuous stream.
+    :param format: CSV, GZIP or ZSTD
+    :return a writable file; flushing it writes everything written so far to the file (as complete compressed blocks):
+    """
+    mode = "a" if append else "w"
+    if format == GZIP:
+        return gzip.open(path, mode + "b")
+    if format == ZSTD:
+        return _ZstdFile(open(path, mode + "b"))
+    return open(path, mode)
+
+
 class FileDumper(history.WalkerCallback):
     """ Implementation of a FileDumper.py that dumps the intermediary results to a CSV file.
+
+    What the results say about how they were obtained (see annotations) is not part of the results, and written to a
+    separate annotations file, if given.
+
+    The files are flushed once per version (not per line), so a crashed walk loses at most the version in progress.
     """
 
-    def __init__(self, file, args=None, config=None):
+    def __init__(self, file, args=None, config=None, header=True, annotations=None):
         """ Initialize the file dumper with a given file handle. file needs to be set writable.
             Note that this class does nothing about opening or closing the file. The caller
             is responsible for making sure that the file is closed after usage (but not before).
@@ -18,14 +81,23 @@ class FileDumper(history.WalkerCallback):
         the file for tracking.
         :param config: If given, the config is used to write a comment at the beginning of
         the file for tracking.
+        :param header: If False, neither params, config nor the CSV headers are written, e.g. because
+        the file is appended to when resuming a walk.
+        :param annotations: If given, the annotations of the results are written to this file (again, not closed by the
+        dumper), as CSV with the columns ANNOTATIONS_HEADER.
         :return:
         """
         self.file = file
+        self.annotations = annotations
+        if not header:
+            return
         if args:
             self.write_params(args)
         if config:
             self.write_config(config)
         self.write_header()
+        if annotations:
+            annotations.write(_csv_line(ANNOTATIONS_HEADER))
 
     def results_received(self, project, version, sha, results):
 
@@ -33,13 +105,18 @@ class FileDumper(history.WalkerCallback):
             for b in results.benchmarks:
                 benchmark = b.benchmark
                 parameters = b.parameter
+                if not b.remeasured:
+                    self.write_line(project, version, sha, parameters, benchmark, NOT_REMEASURED)
                 for v in b.individual_results:
                     self.write_line(project, version, sha, parameters, benchmark, v)
+        self.file.flush()
+        if self.annotations:
+            self.annotations.write(''.join([_csv_line(a) for a in annotations(project, version, sha, results)]))
+            self.annotations.flush()
 
     def write_params(self, args):
         for key, val in vars(args).iteritems():
             self.file.write("# %s -> %s\n" % (key, val))
-        self.file.flush
 
     def write_config(self, config):
         # TODO: not yet implemented - add if actually necessary
@@ -55,49 +132,375 @@ class FileDumper(history.WalkerCallback):
         """ Write a line of content to the file.
         :return: None
         """
-        self.file.write("%s;%s;%s;%s;%s;%s\n"
-                        % (_stringify(project), _stringify(revision), _stringify(sha), _stringify(params), _stringify(test), _stringify(val)))
+        self.file.write(_csv_line((project, revision, sha, params, test, val)))
+
+
+class _ZstdFile:
+    """ A writable file that compresses with zstd. flush ends the current zstd block, close ends the frame.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.writer = zstandard.ZstdCompressor().stream_writer(file)
+
+    def write(self, data):
+        self.writer.write(data)
+
+    def flush(self):
+        self.writer.flush(zstandard.FLUSH_BLOCK)
+        self.file.flush()
+
+    def close(self):
+        self.writer.flush(zstandard.FLUSH_FRAME)
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ArrowDumper(history.WalkerCallback):
+    """ Implementation of a dumper that writes the results to a file in the Arrow IPC stream format, one record batch
+    per version. Unlike the CSV file, the result can be memory-mapped and read without parsing or copying, e.g. with
+    pyarrow.ipc.open_stream(pyarrow.memory_map(path)).read_all() (or .to_pandas()).
+
+    Every row is an individual result, with the columns of the CSV file (value is a double), plus remeasured (False
+    for the single row, without value, of a test that was not executed again), stop_reason (why the repetition of
+    a test stopped, see Sampling), failures and skipped (the number of executions of a test that failed or were
+    skipped, see JUnitSurefire), placement (the CPUs it was pinned to, see Affinity) and status (why the version was
+    stopped, see Watchdog; a stopped version has an additional row without test). A test without any value has a single
+    row without value. The commandline params are stored as metadata of the schema.
+
+    A stream has no footer, so a crashed walk leaves a file that is readable up to the last completely written version.
+    """
+
+    COLUMNS = (('project', 'string'), ('version', 'string'), ('sha', 'string'), ('configuration', 'string'),
+               ('test', 'string'), ('value', 'float64'), ('remeasured', 'bool_'), ('stop_reason', 'string'),
+               ('failures', 'int64'), ('skipped', 'int64'), ('placement', 'string'), ('status', 'string'))
+
+    def __init__(self, path, args=None, append=False):
+        """
+        :param path: The path of the output file. The file is opened (and closed in close) by the dumper.
+        :param args: If given, the commandline params are stored as metadata of the schema.
+        :param append: If True, the versions in an existing file are kept, e.g. when resuming a walk.
+        """
+        metadata = dict([(key, _stringify(val)) for key, val in vars(args).iteritems()]) if args else None
+        self.schema = pyarrow.schema([(name, getattr(pyarrow, type)()) for name, type in ArrowDumper.COLUMNS],
+                                     metadata=metadata)
+        kept = self._read_batches(path) if append and os.path.isfile(path) else []
+        # a stream cannot be continued, so the kept versions are copied into a new one
+        self.file = open(path + '.tmp', 'wb')
+        self.writer = pyarrow.ipc.RecordBatchStreamWriter(self.file, self.schema)
+        for batch in kept:
+            self.writer.write_batch(batch)
         self.file.flush()
-        
+        os.rename(path + '.tmp', path)
+
+    def results_received(self, project, version, sha, results):
+        if not results.benchmarks and not results.status:
+            return
+        columns = dict([(name, []) for name, _ in ArrowDumper.COLUMNS])
+        rows = []
+        for b in results.benchmarks:
+            values = list(b.individual_results)
+            if not b.remeasured or not values and (b.failures or b.skipped):
+                # a row without value, for a test that was not executed again, or only failed or was skipped
+                values.insert(0, None)
+            rows += [(b.parameter, b.benchmark, v, b.remeasured, b.stop_reason, b.failures, b.skipped, b.placement)
+                     for v in values]
+        if results.status:
+            # a single row, without test, records why the version was stopped
+            rows.append((None, None, None, None, None, None, None, None))
+        for parameter, benchmark, v, remeasured, stop_reason, failures, skipped, placement in rows:
+            columns['project'].append(_stringify(project))
+            columns['version'].append(_stringify(version))
+            columns['sha'].append(_stringify(sha))
+            columns['configuration'].append(_stringify(parameter) if benchmark else None)
+            columns['test'].append(_stringify(benchmark) if benchmark else None)
+            columns['value'].append(v)
+            columns['remeasured'].append(remeasured)
+            columns['stop_reason'].append(stop_reason)
+            columns['failures'].append(failures)
+            columns['skipped'].append(skipped)
+            columns['placement'].append(placement)
+            columns['status'].append(results.status)
+        arrays = [pyarrow.array(columns[field.name], type=field.type) for field in self.schema]
+        self.writer.write_batch(pyarrow.RecordBatch.from_arrays(arrays, [field.name for field in self.schema]))
+        self.file.flush()
+
+    def close(self):
+        self.writer.close()
+        self.file.close()
+
+    def _read_batches(self, path):
+        """ _read_batches reads the record batches of an existing file, up to the first incomplete one.
+        """
+        with open(path, 'rb') as file:
+            data = pyarrow.py_buffer(file.read())
+        batches = []
+        try:
+            for batch in pyarrow.ipc.open_stream(data):
+                batches.append(batch)
+        except Exception as e:
+            print "### %s is incomplete after %s versions (%s), the rest is dropped ###" % (path, len(batches), e)
+        return batches
+
+
 class CloudDumper(history.WalkerCallback):
-    """ Implementation of a CloudDumper.py that dumps the intermediary results to a CSV file in a bucket storage.
+    """ Implementation of a CloudDumper.py that dumps the intermediary results to CSV files in a bucket storage.
+
+    Results are never uploaded on the walk's critical path: results_received only spools them to a local directory,
+    and a background thread uploads them in batches, as soon as enough data is spooled or the oldest spooled
+    results waited long enough. Failed uploads are retried with exponential backoff; results stay spooled until they
+    are uploaded, even across walks (a walk uploads what previous walks left behind). Call close at the end of the
+    walk to upload the remaining results.
+
+    The annotations of the results (see annotations) are spooled and uploaded separately, as CSV files ending with
+    ANNOTATIONS_SUFFIX.
     """
 
-    def __init__(self, args):
-        """ Initialize the file dumper with a given file handle. file needs to be set writable.
-            Note that this class does nothing about opening or closing the file. The caller
-            is responsible for making sure that the file is closed after usage (but not before).
+    HEADER = ("Project", "Version", "SHA", "Configuration", "Test", "RawVal")
+    SPOOL_DIR = '{0}/tmp/hopper-files/cloud-spool'.format(os.path.expanduser('~'))
+    SPOOL_SUFFIX = ".csv"
+    ANNOTATIONS_SUFFIX = ".annotations"
+    LOCAL_BUCKET = "file://"
+
+    def __init__(self, args, spool_dir=None, batch_size=1024 * 1024, batch_interval=60, bucket=None, retries=5,
+                 backoff=1.0):
+        """ Initialize the cloud dumper and start its upload thread.
 
+        :param args: The bucket name and the path to the credentials JSON file, in any order. A bucket name
+        "file://<dir>" stores the results in a local directory instead (see LocalBucket).
+        :param spool_dir: The directory to spool the results to until they are uploaded.
+        :param batch_size: The number of spooled bytes that triggers an upload.
+        :param batch_interval: The number of seconds after which spooled results are uploaded, even if there are less
+        than batch_size bytes.
+        :param bucket: The bucket to upload to. If given, args are ignored.
+        :param retries: The number of attempts to upload a batch before giving up until the next batch.
+        :param backoff: The number of seconds to wait after the first failed attempt, doubled after every attempt.
         :return:
         """
-        bucket_name, credentials = (args[0], args[1]) if '.json' in args[1] else (args[1], args[0])
-        self.bucket = self.get_bucket(bucket_name, credentials)
-        
+        if bucket is None:
+            if '.json' in args[1] or args[0].startswith(CloudDumper.LOCAL_BUCKET):
+                bucket_name, credentials = args[0], args[1]
+            else:
+                bucket_name, credentials = args[1], args[0]
+            bucket = self.get_bucket(bucket_name, credentials)
+        self.bucket = bucket
+        self.spool_dir = os.path.expanduser(spool_dir or CloudDumper.SPOOL_DIR)
+        if not os.path.isdir(self.spool_dir):
+            os.makedirs(self.spool_dir)
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.retries = retries
+        self.backoff = backoff
+        self.host = socket.gethostname()
+        self.cond = threading.Condition()
+        self.closed = False
+        # after a batch failed all attempts, uploading pauses until this time
+        self.retry_at = 0
+        self.thread = threading.Thread(target=self._upload_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
     def get_bucket(self, bucket_name, credentials):
+        if bucket_name.startswith(CloudDumper.LOCAL_BUCKET):
+            return LocalBucket(bucket_name[len(CloudDumper.LOCAL_BUCKET):])
+        # only needed (and installed) if results are actually stored in Google Cloud Storage
+        from google.cloud import storage
         os.environ['GOOGLE_APPLICATION_CREDENTIALS']= credentials
         storage_client = storage.Client()
         return storage_client.get_bucket(bucket_name)
-        
+
     def results_received(self, project, version, sha, results):
-        
+
         if results.benchmarks:
-            store_string = self.write_line("Project", "Version", "SHA", "Configuration", "Test", "RawVal")
+            store_string = ""
             for b in results.benchmarks:
                 benchmark = b.benchmark
                 parameters = b.parameter
+                if not b.remeasured:
+                    store_string += self.write_line(project, version, sha, parameters, benchmark, NOT_REMEASURED)
                 for v in b.individual_results:
                     store_string += self.write_line(project, version, sha, parameters, benchmark, v)
-            t = str(time.time()).replace('.','')
-            tmp = socket.gethostname() + '-' + str(version) + '-' + str(t) + ".csv"
-            tmp_blob = self.bucket.blob(tmp)
-            tmp_blob.upload_from_string(store_string)
+            self.spool(version, store_string)
+        annotated = annotations(project, version, sha, results)
+        if annotated:
+            self.spool(version, ''.join([_csv_line(a) for a in annotated]), CloudDumper.ANNOTATIONS_SUFFIX)
+
+    def spool(self, version, content, suffix=SPOOL_SUFFIX):
+        """ spool durably writes the results (or, with ANNOTATIONS_SUFFIX, the annotations) of a version to the spool
+        directory, and wakes up the upload thread.
+        """
+        # names sort in the order the results were received
+        name = "%020d-%s%s" % (int(time.time() * 1e6), str(version).replace(os.sep, '_'), suffix)
+        path = os.path.join(self.spool_dir, name)
+        with open(path + '.tmp', 'w') as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        os.rename(path + '.tmp', path)
+        with self.cond:
+            self.cond.notify()
+
+    def close(self):
+        """ close uploads all spooled results (retrying failed uploads) and stops the upload thread.
+        """
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        # a join without timeout cannot be interrupted with Ctrl-C in Python 2
+        while self.thread.is_alive():
+            self.thread.join(1)
+        left = self._spooled()
+        if left:
+            print "### %s result files could not be uploaded, they are kept in %s for the next walk ###" \
+                  % (len(left), self.spool_dir)
 
     def write_line(self, project, revision, sha, params, test, val):
         """ Write a line of content to the file.
         :return: None
         """
-        store_string = "%s;%s;%s;%s;%s;%s\n" % (_stringify(project), _stringify(revision), _stringify(sha), _stringify(params), _stringify(test), _stringify(val))
-        return store_string
+        return _csv_line((project, revision, sha, params, test, val))
+
+    def _upload_loop(self):
+        while True:
+            with self.cond:
+                while not self.closed and not self._batch_ready():
+                    self.cond.wait(self._wait_time())
+                closed = self.closed
+            for suffix in (CloudDumper.SPOOL_SUFFIX, CloudDumper.ANNOTATIONS_SUFFIX):
+                if not self._upload_batches(suffix, closed):
+                    break
+            if closed:
+                return
+
+    def _upload_batches(self, suffix, closed):
+        """ _upload_batches uploads the spooled files with the suffix, until an upload fails.
+        :return True if all of them were uploaded:
+        """
+        for batch in self._batches(suffix):
+            if not self._upload(batch, suffix, closed):
+                self.retry_at = time.time() + self.batch_interval
+                return False
+        return True
+
+    def _batch_ready(self):
+        if time.time() < self.retry_at:
+            return False
+        files = self._spooled()
+        if not files:
+            return False
+        if sum([os.path.getsize(f) for f in files]) >= self.batch_size:
+            return True
+        return time.time() - os.path.getmtime(files[0]) >= self.batch_interval
+
+    def _wait_time(self):
+        files = self._spooled()
+        if time.time() < self.retry_at:
+            return self.retry_at - time.time()
+        if files:
+            return max(0.1, self.batch_interval - (time.time() - os.path.getmtime(files[0])))
+        return self.batch_interval
+
+    def _spooled(self, suffixes=(SPOOL_SUFFIX, ANNOTATIONS_SUFFIX)):
+        return sorted([os.path.join(self.spool_dir, f) for f in os.listdir(self.spool_dir)
+                       if f.endswith(suffixes)])
+
+    def _batches(self, suffix):
+        """ _batches splits the spooled files with the suffix into batches of about batch_size bytes, oldest first.
+        """
+        batches = []
+        batch = []
+        size = 0
+        for f in self._spooled((suffix,)):
+            batch.append(f)
+            size += os.path.getsize(f)
+            if size >= self.batch_size:
+                batches.append(batch)
+                batch = []
+                size = 0
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _upload(self, files, suffix, closing):
+        """ _upload uploads the spooled files as one CSV file, and removes them once uploaded. The name of the uploaded
+        file only depends on the spooled files, so that retrying an upload that actually succeeded does not duplicate
+        results.
+        :return True if the upload succeeded:
+        """
+        annotated = suffix == CloudDumper.ANNOTATIONS_SUFFIX
+        content = [_csv_line(ANNOTATIONS_HEADER if annotated else CloudDumper.HEADER)]
+        for f in files:
+            with open(f) as file:
+                content.append(file.read())
+        first = os.path.basename(files[0])[:-len(suffix)]
+        name = "%s-%s-%s%s.csv" % (self.host, first, len(files), CloudDumper.ANNOTATIONS_SUFFIX if annotated else '')
+        for attempt in range(0, self.retries):
+            try:
+                self.bucket.blob(name).upload_from_string(''.join(content))
+                for f in files:
+                    os.remove(f)
+                return True
+            except Exception as e:
+                print "### Upload of %s failed (attempt %s of %s): %s ###" % (name, attempt + 1, self.retries, e)
+                if attempt + 1 < self.retries:
+                    time.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+        return False
+
+
+class LocalBucket:
+    """ A stand-in for a Google Cloud Storage bucket that stores blobs as files in a local directory, e.g. to test a
+    walk with CloudDumper, or to collect the results of multiple machines on a shared file system.
+    """
+
+    def __init__(self, directory):
+        self.directory = os.path.expanduser(directory)
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def blob(self, name):
+        return _LocalBlob(os.path.join(self.directory, name))
+
+
+class _LocalBlob:
+
+    def __init__(self, path):
+        self.path = path
+
+    def upload_from_string(self, data):
+        with open(self.path + '.tmp', 'w') as file:
+            file.write(data)
+        os.rename(self.path + '.tmp', self.path)
+
+
+def annotations(project, version, sha, results):
+    """ annotations returns what the results of a version say about how they were obtained, rather than the measured
+    values, as rows (see ANNOTATIONS_HEADER) with one annotation each:
+
+    * stop_reason - why the repetition of a test stopped (see Sampling)
+    * failures, skipped - the number of executions of a test that failed or were skipped (see JUnitSurefire)
+    * placement - the CPUs the tests of the version were pinned to (see Affinity), without test
+    * status - why the version was not executed, or stopped (see Watchdog and BadCommits), without test
+    """
+    rows = []
+    for b in results.benchmarks:
+        for annotation, value in (('stop_reason', b.stop_reason), ('failures', b.failures), ('skipped', b.skipped)):
+            if value:
+                rows.append((project, version, sha, b.parameter, b.benchmark, annotation, value))
+    placements = sorted(set([b.placement for b in results.benchmarks if b.placement]))
+    rows += [(project, version, sha, '', '', 'placement', p) for p in placements]
+    if results.status:
+        rows.append((project, version, sha, '', '', 'status', results.status))
+    return rows
+
+
+def _csv_line(values):
+    return ';'.join([_stringify(v) for v in values]) + '\n'
+
 
 def _stringify(something):
     return unicode(something).encode('utf-8')
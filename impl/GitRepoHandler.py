@@ -1,8 +1,11 @@
+import bisect
 import os
 from subprocess import call, check_output
 import pygit2
 import re
 
+from impl.CommitIndex import CommitIndex
+
 class GitRepoHandler:
     """ This represents a Git repo, and can be used to check out specific versions, or ask
     questions such as 'which commits are between those two dates?' or 'Is this a code change
@@ -13,16 +16,24 @@ class GitRepoHandler:
 
     GIT = "git"
     GIT_REVLIST_CMD = "rev-list"
+    GIT_REVPARSE_CMD = "rev-parse"
     GIT_CHECKOUT_CMD = "checkout"
     GIT_RESET_CMD = ["reset", "--hard"]
+    GIT_WORKTREE_ADD_CMD = ["worktree", "add", "--detach"]
+    GIT_WORKTREE_REMOVE_CMD = ["worktree", "remove", "--force"]
+    GIT_WORKTREE_PRUNE_CMD = ["worktree", "prune"]
 
     PRODUCTION_CODE_DIRS = ['src/main/java', 'pom.xml']
+    # everything that goes into the build outputs of a Maven module
+    BUILD_PATHS = ['pom.xml', 'src/main']
+    NON_MODULE_DIRS = ['src', 'target', '.git']
     JAVADOC = '(^\s*\*)|(^\s*/\*\*)|(^\s*$)'
+    JAVADOC_RE = re.compile(JAVADOC)
 
     def __init__(self, repo_path):
         self.repo_path = repo_path
-        os.chdir(repo_path)
-        self.pygit_repo = pygit2.Repository('.git')
+        self.pygit_repo = pygit2.Repository(repo_path)
+        self._commit_index = None
 
     @staticmethod
     def is_code_change(diff):
@@ -31,9 +42,8 @@ class GitRepoHandler:
     @staticmethod
     def is_code_file(diff):
         for patch in diff:
-            for codedir in GitRepoHandler.PRODUCTION_CODE_DIRS:
-                if re.search(codedir, patch.delta.new_file.path):
-                    return True
+            if GitRepoHandler.is_code_path(patch.delta.new_file.path):
+                return True
         return False
 
     @staticmethod
@@ -44,54 +54,161 @@ class GitRepoHandler:
                 for line in hunk.lines:
                     origin = line.origin
                     if origin == '+' or origin == '-':
-                        if not re.search(GitRepoHandler.JAVADOC, line.content):
+                        if not GitRepoHandler.JAVADOC_RE.search(line.content):
                             return False
         return True
 
 
+    def build_tree_ids(self, version, paths=None):
+        """ build_tree_ids lists the git object ids of all build-relevant paths (BUILD_PATHS) of all Maven modules
+        of the given version. Two versions with identical lists produce identical build outputs.
+        :param paths: the paths to list instead of BUILD_PATHS, e.g. ['pom.xml'] to only list the poms
+        :return a sorted list of (path, object id) tuples:
+        """
+        ids = []
+        self._collect_build_tree_ids(self.pygit_repo.revparse_single(version).tree, '', ids,
+                                     paths or GitRepoHandler.BUILD_PATHS)
+        return sorted(ids)
+
+    def _collect_build_tree_ids(self, tree, prefix, ids, paths):
+        for path in paths:
+            try:
+                ids.append((prefix + path, str(tree[path].id)))
+            except KeyError:
+                pass
+        for entry in tree:
+            if entry.filemode == pygit2.GIT_FILEMODE_TREE and entry.name not in GitRepoHandler.NON_MODULE_DIRS:
+                self._collect_build_tree_ids(self.pygit_repo[entry.id], prefix + entry.name + '/', ids, paths)
+
+    def changed_paths(self, old, new):
+        """ changed_paths lists the paths of all files that differ between two versions (added, removed or modified).
+        :return a set of paths relative to the repository root:
+        """
+        old_tree = self.pygit_repo.revparse_single(old).tree
+        new_tree = self.pygit_repo.revparse_single(new).tree
+        if old_tree.id == new_tree.id:
+            return set()
+        paths = set()
+        for delta in old_tree.diff_to_tree(new_tree).deltas:
+            paths.add(delta.old_file.path)
+            paths.add(delta.new_file.path)
+        return paths
+
     def find_commits_between(self, start, end, codeonly):
         if start == end:
             return [start]
 
-        os.chdir(self.repo_path)
-
-        # for diff-ing, we need a full list of all commits in this time frame first
-        # I am sure there has got to be a better way to do this, but here we go
-        all_commits = [commit for commit in self.pygit_repo.walk(end, pygit2.GIT_SORT_TOPOLOGICAL)]
-
-        the_commits = []
-        i = 0
-        for commit in self.pygit_repo.walk(end, pygit2.GIT_SORT_TOPOLOGICAL):
-            use = True
-            next = all_commits[i+1]
-            if codeonly:
-                diff = commit.tree.diff_to_tree(next.tree)
-                use = GitRepoHandler.is_code_change(diff)
-            if use:
-                the_commits.append(str(commit.id)[:7])
-            i += 1
-            if str(commit.id).startswith(start):
-                the_commits.reverse()
-                return the_commits
+        index = self.commit_index()
+        end_id = str(self.pygit_repo.revparse_single(end).id)
+        start_id = str(self.pygit_repo.revparse_single(start).id)
+        index.update(end_id)
+        commits = index.topological(end_id, start_id)
+        if commits is None:
+            index.save()
+            return None
+        the_commits = [sha[:7] for sha in commits if not codeonly or index.is_code(sha)]
+        index.save()
+        the_commits.reverse()
+        return the_commits
+
+    def commit_index(self):
+        """ commit_index returns the persistent commit index of this repository, loading it on first use. The index is
+        kept in the common git dir, so it is shared by all worktrees (and survives their removal).
+        """
+        if not self._commit_index:
+            self._commit_index = CommitIndex(os.path.join(self.common_dir(), CommitIndex.FILE), self)
+        return self._commit_index
+
+    def common_dir(self):
+        """ common_dir returns the git dir of the repository, which is shared by all of its worktrees (the git dir of a
+        worktree, e.g. .git/worktrees/<name>, only holds its checkout state).
+        """
+        git_dir = self.pygit_repo.path
+        commondir_file = os.path.join(git_dir, 'commondir')
+        if not os.path.isfile(commondir_file):
+            return git_dir
+        with open(commondir_file) as f:
+            return os.path.normpath(os.path.join(git_dir, f.read().strip()))
+
+    def is_code_commit(self, commit):
+        """ is_code_commit decides whether a commit changes production code compared to its first parent. This
+        first lets libgit2 compare the trees, which skips all subtrees with unchanged object ids without reading
+        them, and only looks at the changed lines (to tell Javadoc changes apart) if a production code path changed.
+        """
+        if not commit.parents:
+            return True
+        parent = commit.parents[0]
+        if parent.tree.id == commit.tree.id:
+            return False
+        diff = parent.tree.diff_to_tree(commit.tree)
+        code_deltas = [i for i, delta in enumerate(diff.deltas) if GitRepoHandler.is_code_path(delta.new_file.path)
+                       or GitRepoHandler.is_code_path(delta.old_file.path)]
+        if not code_deltas:
+            return False
+        return not GitRepoHandler.is_javadoc_change([diff[i] for i in code_deltas])
+
+    @staticmethod
+    def is_code_path(path):
+        for codedir in GitRepoHandler.PRODUCTION_CODE_DIRS:
+            if codedir in path:
+                return True
+        return False
 
     def reset(self):
-        os.chdir(self.repo_path)
-        call([GitRepoHandler.GIT] + GitRepoHandler.GIT_RESET_CMD)
+        call([GitRepoHandler.GIT] + GitRepoHandler.GIT_RESET_CMD, cwd=self.repo_path)
 
     def checkout_commit(self, version):
-        os.chdir(self.repo_path)
-        call([GitRepoHandler.GIT] + [GitRepoHandler.GIT_CHECKOUT_CMD] + [version])
+        call([GitRepoHandler.GIT] + [GitRepoHandler.GIT_CHECKOUT_CMD] + [version], cwd=self.repo_path)
         return version
 
     def checkout_time(self, version):
-        os.chdir(self.repo_path)
         # find out the Git version hash for the revision at this date
-        # (note that this only considers master, not other branches)
+        # (note that this only considers master, not other branches). Walks resolve all of their dates up front (see
+        # resolve_dates), so this is only the fallback for single dates, which does not need the commit index.
         checkout_params = ["-n1", "--before=%s" % version, "origin/master"]
         revision_id = check_output(
-            [GitRepoHandler.GIT, GitRepoHandler.GIT_REVLIST_CMD] + checkout_params
+            [GitRepoHandler.GIT, GitRepoHandler.GIT_REVLIST_CMD] + checkout_params, cwd=self.repo_path
         ).strip()
 
         # now check out the revision with this hash
-        call([GitRepoHandler.GIT, GitRepoHandler.GIT_CHECKOUT_CMD, revision_id])
-        return revision_id[:7]
\ No newline at end of file
+        call([GitRepoHandler.GIT, GitRepoHandler.GIT_CHECKOUT_CMD, revision_id], cwd=self.repo_path)
+        return revision_id[:7]
+
+    def resolve_dates(self, dates, branch="origin/master"):
+        """ resolve_dates maps each of the given dates to the last commit on branch before this date, just like
+        rev-list --before does for a single date. All dates are resolved from the commit index.
+        :return a dictionary from date to (abbreviated) commit hash; dates before the first commit are left out:
+        """
+        if not dates:
+            return {}
+        # let git interpret the dates, so that they mean exactly the same as for rev-list --before
+        cutoffs = check_output(
+            [GitRepoHandler.GIT, GitRepoHandler.GIT_REVPARSE_CMD] + ["--before=%s" % d for d in dates], cwd=self.repo_path
+        ).split()
+        cutoffs = [int(c.split('=')[1]) for c in cutoffs]
+        tip = str(self.pygit_repo.revparse_single(branch).id)
+        commit_index = self.commit_index()
+        commit_index.update(tip)
+        commit_index.save()
+        commits = commit_index.times(tip)
+        times = [t for t, _ in commits]
+        index = {}
+        for date, cutoff in zip(dates, cutoffs):
+            i = bisect.bisect_right(times, cutoff)
+            if i > 0:
+                index[date] = commits[i - 1][1][:7]
+        return index
+
+    def add_worktree(self, path):
+        """ Create a detached git worktree of this repository at the given path. A worktree has its own
+        checkout and index, so different versions can be checked out in different worktrees at the same time.
+        """
+        self.remove_worktree(path)
+        call([GitRepoHandler.GIT] + GitRepoHandler.GIT_WORKTREE_ADD_CMD + [path], cwd=self.repo_path)
+        return path
+
+    def remove_worktree(self, path):
+        if os.path.isdir(path):
+            call([GitRepoHandler.GIT] + GitRepoHandler.GIT_WORKTREE_REMOVE_CMD + [path], cwd=self.repo_path)
+        # forget about worktrees whose directories vanished (e.g. removed by hand or by a crashed walk)
+        call([GitRepoHandler.GIT] + GitRepoHandler.GIT_WORKTREE_PRUNE_CMD, cwd=self.repo_path)
\ No newline at end of file
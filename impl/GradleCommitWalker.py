@@ -1,8 +1,10 @@
+import os
 import re
-from subprocess import check_output
+from subprocess import CalledProcessError
 
-from impl import MvnGit
-from impl.BasicJMHRunner import BasicJMHRunner
+import api.tracing as tracing
+from impl import BadCommits, MvnGit, Watchdog
+from impl.BasicJMHRunner import BasicJMHRunner, mvn_repo_args
 from impl.GitRepoHandler import GitRepoHandler
 
 class GradleJMHGitRunner(MvnGit.JMHRunner):
@@ -14,24 +16,58 @@ class GradleJMHGitRunner(MvnGit.JMHRunner):
 
     def __init__(self, config):
         self.config = config
+        self.placement = None
 
     def run(self, version, parser, run=None, **kwargs):
+        sha = None
         try:
-            sha = MvnGit.checkout_version(self.config.project.dir, version, kwargs['mode'])
-            self.fix_gradle_config()    # we use this to fix an issue in older RxJava configurations
-            mvn_version = self.compile_version()
-            print "Found Mvn version %s" % mvn_version
-            jmh = BasicJMHRunner(self.config)
-            jmh.prepare_version(self.config.project, mvn_version)
-            version_result = jmh.run_benchmark(version, sha, parser, run)
-            self.reset_git()
+            sha = MvnGit.checkout_version(self.config.project.dir, version, kwargs['mode'], kwargs.get('time-index'))
+            registry = kwargs.get('bad-commits')
+            known = registry.known_bad(sha) if registry else None
+            if known:
+                return BadCommits.skip(version, sha, known)
+            jmh = self._build_jmh(sha, **kwargs)
+            if jmh:
+                version_result = jmh.run_benchmark(version, sha, parser, run)
+            else:
+                version_result = BadCommits.unbuildable(version, sha)
+            with tracing.phase(tracing.CHECKOUT):
+                self.reset_git()
             return version_result
+        except Watchdog.Expired as e:
+            with tracing.phase(tracing.CHECKOUT):
+                self.reset_git()
+            return e.result(version, sha)
         except Exception as e:
             print "Failed to run benchmark for version %s: %s" % (str(version), e.message)
             return None
 
+    def prepare(self, version, parser, run=None, **kwargs):
+        prepared = MvnGit.JMHRunner.prepare(self, version, parser, run, **kwargs)
+        with tracing.phase(tracing.CHECKOUT):
+            self.reset_git()
+        return prepared
+
+    def _build_jmh(self, sha, **kwargs):
+        registry = kwargs.get('bad-commits')
+        with tracing.phase(tracing.BUILD):
+            self.fix_gradle_config()    # we use this to fix an issue in older RxJava configurations
+            try:
+                mvn_version = self.compile_version()
+            except CalledProcessError as e:
+                print "Gradle build failed for version %s" % sha
+                if registry:
+                    registry.record(sha, e.output, self.config.project.name)
+                return None
+        print "Found Mvn version %s" % mvn_version
+        jmh = BasicJMHRunner(self.config, self.placement)
+        if not jmh.prepare_version(self.config.project, mvn_version, kwargs.get('build-guard'), sha, registry):
+            return None
+        return jmh
+
     def compile_version(self):
-        output_string = check_output([GradleJMHGitRunner.GRADLE_COMMAND] + GradleJMHGitRunner.GRADLE_ARGS)
+        cmd = [GradleJMHGitRunner.GRADLE_COMMAND] + GradleJMHGitRunner.GRADLE_ARGS + mvn_repo_args(self.config.project)
+        output_string = Watchdog.check_output(cmd, self.config.project.dir, tracing.BUILD)
         match = re.search(GradleJMHGitRunner.GRADLE_VERSION_PATTERN, output_string)
         if not match:
             print "Failed inferring version from Gradle output"
@@ -48,9 +84,10 @@ class GradleJMHGitRunner(MvnGit.JMHRunner):
         repo.reset()
 
     def fix_gradle_config(self):
-        with open("build.gradle", "r") as file:
+        build_file = os.path.join(self.config.project.dir, "build.gradle")
+        with open(build_file, "r") as file:
             file_content = file.read()
         file_content = file_content.replace('\ndependencies {', '\ndependencies {\n  apply plugin: "java"')
-        with open("build.gradle", "w") as file:
+        with open(build_file, "w") as file:
             file.write(file_content)
             file.flush()
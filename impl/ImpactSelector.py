@@ -0,0 +1,117 @@
+import os
+import re
+
+import api.result as result
+from impl.ClassIndex import ClassIndex, IndexCache, class_name
+from impl.GitRepoHandler import GitRepoHandler
+
+
+def surefire_test(name, references):
+    """ surefire_test decides whether a test class is executed by Surefire's default includes (Test*, *Test, *Tests,
+    *TestCase).
+    """
+    simple = name.rpartition('.')[2]
+    return simple.startswith('Test') or simple.endswith('Test') or simple.endswith('Tests') \
+        or simple.endswith('TestCase')
+
+
+JMH_BENCHMARK = 'org.openjdk.jmh.annotations.Benchmark'
+
+
+def jmh_benchmark(name, references):
+    """ jmh_benchmark decides whether a class contains JMH benchmarks (i.e. references the @Benchmark annotation).
+    """
+    return JMH_BENCHMARK in references and '.jmh_generated.' not in name
+
+
+def class_pattern(classes):
+    """ class_pattern returns a regular expression that matches the benchmarks (class.method) of the given classes.
+    """
+    return '^(%s)\.' % '|'.join([re.escape(c) for c in sorted(classes)])
+
+
+class ImpactSelector:
+    """ ImpactSelector selects the tests (or benchmarks) to execute for a version: only the ones that (transitively)
+    reference a class that changed since the previously measured version. The dependencies are taken from a class index
+    (see ClassIndex), which is cached per version.
+
+    Tests that are not selected are not measured again. For them, the results of a version carry a result without
+    values that is marked as not re-measured (Benchmark.remeasured).
+    """
+
+    CACHE_DIR = "hopper-class-index"
+
+    def __init__(self, repo_dir, mode, is_test):
+        """
+        :param repo_dir: the directory of the git repository of the project
+        :param mode: how the class index is built, ClassIndex.BYTECODE or ClassIndex.SOURCE
+        :param is_test: decides whether a class is a test, see surefire_test and jmh_benchmark
+        """
+        self.repo = GitRepoHandler(repo_dir)
+        self.mode = mode
+        self.is_test = is_test
+        # the common git dir is shared by the worktrees of parallel walks (and survives their removal)
+        self.cache = IndexCache(os.path.join(self.repo.common_dir(), ImpactSelector.CACHE_DIR))
+        # the previously measured version, and the results (benchmark, parameter) measured so far per test class
+        self.measured = None
+        self.known = {}
+        self.tests = set()
+
+    def select(self, sha, production_dirs, test_dirs, extra=None, full=False):
+        """ select decides which tests to execute for the checked out (and, for ClassIndex.BYTECODE, built) version sha.
+        :param production_dirs: the class output (or source) directories of the production code
+        :param test_dirs: the class output (or source) directories of the tests or benchmarks
+        :param extra: anything the index depends on in addition to the sources of the repository (see IndexCache.key)
+        :param full: if True, all tests are executed, e.g. because the checked out sources have changes that are not
+        committed, and therefore not part of the diff to the previously measured version
+        :return the set of selected test classes, or None if all tests have to be executed:
+        """
+        key = IndexCache.key(self.mode, self.repo.build_tree_ids(sha, ['src/main', 'src/test']), extra)
+        index = self.cache.get(key, lambda: ClassIndex.build(self.mode, production_dirs, test_dirs, self.is_test))
+        self.tests = index.tests
+        if self.measured is None or full:
+            return None
+        changed = self.changed_classes(sha)
+        if changed is None:
+            return None
+        return index.affected(changed)
+
+    def changed_classes(self, sha):
+        """ changed_classes returns the classes whose sources changed since the previously measured version, or None if
+        files changed that can not be attributed to classes (e.g. poms or resources), which may affect any test.
+        """
+        changed = set()
+        for path in self.repo.changed_paths(self.measured, sha):
+            name = class_name(path)
+            if name:
+                changed.add(name)
+            elif os.path.basename(path) == 'pom.xml' or '/src/' in '/' + path:
+                return None
+        return changed
+
+    def measured_results(self, sha, benchmarks, selected):
+        """ measured_results records sha as measured, and adds a not re-measured result for every known result of a test
+        class that was not selected.
+        :param benchmarks: the results of the executed tests
+        :param selected: the return value of select
+        :return the results including the not re-measured ones:
+        """
+        self.measured = sha
+        benchmarks = list(benchmarks or [])
+        for b in benchmarks:
+            self.known.setdefault(test_class(b.benchmark), set()).add((b.benchmark, b.parameter))
+        if selected is None:
+            return benchmarks
+        for test in sorted(self.tests - selected):
+            for benchmark, parameter in sorted(self.known.get(test, [])):
+                b = result.Benchmark(benchmark, parameter)
+                b.remeasured = False
+                benchmarks.append(b)
+        return benchmarks
+
+
+def test_class(name):
+    """ test_class returns the top-level class of a test (org.example.FooTest.testBar) or benchmark
+    (org.example.FooBenchmark.bar).
+    """
+    return name.rpartition('.')[0].split('$')[0]
@@ -0,0 +1,55 @@
+import json
+import os
+import threading
+
+import api.history as history
+
+
+class Journal(history.WalkerCallback):
+    """ Implementation of a checkpoint journal that records which versions of a walk are in progress, completed or
+    failed. The journal is rewritten atomically after every state change, so it survives crashes of hopper (and of
+    the machine) and can be used to resume an interrupted walk.
+    """
+
+    IN_PROGRESS = "in-progress"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+    def __init__(self, path):
+        """ Open the journal at the given path. An existing journal is loaded, otherwise an empty one is started.
+
+        :param path: The file to keep the journal in.
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.versions = {}
+        if os.path.isfile(path):
+            with open(path) as file:
+                self.versions = json.load(file)['versions']
+
+    def pending(self, versions):
+        """ pending removes all versions from the given list that were completed or failed in a previous walk.
+        Versions that were in progress when the previous walk was interrupted are kept, so that they are retried.
+        :return the list of versions that still have to be executed:
+        """
+        return [v for v in versions if self.versions.get(str(v)) not in (Journal.COMPLETED, Journal.FAILED)]
+
+    def version_started(self, project, version):
+        self._record(version, Journal.IN_PROGRESS)
+
+    def version_failed(self, project, version):
+        self._record(version, Journal.FAILED)
+
+    def results_received(self, project, version, sha, results):
+        # a version that was stopped by the Watchdog is not retried either
+        self._record(version, Journal.FAILED if results.status else Journal.COMPLETED)
+
+    def _record(self, version, state):
+        with self.lock:
+            self.versions[str(version)] = state
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as file:
+                json.dump({'versions': self.versions}, file)
+                file.flush()
+                os.fsync(file.fileno())
+            os.rename(tmp, self.path)
@@ -1,4 +1,5 @@
 import datetime
+import os
 
 import untangle
 
@@ -13,6 +14,10 @@ class MvnCommitWalker(history.Walker):
 
     def __init__(self, config_file):
         self.config = self.parse_config(config_file)
+        # in time-mode: maps every date to the commit that was checked in at this date
+        self.time_index = {}
+        # in time-mode: maps the first date of a run of dates with the same commit to all dates of the run
+        self.covered_dates = {}
 
     def parse_config(self, config_file):
         return Configuration(config_file)
@@ -35,12 +40,45 @@ class MvnCommitWalker(history.Walker):
             if not end:
                 end = self.config.project.end
             versions = MvnCommitWalker.dates_between(start, end)
+            if step:
+                versions = versions[0::step]
+            self.time_index = repo.resolve_dates(versions)
+            return self.collapse_dates(versions)
         else:
             raise RuntimeError("Mode not yet implemented.")
         if step:
             versions = versions[0::step]
         return versions
 
+    def collapse_dates(self, dates):
+        """ collapse_dates collapses consecutive dates that resolve to the same commit (according to the time index)
+        into the first date of the run. The results of this date are later fanned out to all dates of the run.
+        :return the first dates of all runs:
+        """
+        self.covered_dates = {}
+        versions = []
+        previous = None
+        for date in dates:
+            sha = self.time_index.get(date)
+            if sha and sha == previous:
+                self.covered_dates[versions[-1]].append(date)
+                continue
+            versions.append(date)
+            self.covered_dates[date] = [date]
+            previous = sha
+        if len(versions) < len(dates):
+            print "### %s dates resolve to %s distinct commits. ###" % (len(dates), len(versions))
+        return versions
+
+    def expand(self, version):
+        return self.covered_dates.get(version, [version])
+
+    def run_args(self, kwargs):
+        if self.time_index:
+            kwargs = dict(kwargs)
+            kwargs['time-index'] = self.time_index
+        return kwargs
+
     @staticmethod
     def dates_between(start, end):
         """ Helper method that lists all the dates between a start and end date.
@@ -87,7 +125,10 @@ class ProjectConfig:
         self.name = str(config.project["name"])
         self.dir = str(config.project["dir"])
         self.jmh_root = str(config.project.jmh_root["dir"])
+        # the Maven local repository to build against, None means Maven's default (~/.m2/repository)
+        self.mvn_repo = None
         self._add_junit(config)
+        self._add_sampling(config)
         self.start = str(config.project.versions.start.cdata).strip()
         self.end = str(config.project.versions.end.cdata).strip()
 
@@ -105,9 +146,22 @@ class ProjectConfig:
                 self.junit['fqn'] = str(config.project.junit.fqn.cdata).strip()
             if hasattr(config.project.junit, 'jth'):
                 self.junit['jth'] = str(config.project.junit.jth.cdata).strip()
+            if hasattr(config.project.junit, 'launcher'):
+                self.junit['launcher'] = os.path.expanduser(str(config.project.junit.launcher.cdata).strip())
             self.junit['reg'] = self._add_reg(config)
 
 
+    def _add_sampling(self, config):
+        # sequential sampling (see Sampling.StopRule) instead of a fixed number of executions, if configured
+        self.sampling = None
+        if hasattr(config.project, 'sampling'):
+            sampling = config.project.sampling
+            self.sampling = {}
+            for name, convert in (('min_execs', int), ('max_execs', int), ('confidence', float),
+                                  ('rel_error', float), ('ci_width', float)):
+                if hasattr(sampling, name):
+                    self.sampling[name] = convert(getattr(sampling, name).cdata.strip())
+
     def _add_reg(self, config):
         ret = {}
         if hasattr(config.project.junit, 'reg'):
@@ -1,4 +1,5 @@
 import os
+import re
 import subprocess
 import shutil
 
@@ -6,21 +7,31 @@ import untangle
 
 import api.result as result
 import api.runner as runner
+import api.tracing as tracing
 import fs
-from impl.BasicJMHRunner import BasicJMHRunner
+from impl.BasicJMHRunner import BasicJMHRunner, mvn_repo_args
+from impl.ClassIndex import ClassIndex
 from impl.GitRepoHandler import GitRepoHandler
+from impl.ImpactSelector import ImpactSelector, class_pattern, jmh_benchmark, surefire_test, test_class
+from impl import Affinity, BadCommits, BuildGuard, MvnPom, Sampling, Watchdog
 
 
 ###############
 ### private ###
 ###############
 
-def _run(statement, *args):
+def _run(statement, msg=None, cwd=None, guard=None, phase=tracing.BUILD, label=None):
     try:
-        subprocess.call(statement)
+        if phase == tracing.BUILD:
+            BuildGuard.call(statement, cwd, guard)
+        else:
+            Watchdog.call(statement, cwd, phase, label=label)
         return True
+    except Watchdog.Expired:
+        # the version failed, see Watchdog
+        raise
     except Exception as e:
-        print "### " + ("Compilation failed"  if args[0] == None else args[0]) + ": %s ###" % e.message
+        print "### " + ("Compilation failed"  if msg == None else msg) + ": %s ###" % e.message
         return False
 
 
@@ -35,42 +46,190 @@ def _is_clean(**kwargs):
     return False
 
 
-def _build_cmd(**kwargs):
+def _build_cmd(config, modules=None, **kwargs):
     build_cmd = [_MVN_CMD]
     if _is_clean(**kwargs):
         build_cmd += [_MVN_CLEAN]
     build_cmd += _MVN_INSTALL
+    if modules:
+        build_cmd += _project_list(modules) + [_MVN_ALSO_MAKE]
+    build_cmd += mvn_repo_args(config.project)
     return build_cmd
 
 
+_MVN_PROJECT_LIST = "-pl"
+_MVN_ALSO_MAKE = "-am"
+
+
+def _project_list(modules):
+    return [_MVN_PROJECT_LIST, ','.join([m or '.' for m in modules])]
+
+
+def _build(config, build_dir, sha, modules=None, **kwargs):
+    """
+    _build builds the checked out version in build_dir. If a build cache is given (kwargs['build-cache']) and a version
+    with the same build-relevant sources was built before, the cached build outputs are restored instead. If a
+    registry of bad commits is given (kwargs['bad-commits']), a failed build is recorded in it.
+    :param modules: if given, only these modules (and the modules they depend on) are built
+    :return True if the build succeeded or was restored:
+    """
+    with tracing.phase(tracing.BUILD):
+        cache = kwargs.get('build-cache')
+        key = None
+        if cache:
+            key = cache.key(GitRepoHandler(config.project.dir), sha, _MVN_INSTALL)
+            if cache.restore(key, config.project):
+                return True
+        try:
+            success = BadCommits.build(_build_cmd(config, modules, **kwargs), build_dir, sha,
+                                       kwargs.get('bad-commits'), kwargs.get('build-guard'), config.project.name)
+        except Watchdog.Expired:
+            raise
+        except Exception as e:
+            print "### Compilation failed: %s ###" % e.message
+            return False
+        # only cache outputs of successful builds
+        if success and cache:
+            cache.store(key, config.project)
+        return success
+
+
+def _known_bad(sha, **kwargs):
+    """
+    _known_bad returns the entry of the version in the registry of bad commits (kwargs['bad-commits']), if it is known
+    to fail to build with the current toolchain.
+    """
+    registry = kwargs.get('bad-commits')
+    return registry.known_bad(sha) if registry else None
+
+
 def _add_results(old_results, new_results):
     """
-    _add_results adds new results to existing results of the same test
-    :return a new dictionary of BenchmarkResults:
+    _add_results adds new results to existing results of the same test. The existing results are extended in place,
+    without copying them.
+    :return the dictionary of BenchmarkResults:
     """
     if not old_results:
         return new_results
+    for k, v in new_results.iteritems():
+        if k in old_results:
+            old_results[k].merge(v)
+        else:
+            old_results[k] = v
+    return old_results
+
+
+def _classname_pattern(tests):
+    """
+    _classname_pattern translates a surefire -Dtest= style list of test names (e.g. "FooTest, Bar*Test#testX") into
+    a regular expression on fully qualified class names. Method filters are not supported and ignored.
+    """
+    names = [t.strip().split('#')[0] for t in tests.split(',') if t.strip()]
+    names = [re.escape(n).replace('\\*', '.*') for n in names]
+    return '^(.*[.$])?(%s)$' % '|'.join(names)
+
+
+def _benchmark_pattern(benchmarks):
+    """
+    _benchmark_pattern returns a regular expression that matches exactly the given benchmarks (class.method).
+    """
+    return '^(%s)$' % '|'.join([re.escape(b) for b in sorted(benchmarks)])
+
+
+def _code_dirs(project_dir, mode, test=False):
+    """
+    _code_dirs returns the class output (ClassIndex.BYTECODE) or source (ClassIndex.SOURCE) directories of the
+    production code (or of the tests) of all reactor modules in project_dir.
+    """
+    if mode == ClassIndex.BYTECODE:
+        sub_dir = 'target/test-classes' if test else 'target/classes'
     else:
-        ret = {}
-        for k, v in old_results.iteritems():
-            ne = result.Benchmark(v.benchmark, v.parameter)
-            ne.individual_results = v.individual_results + new_results[k].individual_results
-            ret[ne.benchmark] = ne
-        return ret
+        sub_dir = 'src/test/java' if test else 'src/main/java'
+    return [os.path.join(pom.dir, sub_dir) for pom in MvnPom.reactor(project_dir)]
+
+
+def _build_outputs(directory, names):
+    """
+    _build_outputs returns the build output directories of the module in directory (if it is one) and the git
+    directory among its entries names, to copy a module without them (see shutil.copytree).
+    """
+    ignored = [n for n in names if n == '.git']
+    if 'pom.xml' in names and 'target' in names:
+        ignored.append('target')
+    return ignored
+
+
+def _source_stats(directory):
+    """
+    _source_stats describes the files below directory by path, size and modification time, for directories that are
+    not versioned with the project (e.g. the JMH root).
+    """
+    stats = []
+    for dirpath, _, filenames in os.walk(directory):
+        for f in filenames:
+            path = os.path.join(dirpath, f)
+            st = os.stat(path)
+            stats.append((os.path.relpath(path, directory), st.st_size, st.st_mtime))
+    return sorted(stats)
+
+
+class _AffectedModules:
+    """
+    _AffectedModules remembers which version was last built in a project directory, and computes from the diff to
+    that version which Maven modules need to be built (with -pl <modules> -am) and tested. The module graph is only
+    parsed again if the poms changed.
+    """
+
+    def __init__(self, project_dir):
+        self.project_dir = project_dir
+        self.built = None
+        self.graphs = {}
+
+    def graph(self, sha):
+        """
+        graph returns the module graph of the checked out version sha.
+        """
+        poms = tuple(GitRepoHandler(self.project_dir).build_tree_ids(sha, [MvnPom.POM_FILE]))
+        if poms not in self.graphs:
+            self.graphs[poms] = MvnPom.ModuleGraph(self.project_dir)
+        return self.graphs[poms]
+
+    def select(self, sha, required=None):
+        """
+        select decides which modules to build and to test for the checked out version sha.
+        :param required: the modules whose build outputs are needed, None for all modules
+        :return a tuple (build, test) of sorted module lists. build is None for a full build, test is None to test all
+        modules. Both are empty if the version does not change anything that was built before:
+        """
+        graph = self.graph(sha)
+        if self.built is None:
+            return (sorted(required) if required is not None else None), None
+        paths = GitRepoHandler(self.project_dir).changed_paths(self.built, sha)
+        affected = graph.affected(paths)
+        build = affected if required is None else affected & graph.dependencies(required)
+        test = graph.dependents(affected) | graph.changed_modules(paths, ['src/test/'])
+        return sorted(build), sorted(test)
+
+    def build_succeeded(self, sha):
+        self.built = sha
 
 
 ##############
 ### public ###
 ##############
-def checkout_version(project_dir, version, mode):
-    repo = GitRepoHandler(project_dir)
-    if mode == 'commit-mode':
-        sha = repo.checkout_commit(version)
-    elif mode == 'time-mode':
-        sha = repo.checkout_time(version)
-    else:
-        raise RuntimeError("Mode not yet implemented.")
-    return sha
+def checkout_version(project_dir, version, mode, time_index=None):
+    with tracing.phase(tracing.CHECKOUT):
+        repo = GitRepoHandler(project_dir)
+        if mode == 'commit-mode':
+            sha = repo.checkout_commit(version)
+        elif mode == 'time-mode':
+            if time_index and version in time_index:
+                sha = repo.checkout_commit(time_index[version])
+            else:
+                sha = repo.checkout_time(version)
+        else:
+            raise RuntimeError("Mode not yet implemented.")
+        return sha
 
 class JMHRunner(runner.Test):
     JAVA_COMMAND = [os.environ['JAVA_HOME']+"/bin/java", "-jar",  "target/benchmarks.jar"]
@@ -79,31 +238,152 @@ class JMHRunner(runner.Test):
 
     def __init__(self, config):
         self.config = config
+        self.modules = _AffectedModules(config.project.dir)
+        self.selector = None
+        # the Affinity.Placement to run the benchmarks with, if any
+        self.placement = None
 
     def run(self, version, parser, run=None, **kwargs):
+        sha = None
         try:
-            sha = checkout_version(self.config.project.dir, version, kwargs['mode'])
-            _run(_build_cmd(**kwargs))
-            pom_version = self.find_pom_version()
-            jmh = BasicJMHRunner(self.config)
-            jmh.prepare_version(self.config.project, pom_version)
-            version_result = jmh.run_benchmark(version, sha, parser, run)
-            return version_result
+            sha = checkout_version(self.config.project.dir, version, kwargs['mode'], kwargs.get('time-index'))
+            known = _known_bad(sha, **kwargs)
+            if known:
+                return BadCommits.skip(version, sha, known)
+            jmh = self._build_jmh(sha, **kwargs)
+            if not jmh:
+                return BadCommits.unbuildable(version, sha)
+            if not kwargs.get('select-tests'):
+                return self._run_benchmarks(jmh, version, sha, parser, run)
+            return self._run_selected(jmh, version, sha, parser, run, kwargs['select-tests'])
+        except Watchdog.Expired as e:
+            return e.result(version, sha)
         except Exception as e:
             print "Failed to run benchmark for version %s: %s" % (str(version), e.message)
             return None
 
+    def prepare(self, version, parser, run=None, **kwargs):
+        """
+        prepare builds the version and keeps its benchmarks jar, see runner.Test.prepare.
+        """
+        sha = None
+        try:
+            sha = checkout_version(self.config.project.dir, version, kwargs['mode'], kwargs.get('time-index'))
+            known = _known_bad(sha, **kwargs)
+            if known:
+                return BadCommits.skip(version, sha, known)
+            jmh = self._build_jmh(sha, **kwargs)
+            if not jmh:
+                return BadCommits.unbuildable(version, sha)
+            jar = os.path.join(self.config.project.jmh_root, BasicJMHRunner.BENCHMARKS_JAR)
+            if not os.path.isfile(jar):
+                print '### no benchmarks jar built for version: {} ###'.format(sha)
+                return None
+            prepared = runner.Prepared(version, sha)
+            prepared.jar = prepared.keep(jar)
+            return prepared
+        except Watchdog.Expired as e:
+            return e.result(version, sha)
+        except Exception as e:
+            print "Failed to prepare benchmark for version %s: %s" % (str(version), e.message)
+            return None
+
+    def measure(self, prepared, parser, run=None, **kwargs):
+        jmh = BasicJMHRunner(self.config, self.placement)
+        try:
+            return jmh.run_benchmark(prepared.version, prepared.sha, parser, run, jar=prepared.jar)
+        except Watchdog.Expired as e:
+            return e.result(prepared.version, prepared.sha)
+
+    def _build_jmh(self, sha, **kwargs):
+        """
+        _build_jmh builds the checked out version, and the benchmarks of the JMH root against it.
+        :return the BasicJMHRunner, or None if the version or the benchmarks failed to build:
+        """
+        build = None
+        if kwargs.get('affected-modules'):
+            build, _ = self.modules.select(sha)
+        if build == []:
+            print '### no module affected by version: {} ###'.format(sha)
+        elif not _build(self.config, self.config.project.dir, sha, build, **kwargs):
+            print '### building process execution failed for version: {}'.format(sha)
+            return None
+        elif kwargs.get('affected-modules'):
+            self.modules.build_succeeded(sha)
+        pom_version = self.find_pom_version()
+        jmh = BasicJMHRunner(self.config, self.placement)
+        if not jmh.prepare_version(self.config.project, pom_version, kwargs.get('build-guard'), sha,
+                                   kwargs.get('bad-commits')):
+            print '### building the benchmarks failed for version: {}'.format(sha)
+            return None
+        return jmh
+
     def find_pom_version(self):
-        return str(untangle.parse('pom.xml').project.version.cdata).strip()
+        pom = os.path.join(self.config.project.dir, 'pom.xml')
+        return str(untangle.parse(pom).project.version.cdata).strip()
+
+    def _run_benchmarks(self, jmh, version, sha, parser, run, excludes=None):
+        """
+        _run_benchmarks runs the benchmarks once, or, if sampling is configured (see Sampling.StopRule), repeats the
+        benchmarks that did not reach the sampling target yet.
+        """
+        rule = Sampling.StopRule.from_config(getattr(self.config.project, 'sampling', None))
+        if not rule:
+            return jmh.run_benchmark(version, sha, parser, run, excludes)
+        sampler = Sampling.Sampler(rule)
+        benchmarks = run
+        while True:
+            version_result = jmh.run_benchmark(version, sha, parser, benchmarks, excludes)
+            sampler.add(version_result.benchmarks if version_result else [])
+            if sampler.done():
+                break
+            benchmarks = _benchmark_pattern(set([b for b, _ in sampler.pending()]))
+        if not sampler.results:
+            return None
+        return result.Version(version, sha, sampler.benchmarks())
+
+    def _run_selected(self, jmh, version, sha, parser, run, mode):
+        """
+        _run_selected only runs the benchmark classes affected by the changes since the previously measured version
+        (see ImpactSelector), by excluding all others.
+        """
+        if not self.selector:
+            self.selector = ImpactSelector(self.config.project.dir, mode, jmh_benchmark)
+        jmh_root = self.config.project.jmh_root
+        with tracing.phase(tracing.SELECT):
+            selected = self.selector.select(sha, _code_dirs(self.config.project.dir, mode), _code_dirs(jmh_root, mode),
+                                            _source_stats(os.path.join(jmh_root, 'src')))
+        if selected is None:
+            version_result = self._run_benchmarks(jmh, version, sha, parser, run)
+        elif not selected:
+            print '### no benchmarks affected by version: {} ###'.format(sha)
+            version_result = result.Version(version, sha)
+        else:
+            print '### {0} of {1} benchmark classes affected by version: {2} ###'.format(len(selected),
+                                                                                      len(self.selector.tests), sha)
+            excludes = self.selector.tests - selected
+            version_result = self._run_benchmarks(jmh, version, sha, parser, run,
+                                                  class_pattern(excludes) if excludes else None)
+        if version_result is None:
+            return None
+        version_result.benchmarks = self.selector.measured_results(sha, version_result.benchmarks, selected)
+        return version_result
 
 
 class JUnitRunner(runner.Test):
     MVN_TEST = ["mvn", "test"]
     MVN_TEST_NAME = "-Dtest="
+    MVN_NO_SPECIFIED_TESTS = "-Dsurefire.failIfNoSpecifiedTests=false"
 
     RESULTS_DIR = "target/surefire-reports/"
     RESULTS_FILEPATTERN = "TEST-*.xml"
 
+    # direct mode: the test classpath is resolved once per version, and every repetition is a plain launcher JVM
+    MVN_CLASSPATH = ["mvn", "dependency:build-classpath", "-Dmdep.includeScope=test", "-Dmdep.outputFile=%s"]
+    CLASSPATH_FILE = "target/hopper-test-classpath.txt"
+    DIRECT_RESULTS_DIR = "target/hopper-junit-reports"
+    LAUNCHER_ARGS = ["--disable-banner", "--details=none"]
+
     TMP_FOLDER = '{0}/tmp/hopper-files/java-test-handler/'.format(os.path.expanduser('~'))
 
     def __init__(self, config):
@@ -113,53 +393,309 @@ class JUnitRunner(runner.Test):
         self.test_execs = config.project.junit['execs']
         self.regression = config.project.junit['reg']
         self.add_regression = False
+        # whether the previous version had the regression (see _sources_changed)
+        self.had_regression = False
+        # the surefire report directories of the reactor modules, located once per checked out version
+        self.report_dirs = None
+        self.modules = _AffectedModules(self.proj_dir)
+        self.selector = None
+        # the Affinity.Placement to run the tests with, if any
+        self.placement = None
 
     def run(self, version, parser, tests=None, **kwargs):
         # checkout current version
-        sha = checkout_version(self.config.project.dir, version, kwargs['mode'])
+        sha = checkout_version(self.config.project.dir, version, kwargs['mode'], kwargs.get('time-index'))
+        known = _known_bad(sha, **kwargs)
+        if known:
+            return BadCommits.skip(version, sha, known)
+        try:
+            return self._run_version(version, sha, parser, tests, **kwargs)
+        except Watchdog.Expired as e:
+            if self.regression:
+                self._remove_regression()
+            return e.result(version, sha)
+
+    def _run_version(self, version, sha, parser, tests=None, **kwargs):
+        self.report_dirs = None
         # add regression
         if self.regression:
             self._add_regression(sha)
-        self._chdir()
         # compile version
-        success = _run(_build_cmd(**kwargs))
-        #todo: check if build for project was successful
+        build, test = None, None
+        if kwargs.get('affected-modules'):
+            with tracing.phase(tracing.SELECT):
+                build, test = self._select_modules(sha)
+        if build == []:
+            print '### no module affected by version: {} ###'.format(sha)
+            success = True
+        else:
+            success = _build(self.config, self.proj_dir, sha, build, **self._build_args(kwargs))
         if not success:
             print '### building process execution failed for version: {}'.format(sha)
-            return result.Version(version, sha)
+            if self.regression:
+                self._remove_regression()
+            return BadCommits.unbuildable(version, sha)
+        self.modules.build_succeeded(sha)
         # prepare version result
         version_result = result.Version(version, sha)
         version_result.benchmarks = {}
+        selected = None
+        if test != [] and kwargs.get('select-tests'):
+            with tracing.phase(tracing.SELECT):
+                selected = self._select_tests(sha, tests, kwargs['select-tests'])
+            if selected is not None and not selected:
+                test = []
+            elif selected and not (tests and '#' in tests):
+                # method filters of --tests are kept as they are, if any of their classes is selected
+                tests = ','.join(sorted(selected))
+        if test == []:
+            print '### no tests affected by version: {} ###'.format(sha)
+            version_result.benchmarks = self._measured_results(sha, [], set())
+            if self.regression:
+                self._remove_regression()
+            return version_result
+        direct = kwargs.get('junit-mode') == 'direct'
+        classpath = None
+        if direct:
+            with tracing.phase(tracing.BUILD):
+                classpath = self.test_classpath()
         # run tests and retrieve results
-        os.chdir(self.test_dir)
-        for n in range(0, self.test_execs):
-            _run(self.exec_statement(tests), "Test execution failed")
-            if not success:
-                print '### test execution failed for version: {}'.format(sha)
-                continue
-            # generate test result file paths and pass those to the parser
-            files = fs.matching_files(self.test_dir, JUnitRunner.RESULTS_FILEPATTERN, JUnitRunner.RESULTS_DIR)
-            results = parser.parse_result(files)
-            # add new test results
-            version_result.benchmarks = _add_results(version_result.benchmarks, results)
-            # check if incremental build -> if True delete sure fire reports
-            self._del_surefire_results(**kwargs)
-
-        version_result.benchmarks = version_result.benchmarks.values()
+        rule = Sampling.StopRule.from_config(getattr(self.config.project, 'sampling', None))
+        if rule:
+            benchmarks = self._sample(rule, parser, tests, test, classpath, sha, **kwargs)
+        else:
+            for n in range(0, self.test_execs):
+                results = self._run_once(parser, tests, test, classpath, sha, **kwargs)
+                # add new test results
+                if results is not None:
+                    version_result.benchmarks = _add_results(version_result.benchmarks, results)
+            benchmarks = version_result.benchmarks.values()
+
+        version_result.benchmarks = self._measured_results(sha, benchmarks, selected)
+        failures = sum([b.failures for b in version_result.benchmarks])
+        skipped = sum([b.skipped for b in version_result.benchmarks])
+        if failures or skipped:
+            print '### {0} failed and {1} skipped test executions for version: {2}'.format(failures, skipped, sha)
 
         # remove regression
         if self.regression:
             self._remove_regression()
         return version_result
 
-    def exec_statement(self, tests):
+    def prepare(self, version, parser, tests=None, **kwargs):
+        """
+        prepare builds the version, and keeps its test classpath (see test_classpath), see runner.Test.prepare. Only
+        supported in junit mode direct: the kept classpath is executed with the JUnit launcher. Kept are the classes of
+        the project and SNAPSHOT dependencies, which the builds of other versions overwrite; released dependencies are
+        referenced in the local Maven repository. The junit dir (without build outputs) is kept as well, as the tests
+        are executed in it, and may read files relative to it.
+        """
+        sha = checkout_version(self.config.project.dir, version, kwargs['mode'], kwargs.get('time-index'))
+        known = _known_bad(sha, **kwargs)
+        if known:
+            return BadCommits.skip(version, sha, known)
+        self.report_dirs = None
+        if self.regression:
+            self._add_regression(sha)
+        try:
+            build = None
+            if kwargs.get('affected-modules'):
+                with tracing.phase(tracing.SELECT):
+                    build, _ = self._select_modules(sha)
+            if build == []:
+                print '### no module affected by version: {} ###'.format(sha)
+            elif not _build(self.config, self.proj_dir, sha, build, **self._build_args(kwargs)):
+                print '### building process execution failed for version: {}'.format(sha)
+                return BadCommits.unbuildable(version, sha)
+            self.modules.build_succeeded(sha)
+            with tracing.phase(tracing.BUILD):
+                classpath = self.test_classpath(kwargs.get('build-guard'))
+                prepared = runner.Prepared(version, sha)
+                prepared.classpath = self._keep_classpath(prepared, classpath)
+                prepared.test_dir = prepared.keep(self.test_dir, 'junit-dir', _build_outputs)
+            # the test classes are the first entry of the test classpath
+            prepared.test_classes = prepared.classpath.split(os.pathsep)[0]
+            return prepared
+        except Watchdog.Expired as e:
+            return e.result(version, sha)
+        finally:
+            if self.regression:
+                self._remove_regression()
+
+    def measure(self, prepared, parser, tests=None, **kwargs):
+        """
+        measure executes the tests of a prepared version kwargs['executions'] times (once by default), see
+        runner.Test.measure.
+        """
+        benchmarks = None
+        for n in range(0, kwargs.get('executions', 1)):
+            with tracing.phase(tracing.RUN):
+                try:
+                    files = self._run_direct(prepared.classpath, tests, prepared.test_classes, prepared.test_dir)
+                except Watchdog.Expired as e:
+                    return e.result(prepared.version, prepared.sha)
+            with tracing.phase(tracing.PARSE):
+                results = parser.parse_result(files)
+            if results is None:
+                print '### test execution failed for version: {}'.format(prepared.sha)
+                continue
+            benchmarks = _add_results(benchmarks, results)
+        if benchmarks is None:
+            return None
+        return result.Version(prepared.version, prepared.sha, Affinity.stamp(benchmarks.values(), self.placement))
+
+    def _keep_classpath(self, prepared, classpath):
+        """
+        _keep_classpath copies the entries of the classpath that are overwritten by the next build into prepared.
+        :return the classpath that refers to the copies:
+        """
+        root = os.path.abspath(self.proj_dir) + os.sep
+        entries = []
+        for i, entry in enumerate(classpath.split(os.pathsep)):
+            if os.path.exists(entry) and (os.path.abspath(entry).startswith(root) or 'SNAPSHOT' in entry):
+                entry = prepared.keep(entry, '%s-%s' % (i, os.path.basename(entry.rstrip(os.sep))))
+            entries.append(entry)
+        return os.pathsep.join(entries)
+
+    def _run_once(self, parser, tests, modules, classpath, sha, **kwargs):
+        """
+        _run_once executes the tests once, with Maven or (if a classpath is given) directly.
+        :return the results as dictionary, or None if the execution failed:
+        """
+        if classpath:
+            with tracing.phase(tracing.RUN):
+                files = self._run_direct(classpath, tests)
+            with tracing.phase(tracing.PARSE):
+                results = parser.parse_result(files)
+            Affinity.stamp(results.values() if results else None, self.placement)
+            return results
+        with tracing.phase(tracing.RUN):
+            if hasattr(parser, 'parse_file'):
+                # parse the report files while surefire is still running the remaining tests (which is part of run)
+                parsed = []
+                watcher = fs.FileWatcher(self._report_dirs(), JUnitRunner.RESULTS_FILEPATTERN,
+                                         lambda f: parsed.append(parser.parse_file(f))).start()
+                try:
+                    success = _run(self._pinned(self.exec_statement(tests, modules)), "Test execution failed",
+                                   cwd=self.test_dir, phase=tracing.RUN)
+                finally:
+                    watcher.stop()
+            else:
+                success = _run(self._pinned(self.exec_statement(tests, modules)), "Test execution failed",
+                               cwd=self.test_dir, phase=tracing.RUN)
+        if not success:
+            print '### test execution failed for version: {}'.format(sha)
+            return None
+        with tracing.phase(tracing.PARSE):
+            if hasattr(parser, 'parse_file'):
+                results = parser.results(parsed)
+            else:
+                # generate test result file paths and pass those to the parser
+                files = fs.listed_files(self._report_dirs(), JUnitRunner.RESULTS_FILEPATTERN)
+                results = parser.parse_result(files)
+        # check if incremental build -> if True delete sure fire reports
+        self._del_surefire_results(**kwargs)
+        Affinity.stamp(results.values() if results else None, self.placement)
+        return results
+
+    def _sample(self, rule, parser, tests, modules, classpath, sha, **kwargs):
+        """
+        _sample repeats the tests until every test reached the sampling target or a cap (see Sampling.StopRule). After
+        the first execution, only the test classes with tests that need more values are executed.
+        :return the list of results:
+        """
+        sampler = Sampling.Sampler(rule)
+        run_tests = tests
+        while True:
+            results = self._run_once(parser, run_tests, modules, classpath, sha, **kwargs)
+            sampler.add(results.values() if results else [])
+            if sampler.done():
+                break
+            if not (tests and '#' in tests):
+                # method filters of --tests are kept as they are
+                run_tests = ','.join(sorted(set([test_class(b) for b, _ in sampler.pending()])))
+        benchmarks = sampler.benchmarks()
+        reasons = {}
+        for b in benchmarks:
+            reasons[b.stop_reason] = reasons.get(b.stop_reason, 0) + 1
+        print '### sampling stopped after {0} executions for version {1}: {2} ###'.format(sampler.runs, sha, reasons)
+        return benchmarks
+
+    def exec_statement(self, tests, modules=None):
         # prepare test execution statement
+        ret = JUnitRunner.MVN_TEST + mvn_repo_args(self.config.project)
+        if modules:
+            ret += _project_list(modules)
         if tests:
-            ret = JUnitRunner.MVN_TEST[:]
             ret.append(JUnitRunner.MVN_TEST_NAME + tests.replace(' ', ''))
-            return ret
-        else:
-            return JUnitRunner.MVN_TEST
+            if modules:
+                # not every selected module has to contain one of the tests
+                ret.append(JUnitRunner.MVN_NO_SPECIFIED_TESTS)
+        return ret
+
+    def test_classpath(self, guard=None):
+        """
+        test_classpath resolves the test classpath (test classes, classes and all test-scoped dependencies) of the
+        checked out and built version.
+        :param guard: the BuildGuard to execute Maven with, optional
+        :return the classpath as string:
+        """
+        cp_file = os.path.join(self.test_dir, JUnitRunner.CLASSPATH_FILE)
+        if os.path.isfile(cp_file):
+            os.remove(cp_file)
+        cmd = JUnitRunner.MVN_CLASSPATH[:-1] + [JUnitRunner.MVN_CLASSPATH[-1] % cp_file]
+        _run(cmd + mvn_repo_args(self.config.project), "Classpath resolution failed", cwd=self.test_dir, guard=guard)
+        entries = [os.path.join(self.test_dir, 'target', 'test-classes'), os.path.join(self.test_dir, 'target', 'classes')]
+        if os.path.isfile(cp_file):
+            with open(cp_file) as f:
+                deps = f.read().strip()
+            if deps:
+                entries.append(deps)
+        return os.pathsep.join(entries)
+
+    def direct_statement(self, classpath, tests, reports_dir, test_classes=None):
+        """
+        direct_statement returns the command to execute the tests with the JUnit Platform console launcher
+        (junit-platform-console-standalone, configured as junit/launcher) without Maven.
+        :param test_classes: the directory to scan for tests, defaults to the test classes in the junit dir
+        """
+        ret = [os.environ['JAVA_HOME'] + "/bin/java", "-jar", self.config.project.junit['launcher']]
+        ret += JUnitRunner.LAUNCHER_ARGS
+        ret += ["--class-path=%s" % classpath, "--reports-dir=%s" % reports_dir,
+                "--scan-class-path=%s" % (test_classes or os.path.join(self.test_dir, 'target', 'test-classes'))]
+        if tests:
+            ret.append("--include-classname=%s" % _classname_pattern(tests))
+        return ret
+
+    def _run_direct(self, classpath, tests, test_classes=None, test_dir=None):
+        """
+        _run_direct executes the tests with the JUnit launcher in test_dir (the junit dir by default).
+        """
+        test_dir = test_dir or self.test_dir
+        reports_dir = os.path.join(test_dir, JUnitRunner.DIRECT_RESULTS_DIR)
+        shutil.rmtree(reports_dir, ignore_errors=True)
+        cmd = self.direct_statement(classpath, tests, reports_dir, test_classes)
+        # the classpath and the reports dir differ for every prepared version
+        _run(self._pinned(cmd), "Test execution failed", cwd=test_dir, phase=tracing.RUN, label=('junit', tests))
+        return fs.listed_files([reports_dir], JUnitRunner.RESULTS_FILEPATTERN)
+
+    def _pinned(self, cmd):
+        """
+        _pinned returns the command to execute the tests with the placement, if any. In Maven mode, the forked
+        Surefire JVMs inherit the placement of Maven.
+        """
+        return self.placement.command(cmd) if self.placement else cmd
+
+    def _report_dirs(self):
+        """
+        _report_dirs returns the surefire report directories of all reactor modules below the junit dir. They are
+        located from the poms once per checked out version.
+        """
+        if self.report_dirs is None:
+            self.report_dirs = [os.path.join(pom.dir, JUnitRunner.RESULTS_DIR) for pom in MvnPom.reactor(self.test_dir)]
+            if not self.report_dirs:
+                self.report_dirs = [os.path.join(self.test_dir, JUnitRunner.RESULTS_DIR)]
+        return self.report_dirs
 
     def _del_surefire_results(self, **kwargs):
         if _is_clean(**kwargs):
@@ -168,20 +704,84 @@ class JUnitRunner(runner.Test):
         sf_dir += 'target/surefire-reports'
         shutil.rmtree(sf_dir, ignore_errors=True)
 
-    def _chdir(self):
+    def _select_tests(self, sha, tests, mode):
+        """
+        _select_tests selects the test classes below the junit dir that are affected by the changes since the
+        previously measured version (see ImpactSelector), and that match the --tests filter.
+        :return the set of selected test classes, or None to execute all tests:
+        """
+        if not self.selector:
+            self.selector = ImpactSelector(self.proj_dir, mode, surefire_test)
+        # the injected regression is not part of the diff (and not of the committed trees the index is cached by)
+        selected = self.selector.select(sha, _code_dirs(self.proj_dir, mode), _code_dirs(self.test_dir, mode, True),
+                                        self.regression['method'] if self.add_regression else None,
+                                        self._sources_changed())
+        if selected is None:
+            return None
+        if tests:
+            pattern = re.compile(_classname_pattern(tests))
+            selected = set([t for t in selected if pattern.match(t)])
+        print '### {0} of {1} test classes affected by version: {2} ###'.format(len(selected), len(self.selector.tests),
+                                                                              sha)
+        return selected
+
+    def _measured_results(self, sha, benchmarks, selected):
+        if not self.selector:
+            return benchmarks
+        return self.selector.measured_results(sha, benchmarks, selected)
+
+    def _select_modules(self, sha):
+        """
+        _select_modules decides which modules to build and to test for the checked out version (see
+        _AffectedModules.select). If the junit dir is a sub-module, only it and the modules it depends on are built,
+        and its tests are always executed (in the junit dir).
+        """
+        root = os.path.abspath(self.proj_dir)
+        module = os.path.relpath(os.path.abspath(self.test_dir), root).replace(os.sep, '/')
+        if module == os.curdir:
+            build, test = self.modules.select(sha)
+            # the injected regression is not part of the diff
+            return (None if self._sources_changed() else build), test
+        build, _ = self.modules.select(sha, [module])
+        if self._sources_changed() and build is not None and module not in build:
+            build.append(module)
+        return build, None
+
+    def _build_args(self, kwargs):
+        """
+        _build_args returns the build arguments for the checked out version. The build cache is keyed by the committed
+        tree, which does not contain an injected regression (see _add_regression), so such builds bypass the cache.
+        """
+        if self.add_regression and 'build-cache' in kwargs:
+            kwargs = dict(kwargs)
+            del kwargs['build-cache']
+        return kwargs
+
+    def _has_regression(self, sha):
+        """
+        _has_regression decides whether the regression is injected into version sha: if the configured regression commit
+        is sha or one of its ancestors. This only depends on the version, not on the versions measured before, so that
+        the workers of a parallel walk (which share the versions) inject it into the same versions as a single runner.
+        """
+        commit = self.regression['commit']
+        if not commit:
+            return False
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.call(['git', 'merge-base', '--is-ancestor', commit, sha], cwd=self.proj_dir,
+                                   stderr=devnull) == 0
+
+    def _sources_changed(self):
         """
-        _chdir changes the directory to either project dir or junit dir depending on whether a sub-project build is sufficient
-        :return: None
+        _sources_changed returns True if the checked out sources changed since the previous version in more than the
+        committed diff: if the regression is injected into this version, or was injected into the previous one (e.g.
+        when bisecting a range that contains the regression commit).
         """
-        dir = self.proj_dir
-        #TODO: parse parent pom -> retrieve all sub-projects (poms) -> parse sub-poms
-        #TODO: -> generate matrix/graph with interdependencies between sub-projects -> decide whether sub-projects needs installation of other sub-projects
-        #TODO: have a look at mvn dependency
-        os.chdir(dir)
+        return self.add_regression or self.had_regression
 
     def _add_regression(self, sha):
-        if (self.regression['commit'] and self.regression['commit'].startswith(sha)) or self.add_regression:
-            self.add_regression = True
+        self.had_regression = self.add_regression
+        self.add_regression = self._has_regression(sha)
+        if self.add_regression:
             print '### {0}: introduce regression'.format(sha)
             method = self.regression['method'].split('::')
             path = self.test_dir + '/src/main/java/' + method[0].replace('.', '/') + '.java'
@@ -223,5 +823,4 @@ class JUnitRunner(runner.Test):
             print '### {0}: don\'t introduce regression'.format(sha)
 
     def _remove_regression(self):
-        os.chdir(self.config.project.dir)
-        subprocess.call(['git', 'reset', '--hard'])
+        subprocess.call(['git', 'reset', '--hard'], cwd=self.config.project.dir)
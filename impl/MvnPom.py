@@ -0,0 +1,166 @@
+import os
+import xml.etree.ElementTree as ET
+
+POM_NS = "{http://maven.apache.org/POM/4.0.0}"
+POM_FILE = "pom.xml"
+
+
+class Pom:
+    """ Pom is a minimal, read-only view of a Maven pom.xml. It only knows about the coordinates of the project, its
+    parent, its direct dependencies and its sub-modules, which is what hopper needs to find build outputs and installed
+    artifacts, and to relate the modules of a reactor to each other.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: The directory containing the pom.xml, or the pom.xml itself.
+        """
+        if os.path.isdir(path):
+            path = os.path.join(path, POM_FILE)
+        self.path = path
+        self.dir = os.path.dirname(os.path.abspath(path))
+        root = ET.parse(path).getroot()
+        self.group = _text(root, "groupId")
+        self.artifact = _text(root, "artifactId")
+        self.version = _text(root, "version")
+        self.parent = None
+        parent = root.find(POM_NS + "parent")
+        if parent is not None:
+            self.parent = (_text(parent, "groupId"), _text(parent, "artifactId"))
+            # groupId and version are inherited from the parent if not given explicitly
+            if not self.group:
+                self.group = _text(parent, "groupId")
+            if not self.version:
+                self.version = _text(parent, "version")
+        # (groupId, artifactId) of the direct dependencies, without the ones only declared in dependencyManagement
+        self.dependencies = [(_text(d, "groupId"), _text(d, "artifactId"))
+                             for d in root.findall(POM_NS + "dependencies/" + POM_NS + "dependency")]
+        self.modules = [m.text.strip() for m in root.findall(POM_NS + "modules/" + POM_NS + "module") if m.text]
+
+    def is_resolved(self):
+        """ is_resolved returns False if the coordinates of this pom can not be determined without evaluating
+        Maven properties (e.g. <version>${revision}</version>).
+        """
+        for c in (self.group, self.artifact, self.version):
+            if not c or '${' in c:
+                return False
+        return True
+
+    def repo_path(self, mvn_repo):
+        """ repo_path returns the directory in the given Maven local repository where this artifact is installed to.
+        """
+        return os.path.join(mvn_repo, self.group.replace('.', os.sep), self.artifact, self.version)
+
+
+def reactor(project_dir):
+    """ reactor returns the poms of the project in the given directory and of all its (transitive) sub-modules.
+    :return a list of Pom objects, starting with the root pom:
+    """
+    poms = []
+    todo = [project_dir]
+    while todo:
+        path = todo.pop(0)
+        if os.path.isdir(path):
+            path = os.path.join(path, POM_FILE)
+        if not os.path.isfile(path):
+            continue
+        pom = Pom(path)
+        poms.append(pom)
+        todo.extend([os.path.normpath(os.path.join(pom.dir, m)) for m in pom.modules])
+    return poms
+
+
+class ModuleGraph:
+    """ ModuleGraph is the graph of the modules of a Maven reactor and of their dependencies on each other (declared
+    dependencies and parent poms). Modules are identified by their directory relative to the project directory, which
+    is what Maven's -pl option accepts; the root module is ''.
+    """
+
+    def __init__(self, project_dir):
+        self.poms = {}
+        root = os.path.abspath(project_dir)
+        for pom in reactor(project_dir):
+            module = os.path.relpath(pom.dir, root).replace(os.sep, '/')
+            self.poms['' if module == os.curdir else module] = pom
+        coords = {}
+        artifacts = {}
+        for module, pom in self.poms.iteritems():
+            coords[(pom.group, pom.artifact)] = module
+            artifacts.setdefault(pom.artifact, []).append(module)
+        # module -> the modules it directly depends on, and the inverse
+        self.upstream = dict([(m, set()) for m in self.poms])
+        self.downstream = dict([(m, set()) for m in self.poms])
+        for module, pom in self.poms.iteritems():
+            for dep in ([pom.parent] if pom.parent else []) + pom.dependencies:
+                other = coords.get(dep)
+                if other is None and (not dep[0] or '${' in dep[0]) and len(artifacts.get(dep[1], [])) == 1:
+                    # e.g. <groupId>${project.groupId}</groupId>: the artifactId alone is unambiguous
+                    other = artifacts[dep[1]][0]
+                if other is not None and other != module:
+                    self.upstream[module].add(other)
+                    self.downstream[other].add(module)
+
+    def module_of(self, path):
+        """ module_of returns the module that contains the given path (relative to the project directory, with '/'
+        as separator), i.e. the module with the longest directory that is a prefix of the path.
+        """
+        module = path
+        while module:
+            if module in self.poms:
+                return module
+            module = module.rpartition('/')[0]
+        return ''
+
+    def changed_modules(self, paths, module_paths):
+        """ changed_modules returns the modules with a changed path below one of module_paths (relative to the module
+        directory, e.g. 'src/test/').
+        """
+        changed = set()
+        for path in paths:
+            module = self.module_of(path)
+            relative = path[len(module) + 1:] if module else path
+            for p in module_paths:
+                if relative == p or (p.endswith('/') and relative.startswith(p)):
+                    changed.add(module)
+                    break
+        return changed
+
+    def affected(self, paths):
+        """ affected returns the modules whose build outputs change with the given changed paths: the modules with
+        changed production code, and the modules with a changed pom together with all modules that depend on or inherit
+        from them.
+        """
+        return self.changed_modules(paths, ['src/main/']) | self.dependents(self.changed_modules(paths, [POM_FILE]))
+
+    def dependents(self, modules):
+        """ dependents returns the given modules and all modules that (transitively) depend on them.
+        """
+        return _closure(modules, self.downstream)
+
+    def dependencies(self, modules):
+        """ dependencies returns the given modules and all modules they (transitively) depend on.
+        """
+        return _closure(modules, self.upstream)
+
+
+def _closure(modules, edges):
+    closure = set()
+    todo = list(modules)
+    while todo:
+        module = todo.pop()
+        if module in closure or module not in edges:
+            continue
+        closure.add(module)
+        todo.extend(edges[module])
+    return closure
+
+
+def default_repo():
+    return os.path.join(os.path.expanduser('~'), '.m2', 'repository')
+
+
+def _text(element, tag):
+    found = element.find(POM_NS + tag)
+    if found is None or found.text is None:
+        return None
+    return found.text.strip()
@@ -3,6 +3,7 @@ import untangle
 import api.runner as runner
 import api.history as history
 from impl.BasicJMHRunner import BasicJMHRunner
+from impl import Watchdog
 
 
 class MvnVersionWalker(history.Walker):
@@ -40,11 +41,15 @@ class JMHMvnRunner(runner.Test):
 
     def __init__(self, config):
         self.config = config
+        self.placement = None
 
     def run(self, version, parser, run=None, **kwargs):
-        jmh = BasicJMHRunner(self.config)
-        jmh.prepare_version(self.config.project, version)
-        version_result = jmh.run_benchmark(version, "-", parser, run)
+        jmh = BasicJMHRunner(self.config, self.placement)
+        try:
+            jmh.prepare_version(self.config.project, version)
+            version_result = jmh.run_benchmark(version, "-", parser, run)
+        except Watchdog.Expired as e:
+            return e.result(version, "-")
         return version_result
 
 class Configuration:
@@ -74,6 +79,8 @@ class ProjectConfig:
         self.module = str(config.project["module"])
         self.jmh_root = str(config.project.jmh_root["dir"])
         self.junit_root = str(config.project.junit_root["dir"])
+        # the Maven local repository to build against, None means Maven's default (~/.m2/repository)
+        self.mvn_repo = None
         self.versions = []
         for v in config.project.versions.version:
             self.versions.append(str(v.cdata).strip())
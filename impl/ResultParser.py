@@ -1,6 +1,10 @@
 import json
-
-import untangle
+import multiprocessing
+import re
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
 
 import api.result as result
 
@@ -8,65 +12,197 @@ import api.result as result
 class JMHJSON(result.Parser):
     """ Implementation  of a result parser that parses the JSON file produced by JMH
     if started with the "-rf json" option.
+
+    The file is streamed: only a single element of the top-level run array is held in memory at a time,
+    so memory stays bounded even for huge files (e.g., with profilers and many parameter combinations).
     """
 
+    CHUNK_SIZE = 64 * 1024
+
     def parse_result(self, file_name):
         try:
-            with open(file_name) as file:
-                data = json.load(file)
-                parsed_results = []
-                for run in data:
-                    benchmark = run["benchmark"]
-                    if "params" in run:
-                        params = ""
-                        for p,v in run["params"].iteritems():
-                             params = params + " %s=%s " % (p,v)
-                        params = params.strip()
-                    else:
-                        params = "-"
-                    values = [ val for raw in run["primaryMetric"]["rawData"] for val in raw ]
-                    # note that this breaks down horribly when we have more than one rawData block
-                    # better print a warning in this case
-                    if len(run["primaryMetric"]["rawData"]) > 1:
-                        self.warn(benchmark, data)
-                    res = result.Benchmark(benchmark, params)
-                    res.individual_results  = values
-                    parsed_results.append(res)
-                return parsed_results
+            return list(self.iter_results(file_name))
         except Exception as error:
             print 'JMHJSON parser error: {}'.format(error)
             return None
 
-    def warn(self, benchmark, data):
-        with open("warning.log", "a+") as file:
-            file.write("WARNING - duplicate raw data block\n")
-            file.write(benchmark + "\n")
-            file.write("------------------------------------")
-            file.write(str(data))
-            file.write("------------------------------------")
+    def iter_results(self, file_name):
+        """ iter_results yields the result (Benchmark) of every run in the file, one at a time.
+        """
+        with open(file_name) as file:
+            for element in _iter_json_array(file, JMHJSON.CHUNK_SIZE):
+                yield self.parse_run(json.loads(element))
+
+    def parse_run(self, run):
+        benchmark = run["benchmark"]
+        if "params" in run:
+            params = ""
+            for p,v in run["params"].iteritems():
+                 params = params + " %s=%s " % (p,v)
+            params = params.strip()
+        else:
+            params = "-"
+        metric = run["primaryMetric"]
+        res = result.Benchmark(benchmark, params)
+        # rawData holds one list of iteration values per fork
+        raw_data = metric.get("rawData", [])
+        res.individual_results = [val for raw in raw_data for val in raw]
+        res.forks = [len(raw) for raw in raw_data]
+        res.score = metric.get("score")
+        res.score_error = metric.get("scoreError")
+        res.score_unit = metric.get("scoreUnit")
+        res.percentiles = dict([(float(p), v) for p, v in metric.get("scorePercentiles", {}).iteritems()])
+        return res
+
+
+def _iter_json_array(file, chunk_size):
+    """ _iter_json_array yields the raw JSON text of every element of the top-level array in file, without
+    reading the whole file into memory.
+    """
+    depth = 0
+    in_string = False
+    # the position (within the current chunk) of a character escaped by a backslash
+    escaped = None
+    element = []
+    start = None
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            break
+        for match in _JSON_STRUCTURE.finditer(chunk):
+            i = match.start()
+            c = chunk[i]
+            if in_string:
+                if i == escaped:
+                    continue
+                if c == '\\':
+                    escaped = i + 1
+                elif c == '"':
+                    in_string = False
+            elif c == '"':
+                in_string = True
+            elif c in '{[':
+                depth += 1
+                if depth == 2:
+                    start = i
+            elif c in '}]':
+                depth -= 1
+                if depth == 1:
+                    element.append(chunk[start:i + 1])
+                    yield ''.join(element)
+                    element = []
+                    start = None
+        escaped = 0 if escaped == len(chunk) else None
+        if start is not None:
+            # the current element continues in the next chunk
+            element.append(chunk[start:])
+            start = 0
+
+
+_JSON_STRUCTURE = re.compile(r'["\\{}\[\]]')
 
 
 class JUnitSurefire(result.Parser):
     """
     JUnitSurefire implements a parser which extracts runtime of JUnit tests from generated Surefire XML files.
+    The files are parsed incrementally (only testcase elements are looked at, and discarded right away, so large
+    captured outputs are never kept in memory). Many files are parsed in a pool of processes, which is started with the
+    parser (before the threads of a walk, as forking a process with running threads is not safe), and shared by all of
+    them; call close at the end of the walk.
+
+    Failed, erroneous and skipped tests are not timed; they are counted in the failures and skipped attributes of
+    their result instead.
     """
+
+    # below this number of report files, a process pool does not pay off
+    PARALLEL_THRESHOLD = 16
+
+    def __init__(self, processes=None):
+        """
+        :param processes: The number of processes to parse report files with. Defaults to the number of CPUs,
+        1 disables the process pool.
+        """
+        self.processes = processes
+        self.pool = multiprocessing.Pool(processes) if processes != 1 else None
+
     def parse_result(self, file_name):
         """"
         parse_result returns the the results (BenchmarkResult) for the specified file_name.
-        :param file_name accepts a file pattern which is forwarded to glob:
+        :param file_name accepts an iterable of report files:
+        :return results of potentially multiple test results as dictionary:
+        """
+        files = list(file_name)
+        if len(files) >= JUnitSurefire.PARALLEL_THRESHOLD and self.pool:
+            parsed = self.pool.map(_parse_surefire_file, files)
+        else:
+            parsed = [_parse_surefire_file(f) for f in files]
+        return self.results(parsed)
+
+    def parse_file(self, file_name):
+        """
+        parse_file parses a single report file, e.g. as soon as Surefire wrote it. Pass the return values of all
+        files of a test execution to results to get the results of the execution.
+        :return the parsed testcases in compact form, as list of (name, time, status):
+        """
+        return _parse_surefire_file(file_name)
+
+    def results(self, parsed):
+        """
+        results turns parsed testcases (see parse_file) of multiple files into results.
+        :param parsed: an iterable of parse_file return values
         :return results of potentially multiple test results as dictionary:
         """
         results = {}
-        files = file_name
-        try:
-            iter(files)
-        except TypeError, te:
-            assert(False, te)
-        for file in files:
-            report = untangle.parse(file)
-            for test in report.testsuite.testcase:
-                fqn = test['classname']+"."+test['name']
-                time = float(test['time'])
-                r = result.Benchmark(fqn, 'Duration', [time])
+        for testcases in parsed:
+            for fqn, time, status in testcases:
+                r = result.Benchmark(fqn, 'Duration')
+                # Surefire reports times in seconds
+                r.score_unit = 's'
+                if status == _PASSED:
+                    r.add([time])
+                elif status == _SKIPPED:
+                    r.skipped = 1
+                else:
+                    r.failures = 1
                 results[fqn] = r
         return results
+
+    def close(self):
+        """ close stops the process pool, once all files are parsed.
+        """
+        if self.pool:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+
+_PASSED = 'passed'
+_FAILED = 'failed'
+_SKIPPED = 'skipped'
+_FAILURE_TAGS = ('failure', 'error')
+
+
+def _parse_surefire_file(path):
+    """ _parse_surefire_file extracts (fully qualified name, time, status) of every testcase in a Surefire report.
+    This is a module-level function, so that it can be sent to the worker processes of a pool.
+    """
+    testcases = []
+    root = None
+    status = _PASSED
+    for event, elem in ET.iterparse(path, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+            elif elem.tag == 'testcase':
+                status = _PASSED
+            continue
+        if elem.tag in _FAILURE_TAGS:
+            status = _FAILED
+        elif elem.tag == 'skipped':
+            status = _SKIPPED
+        elif elem.tag == 'testcase':
+            fqn = elem.get('classname') + "." + elem.get('name')
+            testcases.append((fqn, float(elem.get('time', '0').replace(',', '')), status))
+            # drop everything parsed so far, including captured output
+            root.clear()
+    return testcases
@@ -0,0 +1,183 @@
+import json
+import socket
+import sqlite3
+import time
+
+import api.history as history
+import impl.Statistics as stats
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    host TEXT,
+    args TEXT
+);
+CREATE TABLE IF NOT EXISTS versions (
+    id INTEGER PRIMARY KEY,
+    run INTEGER NOT NULL REFERENCES runs(id),
+    position INTEGER NOT NULL,
+    project TEXT,
+    version TEXT NOT NULL,
+    sha TEXT,
+    placement TEXT,
+    status TEXT
+);
+CREATE TABLE IF NOT EXISTS benchmarks (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    parameter TEXT NOT NULL,
+    unit TEXT NOT NULL,
+    UNIQUE (name, parameter, unit)
+);
+CREATE TABLE IF NOT EXISTS samples (
+    version INTEGER NOT NULL REFERENCES versions(id),
+    benchmark INTEGER NOT NULL REFERENCES benchmarks(id),
+    seq INTEGER NOT NULL,
+    value REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS samples_benchmark ON samples (benchmark, version);
+CREATE INDEX IF NOT EXISTS versions_sha ON versions (sha);
+CREATE INDEX IF NOT EXISTS versions_run ON versions (run, position);
+"""
+
+# factors that convert time units (as reported by JMH, per operation or not) to milliseconds
+_TO_MS = {'s': 1000.0, 'ms': 1.0, 'us': 0.001, 'ns': 0.000001}
+
+
+def to_ms(unit):
+    """ to_ms returns the factor that converts values of the given unit (e.g. "s", "us/op") to milliseconds, or None
+    if the unit is not a time (e.g. the throughput "ops/s").
+    """
+    return _TO_MS.get(unit.split('/')[0]) if unit and (unit.count('/') == 0 or unit.endswith('/op')) else None
+
+
+class SQLiteStore(history.WalkerCallback):
+    """ Implementation of a callback that stores the results in an SQLite database, which can hold the results of many
+    walks (runs). Unlike the CSV output, the history of a single benchmark can be queried without scanning all results
+    (see series and the query command of hopper).
+
+    Every version is stored in its own transaction, so a crashed walk loses at most the version in progress. The
+    database is in WAL mode, so it can be queried while a walk writes to it.
+    """
+
+    def __init__(self, path, args=None):
+        """ Open (or create) the store, and start a new run in it.
+
+        :param path: The path of the database file.
+        :param args: If given, the commandline params are stored with the run.
+        """
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(_SCHEMA)
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(versions)")]
+        if 'placement' not in columns:
+            # stores written before versions could be pinned (see Affinity)
+            self.db.execute("ALTER TABLE versions ADD COLUMN placement TEXT")
+        if 'status' not in columns:
+            # stores written before versions could be stopped (see Watchdog)
+            self.db.execute("ALTER TABLE versions ADD COLUMN status TEXT")
+        params = json.dumps(dict([(k, unicode(v)) for k, v in vars(args).iteritems()])) if args else None
+        with self.db:
+            self.run = self.db.execute("INSERT INTO runs (started, host, args) VALUES (?, ?, ?)",
+                                       (time.time(), socket.gethostname(), params)).lastrowid
+        self.position = 0
+        self.benchmarks = {}
+
+    def results_received(self, project, version, sha, results):
+        if not results.benchmarks and not results.status:
+            return
+        with self.db:
+            placements = sorted(set([b.placement for b in results.benchmarks if b.placement]))
+            version_id = self.db.execute(
+                "INSERT INTO versions (run, position, project, version, sha, placement, status) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.run, self.position, unicode(project), unicode(version), unicode(sha),
+                 '; '.join(placements) or None, results.status)).lastrowid
+            self.position += 1
+            for b in results.benchmarks:
+                benchmark_id = self._benchmark_id(b.benchmark, b.parameter, b.score_unit or '')
+                self.db.executemany("INSERT INTO samples (version, benchmark, seq, value) VALUES (?, ?, ?, ?)",
+                                    [(version_id, benchmark_id, i, v) for i, v in enumerate(b.individual_results)])
+
+    def close(self):
+        self.db.close()
+
+    def _benchmark_id(self, name, parameter, unit):
+        key = (name, parameter, unit)
+        if key not in self.benchmarks:
+            self.db.execute("INSERT OR IGNORE INTO benchmarks (name, parameter, unit) VALUES (?, ?, ?)", key)
+            self.benchmarks[key] = self.db.execute(
+                "SELECT id FROM benchmarks WHERE name = ? AND parameter = ? AND unit = ?", key).fetchone()[0]
+        return self.benchmarks[key]
+
+
+class StoreQuery:
+    """ StoreQuery answers questions about the history of a benchmark from a store written by SQLiteStore.
+    """
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+
+    def runs(self):
+        """ runs returns all runs as list of (id, started, host, number of versions).
+        """
+        return self.db.execute("SELECT r.id, r.started, r.host, COUNT(v.id) FROM runs r "
+                               "LEFT JOIN versions v ON v.run = r.id GROUP BY r.id ORDER BY r.id").fetchall()
+
+    def benchmarks(self, name):
+        """ benchmarks returns the benchmarks (id, name, parameter, unit) with the given name, or, if there are none,
+        the ones whose name ends with it (e.g. the simple class and method name).
+        """
+        rows = self.db.execute("SELECT id, name, parameter, unit FROM benchmarks WHERE name = ?", (name,)).fetchall()
+        if not rows:
+            rows = self.db.execute("SELECT id, name, parameter, unit FROM benchmarks WHERE name LIKE ? ESCAPE '\\'",
+                                   ('%.' + name.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_'),
+                                    )).fetchall()
+        return rows
+
+    def latest_run(self, benchmark_id):
+        """ latest_run returns the most recent run with samples of the benchmark.
+        """
+        row = self.db.execute("SELECT MAX(v.run) FROM samples s JOIN versions v ON v.id = s.version "
+                              "WHERE s.benchmark = ?", (benchmark_id,)).fetchone()
+        return row[0] if row else None
+
+    def series(self, benchmark_id, run):
+        """ series returns the values of a benchmark per version of a run, in the order the versions were walked.
+        :return a list of (version, sha, list of values):
+        """
+        series = []
+        rows = self.db.execute("SELECT v.id, v.version, v.sha, s.value FROM samples s "
+                               "JOIN versions v ON v.id = s.version WHERE s.benchmark = ? AND v.run = ? "
+                               "ORDER BY v.position, s.seq", (benchmark_id, run))
+        last = None
+        for version_id, version, sha, value in rows:
+            if version_id != last:
+                series.append((version, sha, []))
+                last = version_id
+            series[-1][2].append(value)
+        return series
+
+    def close(self):
+        self.db.close()
+
+
+def diffs(series):
+    """ diffs compares the values of every version of a series (see StoreQuery.series) with the previous version.
+    :return a list of (version, sha, change of the median in percent, p-value of the Mann-Whitney U test); the first
+    version has neither:
+    """
+    ret = []
+    previous = None
+    for version, sha, values in series:
+        change = p = None
+        if previous:
+            before = stats.median(previous)
+            if before:
+                change = (stats.median(values) - before) / abs(before) * 100
+            p = stats.mann_whitney_u(previous, values) if len(previous) > 1 and len(values) > 1 else None
+        ret.append((version, sha, change, p))
+        previous = values
+    return ret
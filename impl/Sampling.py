@@ -0,0 +1,118 @@
+import impl.Statistics as stats
+
+# the reasons why sampling a test or benchmark stopped (Benchmark.stop_reason)
+TARGET = 'target'
+MAX = 'max'
+NO_VALUES = 'no-values'
+
+
+class StopRule:
+    """ StopRule decides when a test or benchmark was repeated often enough: as soon as the confidence interval of its
+    mean is narrow enough (an absolute width, or a half width relative to the mean), but not before a minimum and not
+    after a maximum number of repetitions.
+    """
+
+    def __init__(self, min_execs=3, max_execs=30, confidence=0.95, rel_error=None, ci_width=None):
+        """
+        :param min_execs: the minimum number of repetitions
+        :param max_execs: the maximum number of repetitions
+        :param confidence: the confidence level of the confidence interval
+        :param rel_error: the target half width of the confidence interval, relative to the mean (e.g. 0.02 for 2%).
+        Defaults to 0.05 if no ci_width is given either.
+        :param ci_width: the target (absolute) width of the confidence interval
+        """
+        self.min_execs = max(1, min_execs)
+        self.max_execs = max(self.min_execs, max_execs)
+        self.confidence = confidence
+        self.rel_error = rel_error
+        self.ci_width = ci_width
+        if rel_error is None and ci_width is None:
+            self.rel_error = 0.05
+
+    @staticmethod
+    def from_config(sampling):
+        """ from_config creates the rule configured in the project config (ProjectConfig.sampling), if any. An empty
+        configuration (a sampling element without children) creates the rule with its defaults.
+        """
+        if sampling is None:
+            return None
+        return StopRule(**sampling)
+
+    def stop_reason(self, values, repetitions):
+        """ stop_reason decides whether to stop after the given number of repetitions, which produced the given values.
+        :return the reason to stop (TARGET, MAX or NO_VALUES), or None to continue:
+        """
+        if repetitions < self.min_execs:
+            return None
+        if not values:
+            # every execution failed or was skipped
+            return NO_VALUES
+        if len(values) >= 2 and self._target_met(values):
+            return TARGET
+        if repetitions >= self.max_execs:
+            return MAX
+        return None
+
+    def _target_met(self, values):
+        half_width = stats.ci_half_width(values, self.confidence)
+        if self.ci_width is not None and 2 * half_width <= self.ci_width:
+            return True
+        if self.rel_error is not None:
+            m = abs(stats.mean(values))
+            return half_width == 0 or (m > 0 and half_width / m <= self.rel_error)
+        return False
+
+    def __str__(self):
+        return "min %s, max %s, confidence %s, relative error %s, ci width %s" % (
+            self.min_execs, self.max_execs, self.confidence, self.rel_error, self.ci_width)
+
+
+class Sampler:
+    """ Sampler collects the results of repeated executions of tests or benchmarks, and decides after every repetition
+    (see StopRule) which of them need more values. Results of tests that already stopped are discarded, so every
+    test ends up with the values up to its own stopping point.
+    """
+
+    def __init__(self, rule):
+        self.rule = rule
+        # (benchmark, parameter) -> merged result, and the number of repetitions it appeared in
+        self.results = {}
+        self.repetitions = {}
+        self.runs = 0
+
+    def add(self, benchmarks):
+        """ add adds the results of one repetition and decides which tests stop.
+        """
+        self.runs += 1
+        for b in benchmarks:
+            key = (b.benchmark, b.parameter)
+            res = self.results.get(key)
+            if res is None:
+                self.results[key] = b
+            elif res.stop_reason:
+                continue
+            else:
+                res.merge(b)
+            self.repetitions[key] = self.repetitions.get(key, 0) + 1
+        for key, res in self.results.iteritems():
+            if not res.stop_reason:
+                res.stop_reason = self.rule.stop_reason(res.individual_results, self.repetitions[key])
+
+    def pending(self):
+        """ pending returns the keys (benchmark, parameter) of the tests that need more values.
+        """
+        return [key for key, res in self.results.iteritems() if not res.stop_reason]
+
+    def done(self):
+        """ done returns whether no further repetition is needed, either because all tests stopped, or because the
+        maximum number of repetitions was executed (e.g. if tests did not produce results in every repetition).
+        """
+        return not self.pending() or self.runs >= self.rule.max_execs
+
+    def benchmarks(self):
+        """ benchmarks returns the collected results. Tests that did not stop yet are marked as stopped at MAX.
+        """
+        for res in self.results.itervalues():
+            if not res.stop_reason:
+                res.stop_reason = MAX
+        return self.results.values()
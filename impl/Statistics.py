@@ -0,0 +1,124 @@
+import math
+
+
+def mean(values):
+    return sum(values) / float(len(values))
+
+
+def median(values):
+    s = sorted(values)
+    n = len(s)
+    if n % 2 == 1:
+        return s[n // 2]
+    return (s[n // 2 - 1] + s[n // 2]) / 2.0
+
+
+def stdev(values):
+    """ stdev returns the sample standard deviation, or 0.0 for less than two values.
+    """
+    n = len(values)
+    if n < 2:
+        return 0.0
+    m = mean(values)
+    return math.sqrt(sum([(v - m) ** 2 for v in values]) / (n - 1))
+
+
+def summary(values):
+    """ summary returns the usual descriptive statistics of the given values as a dictionary.
+    """
+    return {'n': len(values), 'mean': mean(values), 'median': median(values), 'stdev': stdev(values),
+            'min': min(values), 'max': max(values)}
+
+
+def mann_whitney_u(xs, ys):
+    """ mann_whitney_u performs a two-sided Mann-Whitney U test, using the normal approximation with tie correction.
+    The approximation is reasonable for samples of 8 or more values each.
+    :return the two-sided p-value:
+    """
+    n1 = len(xs)
+    n2 = len(ys)
+    ranked = sorted([(v, 0) for v in xs] + [(v, 1) for v in ys])
+    ranks = [0.0] * len(ranked)
+    ties = 0.0
+    i = 0
+    while i < len(ranked):
+        j = i
+        while j + 1 < len(ranked) and ranked[j + 1][0] == ranked[i][0]:
+            j += 1
+        # tied values get the average of their ranks
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2.0 + 1
+        t = j - i + 1
+        ties += t ** 3 - t
+        i = j + 1
+    r1 = sum([ranks[k] for k in range(len(ranked)) if ranked[k][1] == 0])
+    u1 = r1 - n1 * (n1 + 1) / 2.0
+    n = n1 + n2
+    mu = n1 * n2 / 2.0
+    sigma = math.sqrt(n1 * n2 / 12.0 * ((n + 1) - ties / (n * (n - 1))))
+    if sigma == 0:
+        return 1.0
+    z = (abs(u1 - mu) - 0.5) / sigma
+    return min(1.0, math.erfc(max(z, 0.0) / math.sqrt(2)))
+
+
+def normal_quantile(p):
+    """ normal_quantile returns the p-quantile of the standard normal distribution (Acklam's rational approximation,
+    with a relative error below 1.2e-9).
+    """
+    if p <= 0.0 or p >= 1.0:
+        raise ValueError("p must be in (0, 1): %s" % p)
+    if p < _P_LOW:
+        q = math.sqrt(-2 * math.log(p))
+        return _tail(q)
+    if p > 1 - _P_LOW:
+        q = math.sqrt(-2 * math.log(1 - p))
+        return -_tail(q)
+    q = p - 0.5
+    r = q * q
+    a = _A
+    b = _B
+    return (((((a[0] * r + a[1]) * r + a[2]) * r + a[3]) * r + a[4]) * r + a[5]) * q / \
+           (((((b[0] * r + b[1]) * r + b[2]) * r + b[3]) * r + b[4]) * r + 1)
+
+
+_A = (-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02, 1.383577518672690e+02,
+      -3.066479806614716e+01, 2.506628277459239e+00)
+_B = (-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02, 6.680131188771972e+01,
+      -1.328068155288572e+01)
+_C = (-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00, -2.549732539343734e+00,
+      4.374664141464968e+00, 2.938163982698783e+00)
+_D = (7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00, 3.754408661907416e+00)
+_P_LOW = 0.02425
+
+
+def _tail(q):
+    c = _C
+    d = _D
+    return (((((c[0] * q + c[1]) * q + c[2]) * q + c[3]) * q + c[4]) * q + c[5]) / \
+           ((((d[0] * q + d[1]) * q + d[2]) * q + d[3]) * q + 1)
+
+
+def t_quantile(p, df):
+    """ t_quantile returns the p-quantile of Student's t-distribution with df degrees of freedom. It is exact for
+    1 and 2 degrees of freedom, and uses the Cornish-Fisher expansion otherwise (within 1% for df >= 3, and more
+    accurate the more degrees of freedom).
+    """
+    if df == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if df == 2:
+        return (2 * p - 1) / math.sqrt(2 * p * (1 - p))
+    z = normal_quantile(p)
+    g1 = (z ** 3 + z) / 4.0
+    g2 = (5 * z ** 5 + 16 * z ** 3 + 3 * z) / 96.0
+    g3 = (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / 384.0
+    g4 = (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / 92160.0
+    return z + g1 / df + g2 / df ** 2 + g3 / df ** 3 + g4 / df ** 4
+
+
+def ci_half_width(values, confidence=0.95):
+    """ ci_half_width returns the half width of the confidence interval of the mean of the given values (at least two),
+    based on Student's t-distribution.
+    """
+    n = len(values)
+    return t_quantile((1 + confidence) / 2.0, n - 1) * stdev(values) / math.sqrt(n)
@@ -0,0 +1,248 @@
+""" The watchdog executes the external commands of a walk (builds, benchmark and test runs) within limits: a wall-clock
+timeout per phase (fixed, or derived from the median duration of the same command in previous versions), a memory
+limit (resident memory of all processes of the command), and a cap on the output. A command that exceeds a limit is
+killed with its whole process group, and Expired is raised, which the runners turn into a result with a failure status
+(see result.Version.status), so that the walk continues with the next version.
+
+Limits are configured once for the walk (see configure); without limits, commands are executed like subprocess.call.
+"""
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import api.result as result
+import api.tracing as tracing
+import impl.Statistics as stats
+
+# the failure statuses of a version
+TIMEOUT = 'timeout'
+MEMORY = 'memory-limit'
+OUTPUT = 'output-limit'
+
+
+class Expired(Exception):
+    """ Expired is raised when a command was killed because it exceeded a limit.
+    """
+
+    def __init__(self, status, phase, cmd, limit):
+        Exception.__init__(self, "%s exceeded the %s (%s) in phase %s" % (os.path.basename(cmd[0]), status, limit,
+                                                                          phase))
+        self.status = status
+        self.phase = phase
+
+    def result(self, version, sha):
+        """ result returns the result of a version whose execution was stopped by this expiry.
+        """
+        print "### %s for version %s: %s ###" % (self.status, version, self)
+        version_result = result.Version(version, sha)
+        version_result.status = self.status
+        return version_result
+
+
+class Limits:
+    """ The limits of the commands of a walk.
+    """
+
+    # the minimum number of previous durations of a command before its timeout is derived from them
+    MIN_HISTORY = 3
+    # derived timeouts are never shorter than this many seconds, so that short commands are not killed for jitter
+    MIN_BUDGET = 60
+
+    def __init__(self, timeouts=None, budget_factor=None, memory=None, output=None):
+        """
+        :param timeouts: a dictionary phase (tracing.BUILD or tracing.RUN) -> timeout in seconds
+        :param budget_factor: if given, a command times out after budget_factor times the median duration of the same
+        command (the same arguments, or the same label, see call) in the same phase in previous versions, or after the
+        fixed timeout, if that is shorter
+        :param memory: the maximum resident memory of a command (all processes of its process group) in bytes
+        :param output: the maximum number of bytes a command may write to stdout and stderr
+        """
+        self.timeouts = timeouts or {}
+        self.budget_factor = budget_factor
+        self.memory = memory
+        self.output = output
+        self.lock = threading.Lock()
+        # (phase, command arguments or label) -> durations in seconds
+        self.history = {}
+
+    def timeout(self, phase, key):
+        """ timeout returns the timeout in seconds of a command, or None if it has none.
+        """
+        timeout = self.timeouts.get(phase)
+        with self.lock:
+            durations = list(self.history.get(key, []))
+        if self.budget_factor and len(durations) >= Limits.MIN_HISTORY:
+            budget = max(Limits.MIN_BUDGET, self.budget_factor * stats.median(durations))
+            timeout = min(timeout, budget) if timeout else budget
+        return timeout
+
+    def completed(self, key, duration):
+        with self.lock:
+            self.history.setdefault(key, []).append(duration)
+
+    def __nonzero__(self):
+        return bool(self.timeouts or self.budget_factor or self.memory or self.output)
+
+
+_limits = Limits()
+# how often (in seconds) running commands are checked
+_POLL_INTERVAL = 0.5
+# how long a command has to exit after SIGTERM, before it is killed
+_GRACE_PERIOD = 5
+
+
+def configure(limits):
+    """ configure sets the limits of all commands executed from now on.
+    """
+    global _limits
+    _limits = limits
+
+
+def call(cmd, cwd=None, phase=tracing.RUN, started=None, log=None, label=None):
+    """ call executes a command within the limits, like subprocess.call.
+    :param phase: the phase the command belongs to, which determines its timeout
+    :param started: a function that is invoked with the subprocess.Popen of the command right after it was started
+    :param log: a file the output (stdout and stderr) of the command is copied to, optional
+    :param label: identifies the command in the durations its timeout is derived from, instead of its arguments, e.g.
+    because they contain paths that differ for every version
+    :return the exit code of the command:
+    """
+    return _execute(cmd, cwd, phase, False, started, log, label)[0]
+
+
+def check_output(cmd, cwd=None, phase=tracing.RUN, label=None):
+    """ check_output executes a command within the limits, like subprocess.check_output (stderr is included).
+    :return the output of the command:
+    """
+    code, output = _execute(cmd, cwd, phase, True, None, None, label)
+    if code:
+        raise subprocess.CalledProcessError(code, cmd, output)
+    return output
+
+
+def _execute(cmd, cwd, phase, capture, started, log, label):
+    limits = _limits
+    if not limits and not capture and not started and not log:
+        return subprocess.call(cmd, cwd=cwd), None
+    key = (phase, label if label is not None else tuple(cmd))
+    timeout = limits.timeout(phase, key)
+    pipe = capture or log or limits.output
+    # the command gets its own process group, so that it can be killed (or suspended) with all of its children
+    process = subprocess.Popen(cmd, cwd=cwd, preexec_fn=os.setpgrp, stdout=subprocess.PIPE if pipe else None,
+                               stderr=subprocess.STDOUT if pipe else None)
+    start = time.time()
+    if started:
+        started(process)
+    reader = None
+    if pipe:
+        reader = _OutputReader(process.stdout, limits.output, capture, log)
+        reader.start()
+    expired = None
+    try:
+        last_memory_check = 0
+        while process.poll() is None:
+            time.sleep(_POLL_INTERVAL)
+            if timeout and time.time() - start - _suspended(process) > timeout:
+                expired = Expired(TIMEOUT, phase, cmd, "%ss" % int(timeout))
+            elif reader and reader.exceeded:
+                expired = Expired(OUTPUT, phase, cmd, "%s bytes" % limits.output)
+            elif limits.memory and time.time() - last_memory_check >= 1:
+                last_memory_check = time.time()
+                if _group_rss(process.pid) > limits.memory:
+                    expired = Expired(MEMORY, phase, cmd, "%s MB" % (limits.memory // (1024 * 1024)))
+            if expired:
+                _kill(process)
+                break
+    except BaseException:
+        # e.g. Ctrl-C, which does not reach the process group of the command
+        _kill(process)
+        raise
+    finally:
+        if reader:
+            reader.join()
+    if expired:
+        raise expired
+    limits.completed(key, time.time() - start - _suspended(process))
+    return process.returncode, ''.join(reader.output) if reader and capture else None
+
+
+def _suspended(process):
+    """ _suspended returns the number of seconds a process was suspended by a BuildGuard, which do not count as its
+    run time.
+    """
+    stopped_at = getattr(process, 'stopped_at', None)
+    return getattr(process, 'suspended', 0.0) + (time.time() - stopped_at if stopped_at else 0.0)
+
+
+def _kill(process):
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(process.pid, sig)
+            # a suspended process group only handles SIGTERM once it continues
+            os.killpg(process.pid, signal.SIGCONT)
+        except OSError:
+            return
+        deadline = time.time() + _GRACE_PERIOD
+        while process.poll() is None and time.time() < deadline:
+            time.sleep(0.1)
+        if process.poll() is not None:
+            return
+
+
+def _group_rss(pgid):
+    """ _group_rss returns the resident memory in bytes of all processes in the process group (0 without /proc).
+    """
+    total = 0
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    for pid in os.listdir('/proc') if os.path.isdir('/proc') else []:
+        if not pid.isdigit():
+            continue
+        try:
+            with open('/proc/%s/stat' % pid) as f:
+                # the fields after the command name (which may contain spaces) in parentheses
+                fields = f.read().rpartition(')')[2].split()
+        except IOError:
+            continue
+        if int(fields[2]) == pgid:
+            total += int(fields[21]) * page_size
+    return total
+
+
+class _OutputReader(threading.Thread):
+    """ _OutputReader forwards the output of a command to stdout (and keeps it, if capture is set), and copies it to the
+    log (if any), until the output exceeds limit bytes.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, stream, limit, capture, log=None):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.stream = stream
+        self.limit = limit
+        self.capture = capture
+        self.log = log
+        self.output = []
+        self.size = 0
+        self.exceeded = False
+
+    def run(self):
+        while True:
+            chunk = os.read(self.stream.fileno(), _OutputReader.CHUNK_SIZE)
+            if not chunk:
+                return
+            self.size += len(chunk)
+            if self.limit and self.size > self.limit:
+                self.exceeded = True
+                # keep draining, so that the command does not block before it is killed
+                continue
+            if self.log:
+                self.log.write(chunk)
+            if self.capture:
+                self.output.append(chunk)
+            else:
+                sys.stdout.write(chunk)
+                sys.stdout.flush()
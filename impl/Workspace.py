@@ -0,0 +1,82 @@
+import copy
+import os
+import shutil
+
+from impl.GitRepoHandler import GitRepoHandler
+
+
+class Workspace:
+    """ A Workspace is the private working area of a single worker of a parallel walk. It consists of a git worktree
+    of the project, a private copy of the JMH root (if the JMH root does not live inside the project anyway) and a
+    private Maven local repository. Workers can therefore check out, build and install different versions at the same
+    time without seeing each other's files or artifacts.
+
+    The Maven local repository is kept after the walk, so that subsequent walks do not have to download the
+    dependencies again. Worktree and JMH copy are removed.
+    """
+
+    WORKTREE_DIR = "worktree"
+    JMH_DIR = "jmh"
+    MVN_REPO_DIR = "m2"
+
+    def __init__(self, config, base_dir, name):
+        """ Prepare a workspace for the given config below base_dir/name. Nothing is created on disk before create
+        is called.
+
+        :param config: The parsed config of the walk. It is not modified, the workspace works on a copy.
+        :param base_dir: The directory in which all workspaces of a walk live.
+        :param name: A name unique to this workspace, e.g. 'worker-1'.
+        """
+        self.origin_config = config
+        self.dir = os.path.join(os.path.abspath(os.path.expanduser(base_dir)), name)
+        self.worktree = os.path.join(self.dir, Workspace.WORKTREE_DIR)
+        self.config = self._rebase_config(config)
+
+    def create(self):
+        if not os.path.isdir(self.dir):
+            os.makedirs(self.dir)
+        GitRepoHandler(self.origin_config.project.dir).add_worktree(self.worktree)
+        jmh_root = _expand(self.origin_config.project.jmh_root)
+        if self.config.project.jmh_root != jmh_root and os.path.isdir(jmh_root):
+            shutil.rmtree(self.config.project.jmh_root, ignore_errors=True)
+            shutil.copytree(jmh_root, self.config.project.jmh_root, ignore=shutil.ignore_patterns('target'))
+        if not os.path.isdir(self.config.project.mvn_repo):
+            os.makedirs(self.config.project.mvn_repo)
+        return self
+
+    def remove(self):
+        GitRepoHandler(self.origin_config.project.dir).remove_worktree(self.worktree)
+        shutil.rmtree(os.path.join(self.dir, Workspace.JMH_DIR), ignore_errors=True)
+
+    def _rebase_config(self, config):
+        """ _rebase_config returns a copy of config with all project paths pointing into this workspace.
+        :return the rebased config:
+        """
+        project_dir = _expand(config.project.dir)
+        ret = copy.copy(config)
+        ret.project = copy.copy(config.project)
+        ret.project.dir = self.worktree
+        ret.project.mvn_repo = os.path.join(self.dir, Workspace.MVN_REPO_DIR)
+        jmh_root = _expand(config.project.jmh_root)
+        if _is_below(jmh_root, project_dir):
+            ret.project.jmh_root = _rebase(jmh_root, project_dir, self.worktree)
+        else:
+            ret.project.jmh_root = os.path.join(self.dir, Workspace.JMH_DIR)
+        if hasattr(config.project, 'junit'):
+            ret.project.junit = dict(config.project.junit)
+            junit_dir = _expand(config.project.junit['dir'])
+            if _is_below(junit_dir, project_dir):
+                ret.project.junit['dir'] = _rebase(junit_dir, project_dir, self.worktree)
+        return ret
+
+
+def _expand(path):
+    return os.path.abspath(os.path.expanduser(path))
+
+
+def _is_below(path, root):
+    return path == root or path.startswith(root.rstrip('/') + '/')
+
+
+def _rebase(path, old_root, new_root):
+    return os.path.join(new_root, os.path.relpath(path, old_root))